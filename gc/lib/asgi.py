@@ -0,0 +1,148 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import io
+import sys
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+class WsgiToAsgi(object):
+    """
+    Serves a WSGI app over ASGI.
+
+    Request bodies are received and responses are sent on the event loop, only the WSGI call itself
+    runs in a thread pool of `max_workers` threads. Slow clients and idle keep-alive connections then
+    cost a coroutine instead of a worker thread, while blocking SQLite work stays on the bounded pool
+    (and the number of per-thread reader connections with it).
+
+    asgiref.wsgi.WsgiToAsgi is not used: it runs the app through sync_to_async with thread_sensitive
+    left on, which puts every request on one shared thread, and it has no limit on request bodies.
+    """
+
+    def __init__(self, wsgi_app, max_workers, max_body_bytes):
+        self.wsgi_app = wsgi_app
+        self.max_body_bytes = max_body_bytes
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="wsgi")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            raise ValueError(f"Unsupported ASGI scope type {scope['type']}")
+
+        try:
+            body = await read_body(receive, self.max_body_bytes)
+        except ClientDisconnected:
+            # Nobody to answer, and the app must not see a truncated request
+            return
+        if body is None:
+            await send_response(send, 413, [(b"content-type", b"text/plain")], [b"Request body too large"])
+            return
+        environ = build_environ(scope, body)
+        loop = asyncio.get_running_loop()
+        status, headers, chunks = await loop.run_in_executor(self.executor, self.call_app, environ)
+        await send_response(send, status, headers, chunks)
+
+    # Runs in the pool. Returns (status, headers, list of body chunks)
+    def call_app(self, environ):
+        response = []
+        chunks = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info is not None and response:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response[:] = [
+                int(status.split(" ", 1)[0]),
+                [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+            ]
+            return chunks.append
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in result:
+                if chunk:
+                    chunks.append(chunk)
+        finally:
+            close = getattr(result, "close", None)
+            if close is not None:
+                close()
+        return response[0], response[1], chunks
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+# Returns the request body, or None if it is larger than `max_body_bytes`.
+# Raises ClientDisconnected if the client goes away before the body is complete.
+async def read_body(receive, max_body_bytes):
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ClientDisconnected()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > max_body_bytes:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+async def send_response(send, status, headers, chunks):
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    for chunk in chunks:
+        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+# WSGI environ as in PEP 3333, strings carry bytes decoded as latin-1
+def build_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1] if server[1] is not None else 80),
+        "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    client = scope.get("client")
+    if client:
+        environ["REMOTE_ADDR"] = client[0]
+        environ["REMOTE_PORT"] = str(client[1])
+    for raw_name, raw_value in scope.get("headers", []):
+        name = raw_name.decode("latin-1").upper().replace("-", "_")
+        value = raw_value.decode("latin-1")
+        if name == "CONTENT_TYPE" or name == "CONTENT_LENGTH":
+            key = name
+        else:
+            key = "HTTP_" + name
+        if key in environ:
+            # Repeated headers are joined as in a single header
+            environ[key] = environ[key] + "," + value
+        else:
+            environ[key] = value
+    if "CONTENT_LENGTH" not in environ:
+        environ["CONTENT_LENGTH"] = str(len(body))
+    return environ
@@ -0,0 +1,9 @@
+from .asgi import WsgiToAsgi
+from .gcapp import app as wsgi_app, init_gc_app
+
+# Threads running Flask handlers, each holds its own read-only SQLite connection
+ASGI_WORKERS = 16
+MAX_REQUEST_BODY_BYTES = 1024 * 1024
+
+init_gc_app()
+app = WsgiToAsgi(wsgi_app, ASGI_WORKERS, MAX_REQUEST_BODY_BYTES)
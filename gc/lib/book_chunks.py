@@ -0,0 +1,29 @@
+from bisect import bisect_left
+
+from lib.cache import estimate_size
+
+
+class BookChunks(object):
+    """
+    All chunks of one book sorted by chunk_id, ranges are sliced from memory.
+    Chunk IDs may have gaps, a range starts at the first chunk with chunk_id >= offset.
+    """
+
+    def __init__(self, chunks):
+        # dicts with at least chunk_id, sorted by chunk_id
+        self.chunks = chunks
+        self.chunk_ids = [chunk["chunk_id"] for chunk in chunks]
+        self.size = estimate_size(self.chunks) + estimate_size(self.chunk_ids)
+
+    # Lets the response cache account for the whole book
+    def __sizeof__(self):
+        return self.size
+
+    # Returns (up to `count` chunks starting at `offset`, offset of the next range or None at the end)
+    def range(self, offset, count):
+        start = bisect_left(self.chunk_ids, offset)
+        end = start + count
+        next_offset = None
+        if end < len(self.chunks):
+            next_offset = self.chunk_ids[end]
+        return self.chunks[start:end], next_offset
@@ -0,0 +1,130 @@
+from collections import OrderedDict
+from dataclasses import fields, is_dataclass
+import logging
+import sys
+import threading
+import time
+
+
+# Rough size of a value in bytes, used to enforce the memory cap
+def estimate_size(value):
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    if is_dataclass(value):
+        return sys.getsizeof(value) + sum(estimate_size(getattr(value, f.name)) for f in fields(value))
+    return sys.getsizeof(value)
+
+
+class CacheEntry(object):
+
+    def __init__(self, value, expiration, size, tags):
+        self.value = value
+        self.expiration = expiration
+        self.size = size
+        self.tags = tags
+
+
+class ResponseCache(object):
+    """
+    Thread-safe LRU cache with per-entry TTL, a cap on entries and on estimated bytes.
+
+    Entries carry tags, write paths drop everything under a tag with `invalidate`.
+    To avoid caching a value that was read before a concurrent invalidation,
+    take `begin()` before loading and pass it to `put()`.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        # tag -> set of keys
+        self.tag_keys = dict()
+        self.total_bytes = 0
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    # Returns a cached value or None
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expiration < now:
+                self.remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def begin(self):
+        with self.lock:
+            return self.generation
+
+    def put(self, key, value, ttl, tags, generation):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            logging.info("ResponseCache: value of %d bytes for %s is too large", size, str(key))
+            return
+        with self.lock:
+            if generation != self.generation:
+                # Something was invalidated while the value was being loaded
+                return
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = CacheEntry(value, time.time() + ttl, size, tags)
+            self.total_bytes += size
+            for tag in tags:
+                keys = self.tag_keys.get(tag)
+                if keys is None:
+                    self.tag_keys[tag] = {key}
+                else:
+                    keys.add(key)
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self.remove(oldest)
+                self.evictions += 1
+
+    # Must be called with the lock held
+    def remove(self, key):
+        entry = self.entries.pop(key)
+        self.total_bytes -= entry.size
+        for tag in entry.tags:
+            keys = self.tag_keys.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tag_keys[tag]
+
+    def invalidate(self, *tags):
+        with self.lock:
+            self.generation += 1
+            for tag in tags:
+                keys = self.tag_keys.get(tag)
+                if keys is None:
+                    continue
+                for key in list(keys):
+                    self.remove(key)
+                    self.invalidations += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
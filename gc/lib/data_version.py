@@ -0,0 +1,18 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class DataVersion:
+    etag: str
+    last_modified: int # seconds since unix epoch
+
+
+# Combines {table: (version, updated_at)} of the tables a response is built from
+def combine_versions(tables, versions):
+    parts = []
+    last_modified = 0
+    for table in tables:
+        version, updated_at = versions.get(table, (0, 0))
+        parts.append(f"{version}.{updated_at}")
+        last_modified = max(last_modified, updated_at)
+    return DataVersion("-".join(parts), last_modified)
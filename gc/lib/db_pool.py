@@ -0,0 +1,57 @@
+from contextlib import contextmanager
+import logging
+import sqlite3
+import threading
+
+
+class DbPool(object):
+    """
+    One writer connection guarded by `write_lock`, plus one read-only connection per thread.
+    The database is switched to WAL mode, so readers neither block each other nor wait for the writer.
+    """
+
+    def __init__(self, db_path, writer_conn):
+        self.db_path = db_path
+        self.writer_conn = writer_conn
+        self.write_lock = threading.Lock()
+        self.local = threading.local()
+        self.readers_lock = threading.Lock()
+        self.readers = []
+        # In-memory databases are private to a connection, so reads have to go through the writer
+        self.shared_reads = db_path == ":memory:"
+        if not self.shared_reads:
+            mode = writer_conn.execute("PRAGMA journal_mode=WAL;").fetchone()[0]
+            logging.info("DbPool: journal mode for %s is %s", db_path, mode)
+
+    def open_reader(self):
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        with self.readers_lock:
+            self.readers.append(conn)
+            total = len(self.readers)
+        logging.info("DbPool: opened read-only connection #%d for thread %s",
+            total, threading.current_thread().name)
+        return conn
+
+    # Returns a read-only connection owned by the calling thread
+    def reader(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.open_reader()
+            self.local.conn = conn
+        return conn
+
+    @contextmanager
+    def read(self):
+        if self.shared_reads:
+            with self.write_lock:
+                yield self.writer_conn
+        else:
+            yield self.reader()
+
+    def close(self):
+        with self.readers_lock:
+            for conn in self.readers:
+                conn.close()
+            self.readers = []
+        self.writer_conn.close()
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+import threading
 from typing import List
 
 
@@ -18,3 +19,67 @@ class FeedItem:
     translation_id: int
     votes: List[VoteInfo]
     created_at: int
+
+
+class FeedRing(object):
+    """
+    The latest translations with their votes, served instead of querying the feed on every request.
+
+    Seeded with `reset` from the database and kept up to date by `upsert` on write paths.
+    Holds at most `max_items` entries, entries older than `window_secs` are dropped when read.
+    `version` changes with every modification and can be used as an ETag.
+    """
+
+    def __init__(self, window_secs, max_items):
+        self.window_secs = window_secs
+        self.max_items = max_items
+        self.lock = threading.Lock()
+        self.loaded = False
+        # translation_id -> FeedItem
+        self.items = dict()
+        self.version = 0
+        # newest first, None when has to be rebuilt
+        self.ordered = None
+
+    def reset(self, items):
+        with self.lock:
+            self.items = {item.translation_id: item for item in items}
+            self.trim()
+            self.changed()
+            self.loaded = True
+
+    def upsert(self, item):
+        with self.lock:
+            self.items[item.translation_id] = item
+            self.trim()
+            self.changed()
+
+    # Must be called with the lock held
+    def changed(self):
+        self.version += 1
+        self.ordered = None
+
+    # Must be called with the lock held
+    def trim(self):
+        if len(self.items) <= self.max_items:
+            return
+        newest = sorted(self.items.values(), key=feed_item_order, reverse=True)[:self.max_items]
+        self.items = {item.translation_id: item for item in newest}
+
+    # Returns (list of FeedItem, newest first, version)
+    def snapshot(self, now):
+        with self.lock:
+            if self.ordered is None:
+                self.ordered = sorted(self.items.values(), key=feed_item_order, reverse=True)
+            start = now - self.window_secs
+            if self.ordered and self.ordered[-1].created_at < start:
+                for item in self.ordered:
+                    if item.created_at < start:
+                        del self.items[item.translation_id]
+                self.changed()
+                self.ordered = sorted(self.items.values(), key=feed_item_order, reverse=True)
+            return self.ordered, self.version
+
+
+def feed_item_order(item):
+    return (item.created_at, item.translation_id)
@@ -1,5 +1,7 @@
 import argparse
+import base64
 import datetime
+import gzip
 import logging
 from logging.config import dictConfig
 import os
@@ -12,14 +14,26 @@ import threading
 import time
 import uuid
 
-from flask import Flask, jsonify, redirect, request, make_response, send_file
+from flask import Flask, g, jsonify, redirect, request, make_response, send_file
+from flask.json.provider import DefaultJSONProvider
 
 from lib.auth import Auth
+from lib.book_chunks import BookChunks
+from lib.cache import ResponseCache
 from lib.contrib import ContribAction, ContribEntry
-from lib.feed import FeedItem, VoteInfo
+from lib.data_version import combine_versions
+from lib.db_pool import DbPool
+from lib.feed import FeedItem, FeedRing, VoteInfo
+from lib.lexicon import LexiconIndex
+from lib.migrations import migrate
+from lib.metrics import Metrics, TimedLock, instrument_methods
 from lib.pos import parse_pos
+from lib.ranking import ALLTIME_START, contrib_day, count_contribs
 from lib.review import ReviewStatus, ReviewVote
+from lib.serialization import RowLayout, dumps
+from lib.subtitle_index import SubtitleIndex
 from lib.word_info import WordInfo
+from lib.write_coordinator import WriteCoordinator
 
 
 dictConfig({
@@ -46,8 +60,96 @@ CLIP_PAGE_SIZE = 20
 APPROVE_THRESHOLD = 2
 DISAPPROVE_THRESHOLD = 2
 WEEK_SECONDS = 7 * 24 * 60 * 60
+TRANSLATIONS_LIMIT = 100
+CONTRIB_CHUNK_SIZE = 5000
+WORDS_LIMIT = 100
+MAX_BATCH_WORDS = 300
+SUBTITLES_LIMIT = 100
+BOOK_PAGE_MAX_CHUNKS = 500
+# Longer books are read by ranges, a cached copy would push most other responses out of the cache
+BOOK_CACHE_MAX_CHARS = 4 * 1024 * 1024
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+WRITE_GROUP_WINDOW_SECS = 0.002
+WRITE_GROUP_MAX_OPERATIONS = 64
+FEED_WINDOW_SECS = 2 * 24 * 60 * 60
+FEED_LIMIT = 100
+STATS_TABLES = ("translations",)
+RANKING_TABLES = ("ranking_alltime", "ranking_week")
+# Tables that scripts change too, answers kept in memory are checked against them at most every VERSION_CHECK_SECS
+WATCHED_TABLES = ("translations", "subtitles", "book_chunks")
+VERSION_CHECK_SECS = 5.0
+# Set to 0 to serve /get_translation from SQLite instead of an in-process index
+LEXICON_INDEX_ENV = "GC_LEXICON_INDEX"
+RESPONSE_CACHE_MAX_ENTRIES = 20000
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+DICTIONARY_CACHE_TTL_SECS = 600
+CONTENT_CACHE_TTL_SECS = 3600
 app = Flask("gc_app")
 gc_instance = None
+METRICS = Metrics()
+METRICS.describe("gc_request_seconds", "Request handling time by route")
+METRICS.describe("gc_requests_total", "Handled requests by route and status")
+METRICS.describe("gc_db_method_seconds", "Time spent in Gc.do_* methods")
+METRICS.describe("gc_db_method_calls_total", "Calls of Gc.do_* methods")
+METRICS.describe("gc_db_method_rows_total", "Items returned by Gc.do_* methods")
+METRICS.describe("gc_db_lock_wait_seconds", "Time spent waiting for the writer lock")
+METRICS.describe("gc_db_lock_hold_seconds", "Time the writer lock is held")
+METRICS.describe("gc_gzip_seconds", "Time spent compressing response bodies")
+METRICS.describe("gc_write_commits_total", "Group commits of write operations")
+METRICS.describe("gc_write_operations_total", "Write operations committed in groups")
+METRICS.describe("gc_row_mapping_seconds", "Time spent converting fetched rows to response items")
+METRICS.describe("gc_json_dumps_seconds", "Time spent serializing responses")
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            METRICS.observe("gc_json_dumps_seconds", (), time.perf_counter() - started)
+
+
+app.json = TimedJSONProvider(app)
+
+
+# Same as jsonify, but encodes through lib.serialization, which uses orjson when it is installed
+def json_response(payload, code):
+    started = time.perf_counter()
+    body = dumps(payload)
+    METRICS.observe("gc_json_dumps_seconds", (), time.perf_counter() - started)
+    return app.response_class(body, status=code, mimetype="application/json")
+
+
+# Same as json_response, gzip-compressed when the client accepts it and the body is large enough to gain
+def compressed_json_response(payload, code):
+    response = json_response(payload, code)
+    response.vary.add("Accept-Encoding")
+    body = response.get_data()
+    if len(body) < GZIP_MIN_BYTES or "gzip" not in request.accept_encodings:
+        return response
+    started = time.perf_counter()
+    response.set_data(gzip.compress(body, GZIP_LEVEL))
+    METRICS.observe("gc_gzip_seconds", (), time.perf_counter() - started)
+    response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+# Returns a 304 response when the client already has data of `data_version`, None otherwise.
+# Only the ETag is compared: Last-Modified has a resolution of one second, so a write in the same second
+# as an earlier response would still match If-Modified-Since.
+def not_modified(data_version):
+    if not request.if_none_match.contains(data_version.etag):
+        return None
+    return with_data_version(make_response("", 304), data_version)
+
+
+def with_data_version(response, data_version):
+    response.set_etag(data_version.etag)
+    response.last_modified = datetime.datetime.fromtimestamp(data_version.last_modified, datetime.timezone.utc)
+    return response
 
 
 def validate_lang(lang):
@@ -66,6 +168,7 @@ def validate_int(a_request, name, min_val, max_val):
     return val
 
 
+@METRICS.timed("gc_row_mapping_seconds", (("function", "read_words"),))
 def read_words(fetched_results):
     grouped = dict()
     for row in fetched_results:
@@ -106,6 +209,63 @@ def read_words(fetched_results):
     return result
 
 
+# Returns a deduplicated list of words or None if the list is invalid
+def read_batch_words(words):
+    if not isinstance(words, list) or not (0 < len(words) <= MAX_BATCH_WORDS):
+        logging.error("Invalid batch of words")
+        return None
+    result = []
+    seen = set()
+    for word in words:
+        if not isinstance(word, str) or not (0 < len(word) < 64):
+            logging.error("Invalid word in batch: %s", str(word))
+            return None
+        if word not in seen:
+            seen.add(word)
+            result.append(word)
+    return result
+
+
+# Cache tag for entries that depend on a given word, e.g. translations of the word
+def word_tag(lang, word):
+    return f"word:{lang}:{word}"
+
+
+# Opaque pagination cursor built from integer values
+def encode_cursor(*values):
+    raw = ":".join(str(int(value)) for value in values)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+# Returns a tuple of `size` integers or None
+def decode_cursor(cursor, size):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        values = tuple(int(part) for part in raw.split(":"))
+    except ValueError as e:
+        logging.error("decode_cursor: invalid cursor %s: %s", cursor, str(e))
+        return None
+    if len(values) != size:
+        logging.error("decode_cursor: unexpected cursor size %d", len(values))
+        return None
+    return values
+
+
+# Returns a filter, its params and an ORDER BY/LIMIT clause for a page of reviews.
+# `after` is None for offset pagination, or (created_at, review_id) of the last review on the previous page.
+def review_page(offset, count, after):
+    order = "ORDER BY r.created_at DESC, r.review_id DESC"
+    if after is None:
+        return "", (), f"{order} LIMIT {int(offset)},{int(count)}"
+    created_at, review_id = after
+    return (
+        "AND (r.created_at, r.review_id) < (DATETIME(?, 'unixepoch'), ?)",
+        (created_at, review_id),
+        f"{order} LIMIT {int(count)}",
+    )
+
+
 def parse_vote(vote):
     if vote:
         try:
@@ -115,6 +275,7 @@ def parse_vote(vote):
     return None
 
 
+@METRICS.timed("gc_row_mapping_seconds", (("function", "read_translation_vote_range"),))
 def read_translation_vote_range(fetched_results):
     result = []
     prev_tr_id = None
@@ -169,12 +330,16 @@ def read_translation_vote_range(fetched_results):
     return result
 
 
+@METRICS.timed("gc_row_mapping_seconds", (("function", "read_review_disapprove_range"),))
 def read_review_disapprove_range(fetched_results):
     result = []
     for row in fetched_results:
         review_id = row["r_id"]
         assert review_id
         assert isinstance(review_id, int)
+        if row["vote"] is None:
+            # Disapproved review without disapprove votes
+            continue
         try:
             vote = ReviewVote[row["vote"]]
         except KeyError as e:
@@ -203,6 +368,7 @@ def read_review_disapprove_range(fetched_results):
     return result
 
 
+@METRICS.timed("gc_row_mapping_seconds", (("function", "read_ranking_items"),))
 def read_ranking_items(fetched_results):
     result = []
     for row in fetched_results:
@@ -218,13 +384,66 @@ def read_ranking_items(fetched_results):
     return result
 
 
-def extract_string_group(row, key, separator):
-    s = row[key]
+def split_string_group(s, separator):
     if s and len(s):
         return s.split(separator)
     return []
 
 
+def split_group(s):
+    return split_string_group(s, "|")
+
+
+def zero_if_null(value):
+    return value or 0
+
+
+REVIEW_LAYOUT = RowLayout([
+    "review_id",
+    "user_id",
+    "name",
+    "src_word",
+    "src_pos",
+    "src_exc_verb",
+    "src_comment",
+    "src_lang",
+    "dst_word",
+    "dst_pos",
+    "dst_exc_verb",
+    "dst_comment",
+    "dst_lang",
+    "reference",
+    "status",
+    ("approves", "approves", zero_if_null),
+    ("disapproves", "disapproves", zero_if_null),
+    ("own_approves", "own_approves", zero_if_null),
+    ("own_disapproves", "own_disapproves", zero_if_null),
+    ("tr_words", "tr_words", split_group),
+    ("tr_pos", "tr_pos", split_group),
+    ("tr_comment", "tr_comment", split_group),
+    ("created_at", "created_at", int),
+])
+
+TRANSLATION_LAYOUT = RowLayout([
+    "translation_id",
+    ("word", "source_word", None),
+    ("pos", "source_pos", None),
+    ("exc_verb", "source_exc_verb", None),
+    ("comment", "source_comment", None),
+    "translation_word",
+    "translation_pos",
+    "translation_comment",
+])
+
+SUBTITLE_LAYOUT = RowLayout([
+    "start_ms",
+    "end_ms",
+    "content",
+    "words",
+])
+
+
+@METRICS.timed("gc_row_mapping_seconds", (("function", "read_feed_items"),))
 def read_feed_items(fetched_results):
     result = []
     prev_tr_id = None
@@ -287,13 +506,15 @@ class AddReviewVoteResult(object):
 class GcCache(object):
 
     def __init__(self):
+        # (stats, DataVersion the stats were computed at)
         self.stats = None
         self.expiration = None
 
-    def update_stats(self, stats):
-        self.stats = stats
+    def update_stats(self, stats, data_version):
+        self.stats = (stats, data_version)
         self.expiration = time.time() + CACHE_TTL_SECS
 
+    # Returns (stats, DataVersion) or None
     def get_stats(self):
         if self.stats:
             if self.expiration < time.time():
@@ -303,55 +524,105 @@ class GcCache(object):
         return None
 
 
-class UntranslatedCache(object):
-
-    def __init__(self):
-        self.untranslated = None
-        self.expiration = None
-        self.dropped_word_ids = set()
-
-    def drop_item(self, word_id):
-        self.dropped_word_ids.add(word_id)
-        logging.info("Dropped word_id %d from untranslated cache", word_id)
-
-    def do_pick_random(self, count):
-        for it in range(3):
-            offset = random.randint(0, len(self.untranslated) - count)
-            result = []
-            for index in range(offset, offset + count):
-                word_id, word = self.untranslated[index]
-                if word_id in self.dropped_word_ids:
-                    continue
-                result.append(word)
-            if len(result) >= count:
-                break
-        return result
-
+class UntranslatedPool(object):
+    """
+    Kazakh words without a translation into one language.
+    Items live in a list with a word_id -> position map, so adding, removing and picking are O(1).
+    """
+
+    def __init__(self, items):
+        self.lock = threading.Lock()
+        # (word_id, word)
+        self.items = list(items)
+        self.positions = {item[0]: index for index, item in enumerate(self.items)}
+
+    def size(self):
+        return len(self.items)
+
+    def add(self, word_id, word):
+        with self.lock:
+            if word_id in self.positions:
+                return
+            self.positions[word_id] = len(self.items)
+            self.items.append((word_id, word))
+
+    def remove(self, word_id):
+        with self.lock:
+            index = self.positions.pop(word_id, None)
+            if index is None:
+                return
+            last = self.items.pop()
+            if index < len(self.items):
+                self.items[index] = last
+                self.positions[last[0]] = index
+
+    # Returns up to `count` distinct words
     def pick_random(self, count):
-        if self.untranslated:
-            if self.expiration < time.time():
-                self.untranslated = None
-                return None
-            if len(self.untranslated) < count:
-                logging.error("pick_random: not enough items in untranslated cache")
-                return None
-            return self.do_pick_random(count)
-        return None
-
-    def reset(self, untranslated):
-        self.untranslated = untranslated
-        self.expiration = time.time() + CACHE_TTL_SECS
-        self.dropped_word_ids = set()
+        with self.lock:
+            indices = random.sample(range(len(self.items)), min(count, len(self.items)))
+            return [self.items[index][1] for index in indices]
 
 
 class Gc(object):
 
-    def __init__(self, db_conn, auth):
-        self.db_lock = threading.Lock()
-        self.db_conn = db_conn
+    def __init__(self, db_pool, auth, lexicon):
+        self.db_pool = db_pool
+        # Guards the writer connection, read-only paths go through `db_pool.read()` instead
+        self.db_lock = TimedLock(db_pool.write_lock, METRICS, "gc_db_lock")
+        self.db_conn = db_pool.writer_conn
+        # Mutations go through `writes.operation()` instead of taking db_lock and committing on their own
+        self.writes = WriteCoordinator(self.db_conn, self.db_lock, METRICS, WRITE_GROUP_WINDOW_SECS, WRITE_GROUP_MAX_OPERATIONS)
         self.auth = auth
+        # LexiconIndex or None, loaded by the first check of WATCHED_TABLES
+        self.lexicon = lexicon
+        # (version, updated_at) of translations the lexicon reflects
+        self.lexicon_version = None
+        self.lexicon_lock = threading.Lock()
         self.cache = GcCache()
-        self.untranslated_cache = UntranslatedCache()
+        # dst_lang -> UntranslatedPool, built on first request for the language
+        self.untranslated_pools = dict()
+        self.response_cache = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_MAX_BYTES)
+        self.feed_ring = FeedRing(FEED_WINDOW_SECS, FEED_LIMIT)
+        # Changes on restart, so ETags of the feed are never reused by another process
+        self.boot_id = uuid.uuid4().hex[:8]
+        # table -> (version, updated_at) seen by the last get_data_version
+        self.seen_versions = dict()
+        self.seen_versions_lock = threading.Lock()
+        self.next_version_check = 0.0
+
+    # Returns a cached value for the key or the result of `loader()`, which is then cached unless None
+    def cached(self, key, ttl, tags, loader):
+        value = self.response_cache.get(key)
+        if value is not None:
+            return value
+        generation = self.response_cache.begin()
+        value = loader()
+        if value is not None:
+            self.response_cache.put(key, value, ttl, tags, generation)
+        return value
+
+    # Batch version of `cached`: items are looked up one by one under the same keys as single requests,
+    # `loader(missing_items)` fetches the rest at once and returns dict: item -> value
+    def cached_batch(self, items, ttl, make_key, make_tags, loader):
+        result = dict()
+        missing = []
+        for item in items:
+            value = self.response_cache.get(make_key(item))
+            if value is None:
+                missing.append(item)
+            else:
+                result[item] = value
+        if missing:
+            generation = self.response_cache.begin()
+            loaded = loader(missing)
+            for item in missing:
+                value = loaded.get(item, [])
+                self.response_cache.put(make_key(item), value, ttl, make_tags(item), generation)
+                result[item] = value
+        return result
+
+    def get_cache_stats(self):
+        return self.response_cache.stats()
 
     def check_user(self, request_data):
         return self.auth.check_user(request_data, self.db_lock, self.db_conn)
@@ -362,9 +633,10 @@ class Gc(object):
     def get_token(self, request_data):
         return self.auth.get_token(request_data, self.db_lock, self.db_conn)
 
-    def do_get_translations(self, src_lang, dst_lang, both_dirs, word):
-        cursor = self.db_conn.cursor()
+    def do_get_translations(self, conn, src_lang, dst_lang, both_dirs, word):
+        cursor = conn.cursor()
         if both_dirs:
+            # A union of two index lookups: an OR across both joined tables makes SQLite scan all words
             cursor.execute("""
                 SELECT
                     t.translation_id AS translation_id,
@@ -382,11 +654,31 @@ class Gc(object):
                 JOIN
                     words w2 ON t.translated_word_id = w2.word_id
                 WHERE
-                    (w1.word = ? OR w2.word = ?)
+                    w1.word = ?
                     AND w1.lang = ?
                     AND w2.lang = ?
-                LIMIT 100;
-            """, (word, word, src_lang, dst_lang))
+                UNION
+                SELECT
+                    t.translation_id AS translation_id,
+                    w1.word AS source_word,
+                    w1.pos AS source_pos,
+                    w1.exc_verb AS source_exc_verb,
+                    w1.comment AS source_comment,
+                    w2.word AS translation_word,
+                    w2.pos AS translation_pos,
+                    w2.comment AS translation_comment
+                FROM
+                    words w1
+                JOIN
+                    translations t ON w1.word_id = t.word_id
+                JOIN
+                    words w2 ON t.translated_word_id = w2.word_id
+                WHERE
+                    w2.word = ?
+                    AND w1.lang = ?
+                    AND w2.lang = ?
+                LIMIT ?;
+            """, (word, src_lang, dst_lang, word, src_lang, dst_lang, TRANSLATIONS_LIMIT))
         else:
             cursor.execute("""
                 SELECT
@@ -408,30 +700,19 @@ class Gc(object):
                     w1.word = ?
                     AND w1.lang = ?
                     AND w2.lang = ?
-                LIMIT 100;
-            """, (word, src_lang, dst_lang))
+                LIMIT ?;
+            """, (word, src_lang, dst_lang, TRANSLATIONS_LIMIT))
 
         results = cursor.fetchall()
 
-        translations = [
-            {
-                "translation_id": row["translation_id"],
-                "word": row["source_word"],
-                "pos": row["source_pos"],
-                "exc_verb": row["source_exc_verb"],
-                "comment": row["source_comment"],
-                "translation_word": row["translation_word"],
-                "translation_pos": row["translation_pos"],
-                "translation_comment": row["translation_comment"]
-            }
-            for row in results
-        ]
+        translations = TRANSLATION_LAYOUT.to_dicts(results)
 
         return translations
 
-    def do_get_inversed_translations(self, src_lang, dst_lang, both_dirs, word):
-        cursor = self.db_conn.cursor()
+    def do_get_inversed_translations(self, conn, src_lang, dst_lang, both_dirs, word):
+        cursor = conn.cursor()
         if both_dirs:
+            # A union of two index lookups: an OR across both joined tables makes SQLite scan all words
             cursor.execute("""
                 SELECT
                     t.translation_id AS translation_id,
@@ -449,11 +730,31 @@ class Gc(object):
                 JOIN
                     words w2 ON t.word_id = w2.word_id
                 WHERE
-                    (w1.word = ? OR w2.word = ?)
+                    w1.word = ?
                     AND w1.lang = ?
                     AND w2.lang = ?
-                LIMIT 100;
-            """, (word, word, src_lang, dst_lang))
+                UNION
+                SELECT
+                    t.translation_id AS translation_id,
+                    w1.word AS source_word,
+                    w1.pos AS source_pos,
+                    w1.exc_verb AS source_exc_verb,
+                    w1.comment AS source_comment,
+                    w2.word AS translation_word,
+                    w2.pos AS translation_pos,
+                    w2.comment AS translation_comment
+                FROM
+                    words w1
+                JOIN
+                    translations t ON w1.word_id = t.translated_word_id
+                JOIN
+                    words w2 ON t.word_id = w2.word_id
+                WHERE
+                    w2.word = ?
+                    AND w1.lang = ?
+                    AND w2.lang = ?
+                LIMIT ?;
+            """, (word, src_lang, dst_lang, word, src_lang, dst_lang, TRANSLATIONS_LIMIT))
         else:
             cursor.execute("""
                 SELECT
@@ -475,36 +776,105 @@ class Gc(object):
                     w1.word = ?
                     AND w1.lang = ?
                     AND w2.lang = ?
-                LIMIT 100;
-            """, (word, src_lang, dst_lang))
+                LIMIT ?;
+            """, (word, src_lang, dst_lang, TRANSLATIONS_LIMIT))
 
         results = cursor.fetchall()
 
-        translations = [
-            {
-                "translation_id": row["translation_id"],
-                "word": row["source_word"],
-                "pos": row["source_pos"],
-                "exc_verb": row["source_exc_verb"],
-                "comment": row["source_comment"],
-                "translation_word": row["translation_word"],
-                "translation_pos": row["translation_pos"],
-                "translation_comment": row["translation_comment"]
-            }
-            for row in results
-        ]
+        translations = TRANSLATION_LAYOUT.to_dicts(results)
 
         return translations
 
     def get_translations(self, src_lang, dst_lang, both_dirs, word):
-        with self.db_lock:
+        self.check_watched_versions()
+        return self.cached(
+            ("get_translation", src_lang, dst_lang, both_dirs, word),
+            DICTIONARY_CACHE_TTL_SECS,
+            ["translations", word_tag(src_lang, word), word_tag(dst_lang, word)],
+            lambda: self.load_translations(src_lang, dst_lang, both_dirs, word),
+        )
+
+    def load_translations(self, src_lang, dst_lang, both_dirs, word):
+        if self.lexicon:
+            return self.lexicon.lookup(src_lang, dst_lang, both_dirs, word, TRANSLATIONS_LIMIT)
+        with self.db_pool.read() as conn:
             if src_lang == "kk":
-                return self.do_get_translations(src_lang, dst_lang, both_dirs, word)
+                return self.do_get_translations(conn, src_lang, dst_lang, both_dirs, word)
             else:
-                return self.do_get_inversed_translations(src_lang, dst_lang, both_dirs, word)
+                return self.do_get_inversed_translations(conn, src_lang, dst_lang, both_dirs, word)
 
-    def do_get_translation_info(self, translation_id):
-        cursor = self.db_conn.cursor()
+    # Returns dict: word -> translations, same as `do_get_translations` for every word
+    def do_get_translations_batch(self, conn, src_lang, dst_lang, both_dirs, words):
+        # w1 is always the word in src_lang
+        if src_lang == "kk":
+            src_column, dst_column = "t.word_id", "t.translated_word_id"
+        else:
+            src_column, dst_column = "t.translated_word_id", "t.word_id"
+        placeholders = ", ".join(["?"] * len(words))
+        select = f"""
+            SELECT
+                t.translation_id AS translation_id,
+                w1.word AS source_word,
+                w1.pos AS source_pos,
+                w1.exc_verb AS source_exc_verb,
+                w1.comment AS source_comment,
+                w2.word AS translation_word,
+                w2.pos AS translation_pos,
+                w2.comment AS translation_comment
+            FROM
+                words w1
+            JOIN
+                translations t ON w1.word_id = {src_column}
+            JOIN
+                words w2 ON {dst_column} = w2.word_id
+            WHERE
+                {{}}.word IN ({placeholders})
+                AND w1.lang = ?
+                AND w2.lang = ?
+        """
+        params = list(words) + [src_lang, dst_lang]
+        if both_dirs:
+            # Same as in do_get_translations, avoid an OR across both joined tables
+            query = select.format("w1") + "UNION" + select.format("w2")
+            params = params + params
+        else:
+            query = select.format("w1")
+        cursor = conn.cursor()
+        cursor.execute(query + "ORDER BY translation_id;", params)
+
+        result = {word: [] for word in words}
+        for translation in TRANSLATION_LAYOUT.to_dicts(cursor.fetchall()):
+            matched = {translation["word"]}
+            if both_dirs:
+                matched.add(translation["translation_word"])
+            for word in matched:
+                translations = result.get(word)
+                if translations is not None and len(translations) < TRANSLATIONS_LIMIT:
+                    translations.append(translation)
+        cursor.close()
+        return result
+
+    def get_translations_batch(self, src_lang, dst_lang, both_dirs, words):
+        self.check_watched_versions()
+        return self.cached_batch(
+            words,
+            DICTIONARY_CACHE_TTL_SECS,
+            lambda word: ("get_translation", src_lang, dst_lang, both_dirs, word),
+            lambda word: ["translations", word_tag(src_lang, word), word_tag(dst_lang, word)],
+            lambda missing: self.load_translations_batch(src_lang, dst_lang, both_dirs, missing),
+        )
+
+    def load_translations_batch(self, src_lang, dst_lang, both_dirs, words):
+        if self.lexicon:
+            return {
+                word: self.lexicon.lookup(src_lang, dst_lang, both_dirs, word, TRANSLATIONS_LIMIT)
+                for word in words
+            }
+        with self.db_pool.read() as conn:
+            return self.do_get_translations_batch(conn, src_lang, dst_lang, both_dirs, words)
+
+    def do_get_translation_info(self, conn, translation_id):
+        cursor = conn.cursor()
         cursor.execute("""
             SELECT
                 t.translation_id AS translation_id,
@@ -553,11 +923,11 @@ class Gc(object):
         return translations
 
     def get_translation_info(self, translation_id):
-        with self.db_lock:
-            return self.do_get_translation_info(translation_id)
+        with self.db_pool.read() as conn:
+            return self.do_get_translation_info(conn, translation_id)
 
-    def do_get_words(self, word, lang, with_translations):
-        cursor = self.db_conn.cursor()
+    def do_get_words(self, conn, word, lang, with_translations):
+        cursor = conn.cursor()
         if with_translations:
             cursor.execute("""
                 SELECT
@@ -606,8 +976,84 @@ class Gc(object):
         return words
 
     def get_words(self, word, lang, with_translations):
-        with self.db_lock:
-            return self.do_get_words(word, lang, with_translations)
+        return self.cached(
+            ("get_words", word, lang, with_translations),
+            DICTIONARY_CACHE_TTL_SECS,
+            [word_tag(lang, word)],
+            lambda: self.load_words(word, lang, with_translations),
+        )
+
+    def load_words(self, word, lang, with_translations):
+        with self.db_pool.read() as conn:
+            return self.do_get_words(conn, word, lang, with_translations)
+
+    # Returns dict: word -> list of WordInfo, same as `do_get_words` for every word
+    def do_get_words_batch(self, conn, words, lang, with_translations):
+        placeholders = ", ".join(["?"] * len(words))
+        cursor = conn.cursor()
+        if with_translations:
+            cursor.execute(f"""
+                SELECT
+                    w1.word_id AS word_id,
+                    w1.word AS word,
+                    w1.pos AS pos,
+                    w1.exc_verb AS exc_verb,
+                    w1.lang AS lang,
+                    w1.comment AS comment,
+                    strftime('%s', w1.created_at) as created_at_unix_epoch,
+                    t.translated_word_id AS translated_word_id,
+                    r.translated_word_id AS review_word_id,
+                    r.status AS review_status
+                FROM
+                    words w1
+                LEFT JOIN
+                    translations t ON w1.word_id = t.word_id
+                LEFT JOIN
+                    reviews r ON w1.word_id = r.word_id
+                WHERE
+                    w1.word IN ({placeholders})
+                    AND w1.lang = ?;
+            """, list(words) + [lang])
+        else:
+            cursor.execute(f"""
+                SELECT
+                    word_id,
+                    word,
+                    pos,
+                    exc_verb,
+                    lang,
+                    comment,
+                    strftime('%s', created_at) as created_at_unix_epoch
+                FROM words
+                WHERE
+                    word IN ({placeholders})
+                    AND lang = ?
+                ORDER BY word_id;
+            """, list(words) + [lang])
+
+        rows_by_word = {word: [] for word in words}
+        for row in cursor:
+            rows = rows_by_word.get(row["word"])
+            if rows is not None and len(rows) < WORDS_LIMIT:
+                rows.append(row)
+        cursor.close()
+        return {
+            word: read_words(rows)
+            for word, rows in rows_by_word.items()
+        }
+
+    def get_words_batch(self, words, lang, with_translations):
+        return self.cached_batch(
+            words,
+            DICTIONARY_CACHE_TTL_SECS,
+            lambda word: ("get_words", word, lang, with_translations),
+            lambda word: [word_tag(lang, word)],
+            lambda missing: self.load_words_batch(missing, lang, with_translations),
+        )
+
+    def load_words_batch(self, words, lang, with_translations):
+        with self.db_pool.read() as conn:
+            return self.do_get_words_batch(conn, words, lang, with_translations)
 
     def count_words(self, word, pos, exc_verb, lang, comment):
         query = """
@@ -638,12 +1084,19 @@ class Gc(object):
         """
         cursor = self.db_conn.cursor()
         cursor.execute(query, (word, pos, exc_verb, lang, comment, user_id))
-        self.db_conn.commit()
-        return cursor.lastrowid
+        word_id = cursor.lastrowid
+        self.writes.after_commit(lambda: self.word_added(word_id, word, lang))
+        return word_id
+
+    def word_added(self, word_id, word, lang):
+        self.response_cache.invalidate(word_tag(lang, word))
+        if lang == "kk":
+            for pool in list(self.untranslated_pools.values()):
+                pool.add(word_id, word)
 
     # Returns ID of an inserted word or None
     def add_word(self, word, pos, exc_verb, lang, comment, user_id):
-        with self.db_lock:
+        with self.writes.operation():
             return self.do_add_word(word, pos, exc_verb, lang, comment, user_id)
 
     # Returns WordInfo or None
@@ -710,13 +1163,55 @@ class Gc(object):
         """
         cursor = self.db_conn.cursor()
         cursor.execute(query, (src_id, dst_id, reference, user_id))
-        self.db_conn.commit()
-        return InsertionResult(cursor.lastrowid, None)
+        translation_id = cursor.lastrowid
+        self.refresh_translation_group(src_id, dst_word.lang)
+        # Bumped by the insert, tells the lexicon whether anything else changed translations meanwhile
+        version = self.do_get_data_versions(self.db_conn, ("translations",)).get("translations")
+        self.writes.after_commit(lambda: self.translation_added(translation_id, src_word, dst_word, version))
+        return InsertionResult(translation_id, None)
+
+    def translation_added(self, translation_id, src_word, dst_word, version):
+        if self.lexicon:
+            with self.lexicon_lock:
+                self.lexicon.add_translation(translation_id, src_word, dst_word)
+                # Additions of this process follow one another, so they don't force a reload
+                if self.lexicon_version is not None and version is not None and self.lexicon_version[0] + 1 == version[0]:
+                    self.lexicon_version = version
+        self.response_cache.invalidate(
+            word_tag(src_word.lang, src_word.word),
+            word_tag(dst_word.lang, dst_word.word),
+        )
+        self.drop_untranslated(src_word.word_id, dst_word.lang)
+        self.refresh_feed_item(translation_id)
+
+    # Recomputes existing translations of the word into the language, must run in the same transaction
+    def refresh_translation_group(self, word_id, lang):
+        cursor = self.db_conn.cursor()
+        cursor.execute("""
+            INSERT OR REPLACE INTO translation_groups (word_id, lang, word, tr_words, tr_pos, tr_comment)
+            SELECT
+                w3.word_id,
+                w4.lang,
+                w3.word,
+                GROUP_CONCAT(w4.word, "|"),
+                GROUP_CONCAT(w4.pos, "|"),
+                GROUP_CONCAT(w4.comment, "|")
+            FROM
+                words w3
+            JOIN
+                translations t ON w3.word_id = t.word_id
+            JOIN
+                words w4 ON t.translated_word_id = w4.word_id
+            WHERE
+                w3.word_id = ? AND
+                w4.lang = ?
+            GROUP BY w3.word_id, w4.lang;
+        """, (word_id, lang))
+        cursor.close()
 
     # Returns InsertionResult
     def add_translation(self, src_id, dst_id, reference, user_id):
-        self.untranslated_cache.drop_item(src_id)
-        with self.db_lock:
+        with self.writes.operation():
             return self.do_add_translation(src_id, dst_id, reference, user_id)
 
     # Returns InsertionResult
@@ -741,13 +1236,17 @@ class Gc(object):
         """
         cursor = self.db_conn.cursor()
         cursor.execute(query, (src_id, dst_id, reference, user_id, ReviewStatus.NEW.name))
-        self.db_conn.commit()
+        self.writes.after_commit(lambda: self.review_added(src_word, dst_word))
         return InsertionResult(cursor.lastrowid, None)
 
+    def review_added(self, src_word, dst_word):
+        # Pending reviews are listed by /get_words
+        self.response_cache.invalidate(word_tag(src_word.lang, src_word.word))
+        self.drop_untranslated(src_word.word_id, dst_word.lang)
+
     # Returns InsertionResult
     def add_review(self, src_id, dst_id, reference, user_id):
-        self.untranslated_cache.drop_item(src_id)
-        with self.db_lock:
+        with self.writes.operation():
             return self.do_add_review(src_id, dst_id, reference, user_id)
 
     # Returns user ID or None
@@ -793,8 +1292,9 @@ class Gc(object):
 
         return reviews[0]
 
-    def do_get_reviews(self, user_id, approves_min, offset, count):
-        cursor = self.db_conn.cursor()
+    def do_get_reviews(self, conn, user_id, approves_min, offset, count, after=None):
+        page_filter, page_params, page_order = review_page(offset, count, after)
+        cursor = conn.cursor()
         cursor.execute(f"""
             SELECT
                 r.review_id as review_id,
@@ -814,11 +1314,20 @@ class Gc(object):
                 r.status AS status,
                 rv.approves AS approves,
                 rv.disapproves AS disapproves,
-                rv.own_approves AS own_approves,
-                rv.own_disapproves AS own_disapproves,
-                tw.tr_words AS tr_words,
-                tw.tr_pos AS tr_pos,
-                tw.tr_comment AS tr_comment,
+                CASE WHEN own.vote = "APPROVE" THEN 1 ELSE 0 END AS own_approves,
+                CASE WHEN own.vote = "DISAPPROVE" THEN 1 ELSE 0 END AS own_disapproves,
+                (
+                    SELECT GROUP_CONCAT(tw.tr_words, "|") FROM translation_groups tw
+                    WHERE tw.word = w1.word AND tw.lang = w2.lang
+                ) AS tr_words,
+                (
+                    SELECT GROUP_CONCAT(tw.tr_pos, "|") FROM translation_groups tw
+                    WHERE tw.word = w1.word AND tw.lang = w2.lang
+                ) AS tr_pos,
+                (
+                    SELECT GROUP_CONCAT(tw.tr_comment, "|") FROM translation_groups tw
+                    WHERE tw.word = w1.word AND tw.lang = w2.lang
+                ) AS tr_comment,
                 strftime('%s', r.created_at) AS created_at
             FROM
                 reviews r
@@ -828,80 +1337,31 @@ class Gc(object):
                 words w1 ON r.word_id = w1.word_id
             JOIN
                 words w2 ON r.translated_word_id = w2.word_id
-            LEFT JOIN (
-                SELECT
-                    review_id,
-                    COUNT(CASE WHEN vote = "APPROVE" THEN 1 END) AS approves,
-                    COUNT(CASE WHEN vote = "DISAPPROVE" THEN 1 END) AS disapproves,
-                    COUNT(CASE WHEN user_id = ? AND vote = "APPROVE" THEN 1 END) AS own_approves,
-                    COUNT(CASE WHEN user_id = ? AND vote = "DISAPPROVE" THEN 1 END) AS own_disapproves
-                FROM review_votes
-                GROUP BY review_id
-            ) rv ON r.review_id = rv.review_id
-            LEFT JOIN (
-                SELECT
-                    w3.word AS word,
-                    w3.comment AS comment,
-                    w3.pos AS pos,
-                    GROUP_CONCAT(w4.word, "|") AS tr_words,
-                    GROUP_CONCAT(w4.pos, "|") AS tr_pos,
-                    GROUP_CONCAT(w4.comment, "|") AS tr_comment,
-                    w4.lang AS translation_lang
-                FROM
-                    words w3
-                JOIN
-                    translations t ON w3.word_id = t.word_id
-                JOIN
-                    words w4 ON t.translated_word_id = w4.word_id
-                GROUP BY w3.word_id, w4.lang
-            ) tw ON w1.word = tw.word AND w2.lang = tw.translation_lang
+            LEFT JOIN
+                review_vote_counts rv ON r.review_id = rv.review_id
+            LEFT JOIN
+                review_votes own ON r.review_id = own.review_id AND own.user_id = ?
             WHERE
                 r.status == "NEW" AND
                 COALESCE(rv.approves, 0) >= ?
-            ORDER BY r.created_at DESC
-            LIMIT {offset},{count};
-        """, (user_id, user_id, approves_min))
+                {page_filter}
+            {page_order};
+        """, (user_id, approves_min) + page_params)
 
         results = cursor.fetchall()
 
-        reviews = [
-            {
-                "review_id": row["review_id"],
-                "user_id": row["user_id"],
-                "name": row["name"],
-                "src_word": row["src_word"],
-                "src_pos": row["src_pos"],
-                "src_exc_verb": row["src_exc_verb"],
-                "src_comment": row["src_comment"],
-                "src_lang": row["src_lang"],
-                "dst_word": row["dst_word"],
-                "dst_pos": row["dst_pos"],
-                "dst_exc_verb": row["dst_exc_verb"],
-                "dst_comment": row["dst_comment"],
-                "dst_lang": row["dst_lang"],
-                "reference": row["reference"],
-                "status": row["status"],
-                "approves": row["approves"] or 0,
-                "disapproves": row["disapproves"] or 0,
-                "own_approves": row["own_approves"] or 0,
-                "own_disapproves": row["own_disapproves"] or 0,
-                "tr_words": extract_string_group(row, "tr_words", "|"),
-                "tr_pos": extract_string_group(row, "tr_pos", "|"),
-                "tr_comment": extract_string_group(row, "tr_comment", "|"),
-                "created_at": int(row["created_at"]),
-            }
-            for row in results
-        ]
+        reviews = REVIEW_LAYOUT.to_dicts(results)
         cursor.close()
 
         return reviews
 
-    def get_reviews(self, user_id, approves_min, offset, count):
-        with self.db_lock:
-            return self.do_get_reviews(user_id, approves_min, offset, count)
+    def get_reviews(self, user_id, approves_min, offset, count, after=None):
+        with self.db_pool.read() as conn:
+            return self.do_get_reviews(conn, user_id, approves_min, offset, count, after)
 
-    def do_get_reviews_by_dir(self, user_id, src_lang, dst_lang, offset, count):
-        cursor = self.db_conn.cursor()
+    def do_get_reviews_by_dir(self, conn, user_id, src_lang, dst_lang, offset, count, after=None):
+        page_filter, page_params, page_order = review_page(offset, count, after)
+        cursor = conn.cursor()
         cursor.execute(f"""
             SELECT
                 r.review_id as review_id,
@@ -921,11 +1381,20 @@ class Gc(object):
                 r.status AS status,
                 rv.approves AS approves,
                 rv.disapproves AS disapproves,
-                rv.own_approves AS own_approves,
-                rv.own_disapproves AS own_disapproves,
-                tw.tr_words AS tr_words,
-                tw.tr_pos AS tr_pos,
-                tw.tr_comment AS tr_comment,
+                CASE WHEN own.vote = "APPROVE" THEN 1 ELSE 0 END AS own_approves,
+                CASE WHEN own.vote = "DISAPPROVE" THEN 1 ELSE 0 END AS own_disapproves,
+                (
+                    SELECT GROUP_CONCAT(tw.tr_words, "|") FROM translation_groups tw
+                    WHERE tw.word = w1.word AND tw.lang = w2.lang
+                ) AS tr_words,
+                (
+                    SELECT GROUP_CONCAT(tw.tr_pos, "|") FROM translation_groups tw
+                    WHERE tw.word = w1.word AND tw.lang = w2.lang
+                ) AS tr_pos,
+                (
+                    SELECT GROUP_CONCAT(tw.tr_comment, "|") FROM translation_groups tw
+                    WHERE tw.word = w1.word AND tw.lang = w2.lang
+                ) AS tr_comment,
                 strftime('%s', r.created_at) AS created_at
             FROM
                 reviews r
@@ -935,99 +1404,68 @@ class Gc(object):
                 words w1 ON r.word_id = w1.word_id
             JOIN
                 words w2 ON r.translated_word_id = w2.word_id
-            LEFT JOIN (
-                SELECT
-                    review_id,
-                    COUNT(CASE WHEN vote = "APPROVE" THEN 1 END) AS approves,
-                    COUNT(CASE WHEN vote = "DISAPPROVE" THEN 1 END) AS disapproves,
-                    COUNT(CASE WHEN user_id = ? AND vote = "APPROVE" THEN 1 END) AS own_approves,
-                    COUNT(CASE WHEN user_id = ? AND vote = "DISAPPROVE" THEN 1 END) AS own_disapproves
-                FROM review_votes
-                GROUP BY review_id
-            ) rv ON r.review_id = rv.review_id
-            LEFT JOIN (
-                SELECT
-                    w3.word AS word,
-                    w3.comment AS comment,
-                    w3.pos AS pos,
-                    GROUP_CONCAT(w4.word, "|") AS tr_words,
-                    GROUP_CONCAT(w4.pos, "|") AS tr_pos,
-                    GROUP_CONCAT(w4.comment, "|") AS tr_comment,
-                    w4.lang AS translation_lang
-                FROM
-                    words w3
-                JOIN
-                    translations t ON w3.word_id = t.word_id
-                JOIN
-                    words w4 ON t.translated_word_id = w4.word_id
-                GROUP BY w3.word_id, w4.lang
-            ) tw ON w1.word = tw.word AND w2.lang = tw.translation_lang
+            LEFT JOIN
+                review_vote_counts rv ON r.review_id = rv.review_id
+            LEFT JOIN
+                review_votes own ON r.review_id = own.review_id AND own.user_id = ?
             WHERE r.status = "NEW"
                 AND w1.lang = ?
                 AND w2.lang = ?
-            ORDER BY r.created_at DESC
-            LIMIT {offset},{count};
-        """, (user_id, user_id, src_lang, dst_lang))
+                {page_filter}
+            {page_order};
+        """, (user_id, src_lang, dst_lang) + page_params)
 
         results = cursor.fetchall()
 
-        reviews = [
-            {
-                "review_id": row["review_id"],
-                "user_id": row["user_id"],
-                "name": row["name"],
-                "src_word": row["src_word"],
-                "src_pos": row["src_pos"],
-                "src_exc_verb": row["src_exc_verb"],
-                "src_comment": row["src_comment"],
-                "src_lang": row["src_lang"],
-                "dst_word": row["dst_word"],
-                "dst_pos": row["dst_pos"],
-                "dst_exc_verb": row["dst_exc_verb"],
-                "dst_comment": row["dst_comment"],
-                "dst_lang": row["dst_lang"],
-                "reference": row["reference"],
-                "status": row["status"],
-                "approves": row["approves"] or 0,
-                "disapproves": row["disapproves"] or 0,
-                "own_approves": row["own_approves"] or 0,
-                "own_disapproves": row["own_disapproves"] or 0,
-                "tr_words": extract_string_group(row, "tr_words", "|"),
-                "tr_pos": extract_string_group(row, "tr_pos", "|"),
-                "tr_comment": extract_string_group(row, "tr_comment", "|"),
-                "created_at": int(row["created_at"]),
-            }
-            for row in results
-        ]
+        reviews = REVIEW_LAYOUT.to_dicts(results)
         cursor.close()
 
         return reviews
 
-    def get_reviews_by_dir(self, user_id, src_lang, dst_lang, offset, count):
-        with self.db_lock:
-            return self.do_get_reviews_by_dir(user_id, src_lang, dst_lang, offset, count)
+    def get_reviews_by_dir(self, user_id, src_lang, dst_lang, offset, count, after=None):
+        with self.db_pool.read() as conn:
+            return self.do_get_reviews_by_dir(conn, user_id, src_lang, dst_lang, offset, count, after)
 
     def count_review_votes_groupped(self, user_id, review_id):
-        query = """
-        SELECT
-            COUNT(CASE WHEN vote = "APPROVE" THEN 1 END) AS approves,
-            COUNT(CASE WHEN vote = "DISAPPROVE" THEN 1 END) AS disapproves,
-            COUNT(CASE WHEN user_id = ? AND vote = "APPROVE" THEN 1 END) AS own_approves,
-            COUNT(CASE WHEN user_id = ? AND vote = "DISAPPROVE" THEN 1 END) AS own_disapproves
-        FROM review_votes
-        WHERE review_id = ?;
-        """
         cursor = self.db_conn.cursor()
-        cursor.execute(query, (user_id, user_id, review_id,))
+        cursor.execute("""
+            SELECT approves, disapproves
+            FROM review_vote_counts
+            WHERE review_id = ?;
+        """, (review_id,))
         result = cursor.fetchone()
-        approves = result["approves"]
-        disapproves = result["disapproves"]
-        own_approves = result["own_approves"]
-        own_disapproves = result["own_disapproves"]
+        if result is None:
+            approves, disapproves = 0, 0
+        else:
+            approves = result["approves"]
+            disapproves = result["disapproves"]
+        cursor.execute("""
+            SELECT vote
+            FROM review_votes
+            WHERE review_id = ? AND user_id = ?;
+        """, (review_id, user_id))
+        result = cursor.fetchone()
+        own_vote = result["vote"] if result else None
+        own_approves = int(own_vote == ReviewVote.APPROVE.name)
+        own_disapproves = int(own_vote == ReviewVote.DISAPPROVE.name)
         logging.info("count_review_votes_groupped: review_id %d: %d vs %d, own %d vs %d", review_id, approves, disapproves, own_approves, own_disapproves)
         cursor.close()
         return (approves, disapproves, own_approves, own_disapproves)
 
+    # Keeps review_vote_counts in sync with review_votes, must run in the same transaction
+    def update_review_vote_counts(self, review_id, vote, delta):
+        approves = delta if vote == ReviewVote.APPROVE else 0
+        disapproves = delta if vote == ReviewVote.DISAPPROVE else 0
+        cursor = self.db_conn.cursor()
+        cursor.execute("""
+            INSERT INTO review_vote_counts (review_id, approves, disapproves)
+            VALUES (?, ?, ?)
+            ON CONFLICT(review_id) DO UPDATE SET
+                approves = approves + excluded.approves,
+                disapproves = disapproves + excluded.disapproves;
+        """, (review_id, approves, disapproves))
+        cursor.close()
+
     def do_move_votes_from_review_to_translation(self, review_id, translation_id):
         logging.info("Moving votes from review %d to translation %d", review_id, translation_id)
         cursor = self.db_conn.cursor()
@@ -1038,7 +1476,7 @@ class Gc(object):
         WHERE review_id = ?;
         """
         cursor.execute(query, (translation_id, review_id))
-        self.db_conn.commit()
+        self.writes.after_commit(lambda: self.refresh_feed_item(translation_id))
 
     # Returns InsertionResult
     def do_copy_review_to_translations(self, review_id):
@@ -1073,7 +1511,18 @@ class Gc(object):
         WHERE review_id = ? AND status != ?;
         """
         cursor.execute(query, (status.name, review_id, ReviewStatus.DISCARDED.name))
-        self.db_conn.commit()
+        self.writes.after_commit(lambda: self.invalidate_review_word(review_id))
+        if status in (ReviewStatus.DISCARDED, ReviewStatus.DISAPPROVED):
+            self.writes.after_commit(lambda: self.restore_untranslated(review_id))
+
+    def invalidate_review_word(self, review_id):
+        review = self.do_get_review_by_id(review_id)
+        if review is None:
+            return
+        src_word = self.do_get_word_by_id(review["word_id"])
+        if src_word is None:
+            return
+        self.response_cache.invalidate(word_tag(src_word.lang, src_word.word))
 
     def check_and_update_review_status(self, review_id, approves, disapproves):
         if approves > disapproves and approves >= APPROVE_THRESHOLD:
@@ -1100,7 +1549,7 @@ class Gc(object):
         """
         cursor = self.db_conn.cursor()
         cursor.execute(query, (review_id, user_id, vote.name))
-        self.db_conn.commit()
+        self.update_review_vote_counts(review_id, vote, 1)
 
         if vote == ReviewVote.APPROVE:
             approves += 1
@@ -1116,7 +1565,7 @@ class Gc(object):
     # Returns AddReviewVoteResult
     def add_review_vote(self, review_id, user_id, vote):
         assert isinstance(vote, ReviewVote)
-        with self.db_lock:
+        with self.writes.operation():
             return self.do_add_review_vote(review_id, user_id, vote)
 
     # Returns AddReviewVoteResult
@@ -1132,7 +1581,7 @@ class Gc(object):
         """
         cursor = self.db_conn.cursor()
         cursor.execute(query, (review_id, user_id, vote.name))
-        self.db_conn.commit()
+        self.update_review_vote_counts(review_id, vote, -1)
 
         if vote == ReviewVote.APPROVE:
             approves -= 1
@@ -1148,7 +1597,7 @@ class Gc(object):
     # Returns AddReviewVoteResult
     def retract_review_vote(self, review_id, user_id, vote):
         assert isinstance(vote, ReviewVote)
-        with self.db_lock:
+        with self.writes.operation():
             return self.do_retract_review_vote(review_id, user_id, vote)
 
     # Returns InsertionResult
@@ -1168,54 +1617,41 @@ class Gc(object):
 
     # Returns InsertionResult
     def discard_review(self, review_id, user_id):
-        with self.db_lock:
+        with self.writes.operation():
             return self.do_discard_review(review_id, user_id)
 
-    def get_latest_contrib_translation_id(self):
+    def get_collector_position(self, name):
         cursor = self.db_conn.cursor()
         cursor.execute("""
             SELECT
-                translation_id
+                last_id
             FROM
-                contribs
-            WHERE translation_id > 0
-            ORDER BY contrib_id DESC
-            LIMIT 1;
-        """)
+                contrib_collector_state
+            WHERE name = ?;
+        """, (name,))
         fetched = cursor.fetchone()
+        cursor.close()
         if fetched is None:
-            logging.error("get_latest_contrib_translation_id: fetched None")
             return 0
-        translation_id = fetched[0]
-        cursor.close()
-        return translation_id
+        return fetched[0]
 
-    def get_latest_contrib_review_id(self):
+    def set_collector_position(self, name, last_id):
         cursor = self.db_conn.cursor()
         cursor.execute("""
-            SELECT
-                review_id
-            FROM
-                contribs
-            WHERE review_id > 0
-            ORDER BY contrib_id DESC
-            LIMIT 1;
-        """)
-        fetched = cursor.fetchone()
-        if fetched is None:
-            logging.error("get_latest_contrib_review_id: fetched None")
-            return 0
-        translation_id = fetched[0]
+            INSERT INTO contrib_collector_state (name, last_id)
+            VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET last_id = excluded.last_id;
+        """, (name, last_id))
         cursor.close()
-        return translation_id
 
-    def load_translation_vote_range(self, prev_id):
+    # Returns (entries, ID of the last loaded translation or None if there are no new translations)
+    def load_translation_vote_range(self, prev_id, limit):
         cursor = self.db_conn.cursor()
         cursor.execute("""
             SELECT
-                t10.translation_id AS tr_id,
-                t10.user_id AS author,
-                strftime('%s', t10.created_at) AS tr_ts,
+                tc.translation_id AS tr_id,
+                tc.user_id AS author,
+                strftime('%s', tc.created_at) AS tr_ts,
                 tv.vote AS vote,
                 tv.user_id AS voter,
                 strftime('%s', tv.created_at) AS vote_ts
@@ -1227,22 +1663,25 @@ class Gc(object):
                 FROM translations t
                 WHERE t.translation_id > ?
                 ORDER BY t.translation_id
-                LIMIT 10
-            ) t10 LEFT JOIN
+                LIMIT ?
+            ) tc LEFT JOIN
                 translation_votes tv
-            ON t10.translation_id = tv.translation_id
-            ORDER BY t10.translation_id;
-        """, (prev_id,))
+            ON tc.translation_id = tv.translation_id
+            ORDER BY tc.translation_id;
+        """, (prev_id, limit))
         fetched = cursor.fetchall()
+        cursor.close()
         entries = read_translation_vote_range(fetched)
-        logging.info("load_translation_vote_range: found %d contrib entries", len(entries))
-        return entries
+        last_id = fetched[-1]["tr_id"] if fetched else None
+        return entries, last_id
 
-    def load_review_disapprove_range(self, prev_id):
+    # Returns (entries, ID of the last loaded review or None if there are no new reviews)
+    def load_review_disapprove_range(self, prev_id, limit):
         cursor = self.db_conn.cursor()
+        # Reviews without disapprove votes are kept in the result, so the chunk end is known
         cursor.execute("""
             SELECT
-                r10.review_id AS r_id,
+                rc.review_id AS r_id,
                 rv.vote AS vote,
                 rv.user_id AS voter,
                 strftime('%s', rv.created_at) AS vote_ts
@@ -1252,18 +1691,49 @@ class Gc(object):
                 FROM reviews r
                 WHERE r.review_id > ? AND r.status = "DISAPPROVED"
                 ORDER BY r.review_id
-                LIMIT 10
-            ) r10 LEFT JOIN
+                LIMIT ?
+            ) rc LEFT JOIN
                 review_votes rv
-            ON r10.review_id = rv.review_id
-            WHERE rv.vote = "DISAPPROVE"
-            ORDER BY r10.review_id;
-        """, (prev_id,))
+            ON rc.review_id = rv.review_id AND rv.vote = "DISAPPROVE"
+            ORDER BY rc.review_id;
+        """, (prev_id, limit))
         fetched = cursor.fetchall()
+        cursor.close()
         entries = read_review_disapprove_range(fetched)
-        logging.info("load_review_disapprove_range: found %d contrib entries", len(entries))
-        return entries
+        last_id = fetched[-1]["r_id"] if fetched else None
+        return entries, last_id
+
+    # Must run in the write operation inserting the contribs
+    def update_contrib_counts(self, entries):
+        daily = count_contribs(entries)
+        alltime = dict()
+        for (day, user_id), row in count_contribs([e for e in entries if e.created_at > ALLTIME_START]).items():
+            total = alltime.setdefault(user_id, [0, 0, 0, 0])
+            for i, value in enumerate(row):
+                total[i] += value
+
+        cursor = self.db_conn.cursor()
+        cursor.executemany("""
+            INSERT INTO contrib_counts_daily (day, user_id, contribs, translations, approves, disapproves)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(day, user_id) DO UPDATE SET
+                contribs = contribs + excluded.contribs,
+                translations = translations + excluded.translations,
+                approves = approves + excluded.approves,
+                disapproves = disapproves + excluded.disapproves;
+        """, [(day, user_id, *row) for (day, user_id), row in daily.items()])
+        cursor.executemany("""
+            INSERT INTO contrib_counts_alltime (user_id, contribs, translations, approves, disapproves)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                contribs = contribs + excluded.contribs,
+                translations = translations + excluded.translations,
+                approves = approves + excluded.approves,
+                disapproves = disapproves + excluded.disapproves;
+        """, [(user_id, *row) for user_id, row in alltime.items()])
+        cursor.close()
 
+    # Must run in a write operation
     def insert_contrib_entries(self, entries):
         cursor = self.db_conn.cursor()
         query = """
@@ -1278,9 +1748,10 @@ class Gc(object):
         ]
 
         cursor.executemany(query, data)
-        self.db_conn.commit()
+        self.update_contrib_counts(entries)
         cursor.close()
 
+    # Must run in a write operation
     def insert_disapprove_contrib_entries(self, entries):
         cursor = self.db_conn.cursor()
         query = """
@@ -1295,30 +1766,54 @@ class Gc(object):
         ]
 
         cursor.executemany(query, data)
-        self.db_conn.commit()
+        self.update_contrib_counts(entries)
         cursor.close()
 
-    def do_collect_contribs(self):
-        prev_translation_id = self.get_latest_contrib_translation_id()
-        logging.info("do_collect_contribs: prev translation id %d", prev_translation_id)
-        entries = self.load_translation_vote_range(prev_translation_id)
-        self.insert_contrib_entries(entries)
-        return len(entries)
-
-    def do_collect_disapprove_contribs(self):
-        prev_review_id = self.get_latest_contrib_review_id()
-        logging.info("do_collect_disapprove_contribs: prev review id %d", prev_review_id)
-        entries = self.load_review_disapprove_range(prev_review_id)
-        self.insert_disapprove_contrib_entries(entries)
-        return len(entries)
+    # Drains everything after the saved position of the collector `name`, chunk by chunk.
+    # Each chunk is a write operation committed together with the new position, so an interrupted run resumes
+    # from there and a chunk that failed halfway is rolled back. Requests get the lock in between chunks.
+    def collect_range(self, name, load_range, insert_entries):
+        started = time.time()
+        collected = 0
+        chunks = 0
+        last_id = None
+        while True:
+            with self.writes.operation():
+                prev_id = self.get_collector_position(name)
+                entries, chunk_last_id = load_range(prev_id, CONTRIB_CHUNK_SIZE)
+                if chunk_last_id is not None:
+                    insert_entries(entries)
+                    self.set_collector_position(name, chunk_last_id)
+            if chunk_last_id is None:
+                break
+            collected += len(entries)
+            chunks += 1
+            last_id = chunk_last_id
+        secs = time.time() - started
+        per_sec = collected / secs if secs > 0 else 0.0
+        logging.info("collect_range: %s, %d entries in %d chunks, %.3f secs, %.1f entries per sec, last id %s",
+            name, collected, chunks, secs, per_sec, str(last_id))
+        return {
+            "collected": collected,
+            "chunks": chunks,
+            "last_id": last_id,
+            "secs": secs,
+            "per_sec": per_sec,
+        }
 
     def collect_contribs(self):
-        with self.db_lock:
-            return self.do_collect_contribs()
+        return self.collect_range(
+            "translations",
+            self.load_translation_vote_range,
+            self.insert_contrib_entries,
+        )
 
     def collect_disapprove_contribs(self):
-        with self.db_lock:
-            return self.do_collect_disapprove_contribs()
+        return self.collect_range(
+            "review_disapproves",
+            self.load_review_disapprove_range,
+            self.insert_disapprove_contrib_entries,
+        )
 
     def get_table_size(self, table_name):
         cursor = self.db_conn.cursor()
@@ -1331,48 +1826,79 @@ class Gc(object):
         cursor.close()
         return count
 
-    def do_calculate_rankings(self, dst_table, start_time):
+    def do_populate_ranking(self, dst_table, select_query, params):
         assert isinstance(dst_table, str)
-        assert isinstance(start_time, int)
 
         cursor = self.db_conn.cursor()
         cursor.execute(f"DELETE FROM {dst_table};");
-
-        query = f"""
+        cursor.execute(f"""
             INSERT INTO {dst_table} (user_id, name, contribs, translations, approves, disapproves)
+            {select_query}
+        """.strip(), params)
+        cursor.close()
+
+    # Rankings are read from the running counters, so this doesn't touch contribs. Must run in a write operation
+    def do_calculate_rankings(self, now):
+        assert isinstance(now, int)
+
+        start_day = contrib_day(now - WEEK_SECONDS)
+        cursor = self.db_conn.cursor()
+        cursor.execute("""
+            DELETE FROM contrib_counts_daily
+            WHERE day < ?;
+        """, (start_day,))
+        rolled_off = cursor.rowcount
+        cursor.close()
+
+        self.do_populate_ranking("ranking_alltime", """
+            SELECT
+                c.user_id,
+                u.name,
+                c.contribs,
+                c.translations,
+                c.approves,
+                c.disapproves
+            FROM
+                contrib_counts_alltime c
+            JOIN
+                users u
+            ON c.user_id = u.user_id
+            ORDER BY c.contribs DESC, c.translations DESC, c.disapproves DESC
+            LIMIT 20
+        """, ())
+        # The first day of the window is counted in full
+        self.do_populate_ranking("ranking_week", """
             SELECT
                 c.user_id,
                 u.name,
-                COUNT(*) AS contribs,
-                COUNT(CASE WHEN c.action = "ADD_TRANSLATION" THEN 1 END) AS translations,
-                COUNT(CASE WHEN c.action = "APPROVE_CONFIRMED" THEN 1 END) AS approves,
-                COUNT(CASE WHEN c.action = "DISAPPROVE_CONFIRMED" THEN 1 END) AS disapproves
+                SUM(c.contribs) AS contribs,
+                SUM(c.translations) AS translations,
+                SUM(c.approves) AS approves,
+                SUM(c.disapproves) AS disapproves
             FROM
-                contribs c
+                contrib_counts_daily c
             JOIN
                 users u
             ON c.user_id = u.user_id
-            WHERE c.created_at > DATETIME(?, 'unixepoch')
+            WHERE c.day >= ?
             GROUP BY c.user_id
             ORDER BY contribs DESC, translations DESC, disapproves DESC
-            LIMIT 20;
-        """.strip()
-        cursor.execute(query, (start_time,))
-        self.db_conn.commit()
-        size = self.get_table_size(dst_table)
-        logging.info("do_calculate_rankings: repopulated %s, start time %d, size %d",
-            dst_table, start_time, size)
-        return size
+            LIMIT 20
+        """, (start_day,))
+
+        alltime = self.get_table_size("ranking_alltime")
+        week = self.get_table_size("ranking_week")
+        logging.info("do_calculate_rankings: rolled off %d daily buckets, start day %d, sizes %d and %d",
+            rolled_off, start_day, alltime, week)
+        return (alltime, week)
 
     def calculate_rankings(self):
-        with self.db_lock:
-            now = int(datetime.datetime.now().timestamp())
-            alltime = self.do_calculate_rankings("ranking_alltime", 1701613211)
-            week = self.do_calculate_rankings("ranking_week", now - WEEK_SECONDS)
-            return (alltime, week)
+        now = int(datetime.datetime.now().timestamp())
+        with self.writes.operation():
+            return self.do_calculate_rankings(now)
 
-    def do_get_ranking(self, src_table):
-        cursor = self.db_conn.cursor()
+    def do_get_ranking(self, conn, src_table):
+        cursor = conn.cursor()
         cursor.execute(f"""
             SELECT *
             FROM {src_table}
@@ -1384,14 +1910,15 @@ class Gc(object):
         return items
 
     def get_rankings(self):
-        with self.db_lock:
-            alltime = self.do_get_ranking("ranking_alltime")
-            week = self.do_get_ranking("ranking_week")
+        with self.db_pool.read() as conn:
+            alltime = self.do_get_ranking(conn, "ranking_alltime")
+            week = self.do_get_ranking(conn, "ranking_week")
             return alltime, week
 
-    def do_extract_feed(self):
-        cursor = self.db_conn.cursor()
-        cursor.execute("""
+    # Selects feed rows for translations picked by `translations_query`, which must select translations t
+    def query_feed(self, conn, translations_query, params):
+        cursor = conn.cursor()
+        cursor.execute(f"""
             SELECT
                 t.translation_id AS tr_id,
                 u.name AS name,
@@ -1403,7 +1930,7 @@ class Gc(object):
                 u2.name AS voter,
                 strftime('%s', t.created_at) AS created_at
             FROM
-                translations t
+                ({translations_query}) t
             JOIN
                 users u ON t.user_id = u.user_id
             JOIN
@@ -1414,22 +1941,59 @@ class Gc(object):
                 translation_votes tv ON t.translation_id = tv.translation_id
             LEFT JOIN
                 users u2 ON tv.user_id = u2.user_id
-            WHERE t.created_at >= datetime('now', '-2 days')
-            ORDER BY t.created_at DESC
-            LIMIT 100;
-        """)
+            ORDER BY t.created_at DESC, t.translation_id DESC;
+        """, params)
 
         fetched_results = cursor.fetchall()
         feed_items = read_feed_items(fetched_results)
         cursor.close()
         return feed_items
 
-    def get_feed(self):
+    # Limit applies to translations, not to joined rows, so every item comes with all its votes
+    def do_extract_feed(self, conn, limit):
+        return self.query_feed(
+            conn,
+            """
+                SELECT * FROM translations
+                WHERE created_at >= datetime('now', '-2 days')
+                ORDER BY created_at DESC, translation_id DESC
+                LIMIT ?
+            """,
+            (limit,),
+        )
+
+    def do_get_feed_item(self, conn, translation_id):
+        feed_items = self.query_feed(
+            conn,
+            "SELECT * FROM translations WHERE translation_id = ?",
+            (translation_id,),
+        )
+        if len(feed_items) != 1:
+            return None
+        return feed_items[0]
+
+    # Seeds the in-memory feed, under the lock so no concurrent write is missed
+    def load_feed(self):
         with self.db_lock:
-            return self.do_extract_feed()
+            self.feed_ring.reset(self.do_extract_feed(self.db_conn, FEED_LIMIT))
 
-    def do_get_stats(self):
-        cursor = self.db_conn.cursor()
+    # Brings the translation up to date in the in-memory feed, must be called after commit
+    def refresh_feed_item(self, translation_id):
+        if not self.feed_ring.loaded:
+            return
+        feed_item = self.do_get_feed_item(self.db_conn, translation_id)
+        if feed_item is not None:
+            self.feed_ring.upsert(feed_item)
+
+    # Returns (list of FeedItem, etag)
+    def get_feed(self):
+        if not self.feed_ring.loaded:
+            self.load_feed()
+        feed_items, version = self.feed_ring.snapshot(int(time.time()))
+        return feed_items, f"{self.boot_id}-{version}"
+
+    def do_get_stats(self, conn):
+        cursor = conn.cursor()
         cursor.execute("""
             SELECT
                 COUNT(CASE WHEN en_count > 0 THEN 1 END) AS en_count,
@@ -1464,19 +2028,81 @@ class Gc(object):
 
         return stats[0]
 
+    # Returns (stats, DataVersion)
     def get_stats(self):
         cached = self.cache.get_stats()
         if cached:
             return cached
         logging.info("get_stats: No valid cache entry, retrieving from DB")
-        with self.db_lock:
-            stats = self.do_get_stats()
+        # Read before the stats, so a concurrent write can only make the version older than the data
+        data_version = self.get_data_version(STATS_TABLES)
+        with self.db_pool.read() as conn:
+            stats = self.do_get_stats(conn)
             if stats:
-                self.cache.update_stats(stats)
-            return stats
+                self.cache.update_stats(stats, data_version)
+            return stats, data_version
 
-    def do_get_downloads(self):
-        cursor = self.db_conn.cursor()
+    # Returns DataVersion of the stats get_stats would return
+    def get_stats_version(self):
+        cached = self.cache.get_stats()
+        if cached:
+            return cached[1]
+        return self.get_data_version(STATS_TABLES)
+
+    # Returns {table: (version, updated_at)}
+    def do_get_data_versions(self, conn, tables):
+        cursor = conn.cursor()
+        placeholders = ", ".join("?" for _ in tables)
+        cursor.execute(f"""
+            SELECT name, version, updated_at
+            FROM data_versions
+            WHERE name IN ({placeholders});
+        """, tuple(tables))
+        versions = {row["name"]: (row["version"], row["updated_at"]) for row in cursor.fetchall()}
+        cursor.close()
+        return versions
+
+    # Returns DataVersion of the tables. Cached responses are tagged with table names, so the ones
+    # built from a table changed by another process or script are dropped here.
+    def get_data_version(self, tables):
+        with self.db_pool.read() as conn:
+            versions = self.do_get_data_versions(conn, tables)
+        with self.seen_versions_lock:
+            changed = [table for table in tables if self.seen_versions.get(table) != versions.get(table)]
+            for table in changed:
+                self.seen_versions[table] = versions.get(table)
+        if changed:
+            self.response_cache.invalidate(*changed)
+            if "translations" in changed:
+                self.refresh_lexicon(versions.get("translations"))
+        return combine_versions(tables, versions)
+
+    # Lookups answered from memory call this instead of get_data_version, so only one request
+    # in VERSION_CHECK_SECS pays for the query
+    def check_watched_versions(self):
+        now = time.monotonic()
+        with self.seen_versions_lock:
+            if now < self.next_version_check:
+                return
+            self.next_version_check = now + VERSION_CHECK_SECS
+        self.get_data_version(WATCHED_TABLES)
+
+    # Reloads the lexicon unless it already reflects `version` of translations. The version is read
+    # before the load, so a change racing with it triggers another reload rather than being missed.
+    def refresh_lexicon(self, version):
+        if self.lexicon is None:
+            return
+        with self.lexicon_lock:
+            if self.lexicon_version == version:
+                return
+            lexicon = LexiconIndex()
+            with self.db_pool.read() as conn:
+                lexicon.load(conn)
+            self.lexicon = lexicon
+            self.lexicon_version = version
+
+    def do_get_downloads(self, conn):
+        cursor = conn.cursor()
         cursor.execute("""
             SELECT
                 id,
@@ -1504,57 +2130,88 @@ class Gc(object):
         return downloads
 
     def get_downloads(self):
-        with self.db_lock:
-            downloads = self.do_get_downloads()
+        with self.db_pool.read() as conn:
+            downloads = self.do_get_downloads(conn)
             return downloads
 
-    def do_get_untranslated(self, dst_lang):
-        result = []
-
-        query = """
+    # Returns all Kazakh words with neither a translation nor a pending review into `dst_lang`,
+    # or only the word with `word_id` if it is such a word
+    def do_get_untranslated(self, conn, dst_lang, word_id=None):
+        word_filter = ""
+        params = (dst_lang, dst_lang)
+        if word_id is not None:
+            word_filter = "AND w1.word_id = ?"
+            params = (word_id,) + params
+        cursor = conn.cursor()
+        cursor.execute(f"""
             SELECT
                 w1.word_id AS source_word_id,
-                w1.word AS source_word,
-                GROUP_CONCAT(w2.lang) AS translation_langs
+                w1.word AS source_word
             FROM
                 words w1
-            LEFT JOIN
-                translations t ON w1.word_id = t.word_id
-            LEFT JOIN
-                words w2 ON t.translated_word_id = w2.word_id
             WHERE
                 w1.lang = "kk"
-            GROUP BY w1.word_id
-            LIMIT ?,50;
-        """
+                {word_filter}
+                AND NOT EXISTS (
+                    SELECT 1
+                    FROM translations t
+                    JOIN words w2 ON t.translated_word_id = w2.word_id
+                    WHERE t.word_id = w1.word_id AND w2.lang = ?
+                )
+                AND NOT EXISTS (
+                    SELECT 1
+                    FROM reviews r
+                    JOIN words w3 ON r.translated_word_id = w3.word_id
+                    WHERE r.word_id = w1.word_id AND r.status = "NEW" AND w3.lang = ?
+                );
+        """, params)
+        result = [
+            (row["source_word_id"], row["source_word"])
+            for row in cursor.fetchall()
+        ]
+        cursor.close()
+        return result
 
-        cursor = self.db_conn.cursor()
-        for iter in range(6):
-            offset = random.randint(0, 14200)
-            cursor.execute(query, (offset,))
-            fetched_results = cursor.fetchall()
-            for row in fetched_results:
-                translation_langs = row["translation_langs"]
-                if translation_langs is None or dst_lang not in translation_langs.split(","):
-                    result.append((row["source_word_id"], row["source_word"]))
-            if len(result) >= 100:
-                break
+    # Must be called with db_lock held
+    def drop_untranslated(self, word_id, dst_lang):
+        pool = self.untranslated_pools.get(dst_lang)
+        if pool is not None:
+            pool.remove(word_id)
 
-        return result
+    # Puts the source word of a review that is no longer pending back into the pool,
+    # unless another pending review or a translation into the same language remains.
+    # Must be called with db_lock held, after commit.
+    def restore_untranslated(self, review_id):
+        review = self.do_get_review_by_id(review_id)
+        if review is None:
+            return
+        dst_word = self.do_get_word_by_id(review["translated_word_id"])
+        if dst_word is None:
+            return
+        pool = self.untranslated_pools.get(dst_word.lang)
+        if pool is None:
+            return
+        for word_id, word in self.do_get_untranslated(self.db_conn, dst_word.lang, review["word_id"]):
+            pool.add(word_id, word)
+
+    def get_untranslated_pool(self, dst_lang):
+        pool = self.untranslated_pools.get(dst_lang)
+        if pool is not None:
+            return pool
+        # Built under the write lock, so that no word added or translated meanwhile is missed
+        with self.db_lock:
+            pool = self.untranslated_pools.get(dst_lang)
+            if pool is None:
+                pool = UntranslatedPool(self.do_get_untranslated(self.db_conn, dst_lang))
+                logging.info("Populated untranslated pool for %s with %d words", dst_lang, pool.size())
+                self.untranslated_pools[dst_lang] = pool
+        return pool
 
     def get_untranslated(self, dst_lang):
-        picked = self.untranslated_cache.pick_random(3)
-        if picked is None:
-            with self.db_lock:
-                new_untranslated = self.do_get_untranslated(dst_lang)
-                random.shuffle(new_untranslated)
-            logging.info("Populating untranslated cache with %d words", len(new_untranslated))
-            self.untranslated_cache.reset(new_untranslated)
-            picked = self.untranslated_cache.pick_random(3)
-        return picked
-
-    def do_get_gpt4omini_translations(self, word_id):
-        cursor = self.db_conn.cursor()
+        return self.get_untranslated_pool(dst_lang).pick_random(3)
+
+    def do_get_gpt4omini_translations(self, conn, word_id):
+        cursor = conn.cursor()
         cursor.execute("""
             SELECT
                 translations
@@ -1573,14 +2230,14 @@ class Gc(object):
 
     def get_llm_translations(self, word_id, model):
         if model == "gpt-4o-mini":
-            with self.db_lock:
-                return self.do_get_gpt4omini_translations(word_id)
+            with self.db_pool.read() as conn:
+                return self.do_get_gpt4omini_translations(conn, word_id)
         else:
             logging.error("Unknown model %s for translations", model)
             return None
 
-    def do_get_verb_form_examples(self, verb, fe, neg):
-        cursor = self.db_conn.cursor()
+    def do_get_verb_form_examples(self, conn, verb, fe, neg):
+        cursor = conn.cursor()
         cursor.execute("""
             SELECT
                 form, example
@@ -1602,11 +2259,45 @@ class Gc(object):
         return verb_form_examples
 
     def get_verb_form_examples(self, verb, fe, neg):
-        with self.db_lock:
-            return self.do_get_verb_form_examples(verb, fe, neg)
+        return self.cached(
+            ("get_verb_form_examples", verb, fe, neg),
+            CONTENT_CACHE_TTL_SECS,
+            ["verb_form_examples"],
+            lambda: self.load_verb_form_examples(verb, fe, neg),
+        )
 
-    def do_get_book_chunks(self, book_id, offset, count):
-        cursor = self.db_conn.cursor()
+    def load_verb_form_examples(self, verb, fe, neg):
+        with self.db_pool.read() as conn:
+            return self.do_get_verb_form_examples(conn, verb, fe, neg)
+
+    # Returns all chunks of the book sorted by chunk_id
+    def do_get_book_chunks(self, conn, book_id):
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT
+                book_id, chunk_id, content
+            FROM
+                book_chunks
+            WHERE
+                book_id = ?
+            ORDER BY chunk_id;
+        """, (book_id,))
+        fetched_results = cursor.fetchall()
+
+        book_chunks = [
+            {
+                "book_id": row["book_id"],
+                "chunk_id": row["chunk_id"],
+                "content": row["content"]
+            }
+            for row in fetched_results
+        ]
+        cursor.close()
+        return book_chunks
+
+    # Returns (up to `count` chunks starting at chunk_id `offset`, offset of the next range or None at the end)
+    def do_get_book_range(self, conn, book_id, offset, count):
+        cursor = conn.cursor()
         cursor.execute("""
             SELECT
                 book_id, chunk_id, content
@@ -1615,8 +2306,9 @@ class Gc(object):
             WHERE
                 book_id = ? AND
                 chunk_id >= ?
+            ORDER BY chunk_id
             LIMIT ?;
-        """, (book_id, offset, count))
+        """, (book_id, offset, count + 1))
         fetched_results = cursor.fetchall()
 
         book_chunks = [
@@ -1628,7 +2320,25 @@ class Gc(object):
             for row in fetched_results
         ]
         cursor.close()
-        return book_chunks
+        next_offset = None
+        if len(book_chunks) > count:
+            next_offset = book_chunks.pop()["chunk_id"]
+        return book_chunks, next_offset
+
+    # Returns the length of the book in characters or None for a book without chunks
+    def do_get_book_chars(self, conn, book_id):
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT
+                SUM(LENGTH(content))
+            FROM
+                book_chunks
+            WHERE
+                book_id = ?;
+        """, (book_id,))
+        chars = cursor.fetchone()[0]
+        cursor.close()
+        return chars
 
     def get_book_chunks(self, book_id, offset, count):
         if book_id <= 0:
@@ -1640,51 +2350,105 @@ class Gc(object):
         if not (0 < count < 50):
             logging.error("get_book_chunks: bad count %d", count)
             return None
-        with self.db_lock:
-            return self.do_get_book_chunks(book_id, offset, count)
+        chunks, _ = self.get_book_range(book_id, offset, count)
+        return chunks
 
-    def do_get_video_subtitles(self, video_id, start_ms, end_ms):
-        cursor = self.db_conn.cursor()
-        # Cover in SELECT subtitles starting during preceding 60 seconds
-        start_ms_extended = max(0, start_ms - 60000)
+    # Returns (chunks, offset of the next page or None) or None for invalid arguments
+    def get_book_page(self, book_id, offset, count):
+        if book_id <= 0:
+            logging.error("get_book_page: bad book_id %d", book_id)
+            return None
+        if not (0 < count <= BOOK_PAGE_MAX_CHUNKS):
+            logging.error("get_book_page: bad count %d", count)
+            return None
+        return self.get_book_range(book_id, offset, count)
+
+    # Readers walk a book sequentially, so the whole book is loaded once and pages are sliced from memory.
+    # Books that are empty or too large for the cache are read by ranges instead. The periodic version
+    # check drops cached books when a script changed book_chunks.
+    def get_book_range(self, book_id, offset, count):
+        self.check_watched_versions()
+        chars = self.cached(
+            ("book_chars", book_id),
+            CONTENT_CACHE_TTL_SECS,
+            ["book_chunks"],
+            lambda: self.load_book_chars(book_id),
+        )
+        if chars is None or chars > BOOK_CACHE_MAX_CHARS:
+            with self.db_pool.read() as conn:
+                return self.do_get_book_range(conn, book_id, offset, count)
+        book = self.cached(
+            ("book", book_id),
+            CONTENT_CACHE_TTL_SECS,
+            ["book_chunks"],
+            lambda: self.load_book(book_id),
+        )
+        return book.range(offset, count)
+
+    def load_book_chars(self, book_id):
+        with self.db_pool.read() as conn:
+            return self.do_get_book_chars(conn, book_id)
+
+    def load_book(self, book_id):
+        with self.db_pool.read() as conn:
+            return BookChunks(self.do_get_book_chunks(conn, book_id))
+
+    # Returns all cues of the video sorted by start
+    def do_get_video_cues(self, conn, video_id):
+        cursor = conn.cursor()
         cursor.execute("""
             SELECT
                 video_id, start_ms, end_ms, content, words
             FROM
                 subtitles
             WHERE
-                video_id = ? AND
-                start_ms >= ? AND start_ms <= ? AND
-                end_ms >= ?
-            LIMIT 100;
-        """, (video_id, start_ms_extended, end_ms, start_ms))
+                video_id = ?
+            ORDER BY start_ms;
+        """, (video_id,))
         fetched_results = cursor.fetchall()
 
-        video_subtitles = [
-            {
-                "start_ms": row["start_ms"],
-                "end_ms": row["end_ms"],
-                "content": row["content"],
-                "words": row["words"],
-            }
-            for row in fetched_results
-        ]
+        cues = SUBTITLE_LAYOUT.to_dicts(fetched_results)
         cursor.close()
-        return video_subtitles
+        return cues
 
+    # Polled by the player during playback, so cues of a video are loaded once and kept in an interval index.
+    # The periodic version check drops the indexes when a script changed subtitles.
     def get_video_subtitles(self, video_id, start_ms, end_ms):
-        with self.db_lock:
-            return self.do_get_video_subtitles(video_id, start_ms, end_ms)
+        self.check_watched_versions()
+        index = self.cached(
+            ("subtitle_index", video_id),
+            CONTENT_CACHE_TTL_SECS,
+            ["subtitles"],
+            lambda: self.load_subtitle_index(video_id),
+        )
+        return index.overlapping(start_ms, end_ms, SUBTITLES_LIMIT)
 
-    def do_get_clips(self, offset, count):
-        cursor = self.db_conn.cursor()
-        cursor.execute("""
-            SELECT
-               *
-            FROM
-                clips
-            LIMIT ?, ?;
-        """, (offset, count))
+    def load_subtitle_index(self, video_id):
+        with self.db_pool.read() as conn:
+            return SubtitleIndex(self.do_get_video_cues(conn, video_id))
+
+    # `after` is None for offset pagination, or clip_id of the last clip on the previous page
+    def do_get_clips(self, conn, offset, count, after=None):
+        cursor = conn.cursor()
+        if after is None:
+            cursor.execute("""
+                SELECT
+                   *
+                FROM
+                    clips
+                ORDER BY clip_id
+                LIMIT ?, ?;
+            """, (offset, count))
+        else:
+            cursor.execute("""
+                SELECT
+                   *
+                FROM
+                    clips
+                WHERE clip_id > ?
+                ORDER BY clip_id
+                LIMIT ?;
+            """, (after, count))
         fetched_results = cursor.fetchall()
 
         clips = [
@@ -1701,9 +2465,17 @@ class Gc(object):
         cursor.close()
         return clips
 
-    def get_clips(self, offset, count):
-        with self.db_lock:
-            return self.do_get_clips(offset, count)
+    def get_clips(self, offset, count, after=None):
+        return self.cached(
+            ("get_clips", offset, count, after),
+            CONTENT_CACHE_TTL_SECS,
+            ["clips"],
+            lambda: self.load_clips(offset, count, after),
+        )
+
+    def load_clips(self, offset, count, after):
+        with self.db_pool.read() as conn:
+            return self.do_get_clips(conn, offset, count, after)
 
 
 def init_db_conn(db_path):
@@ -1721,9 +2493,6 @@ CREATE TABLE IF NOT EXISTS words (
     created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
     """.strip())
-    conn.execute("""
-CREATE INDEX IF NOT EXISTS idx_word ON words(word);
-    """.strip())
 
     conn.execute("""
 CREATE TABLE IF NOT EXISTS translations (
@@ -1892,15 +2661,23 @@ CREATE TABLE IF NOT EXISTS clips (
 );
     """.strip())
 
-    logging.info("Database connection with %s established", db_path)
+    version = migrate(conn)
+    logging.info("Database connection with %s established, schema version %d", db_path, version)
     return conn
 
 
 def init_gc_app():
     global gc_instance
     db_conn = init_db_conn(DATABASE_PATH)
+    db_pool = DbPool(DATABASE_PATH, db_conn)
     auth = Auth()
-    gc_instance = Gc(db_conn, auth)
+    lexicon = None
+    if os.environ.get(LEXICON_INDEX_ENV, "1") != "0":
+        lexicon = LexiconIndex()
+    gc_instance = Gc(db_pool, auth, lexicon)
+    instrument_methods(gc_instance, METRICS)
+    gc_instance.check_watched_versions()
+    gc_instance.load_feed()
     logging.info("GC app initialized")
 
 
@@ -1908,6 +2685,21 @@ def valid_lang(lang):
     return lang == "en" or lang == "kk" or lang == "ru"
 
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    started = getattr(g, "request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        METRICS.observe("gc_request_seconds", (("route", route),), time.perf_counter() - started)
+        METRICS.inc("gc_requests_total", (("route", route), ("status", response.status_code)))
+    return response
+
+
 @app.route("/gcapi/v1/test", methods=["GET"])
 def get_test():
     return jsonify({"message": "You've reached GC!"}), 200
@@ -1962,7 +2754,32 @@ def get_translation():
         return jsonify({"message": "Invalid request"}), 400
 
     translations = gc_instance.get_translations(src_lang, dst_lang, both_dirs, word)
-    return jsonify({"translations": translations}), 200
+    return json_response({"translations": translations}, 200)
+
+
+@app.route("/gcapi/v1/get_translations_batch", methods=["POST"])
+def post_get_translations_batch():
+    global gc_instance
+
+    request_data = request.json
+    src_lang = request_data.get("src")
+    dst_lang = request_data.get("dst")
+    both_dirs = request_data.get("both", False) == True
+
+    if not valid_lang(src_lang):
+        logging.error("Invalid src")
+        return jsonify({"message": "Invalid request"}), 400
+    if not valid_lang(dst_lang):
+        logging.error("Invalid dst")
+        return jsonify({"message": "Invalid request"}), 400
+    words = read_batch_words(request_data.get("words"))
+    if words is None:
+        return jsonify({"message": "Invalid request"}), 400
+
+    logging.info("Request /get_translations_batch %s->%s, both dirs %s: %d words", src_lang, dst_lang, str(both_dirs), len(words))
+
+    translations = gc_instance.get_translations_batch(src_lang, dst_lang, both_dirs, words)
+    return json_response({"translations": translations}, 200)
 
 
 @app.route("/gcapi/v1/get_translation_info", methods=["GET"])
@@ -2005,6 +2822,27 @@ def get_words():
     return jsonify({"words": words}), 200
 
 
+@app.route("/gcapi/v1/get_words_batch", methods=["POST"])
+def post_get_words_batch():
+    global gc_instance
+
+    request_data = request.json
+    lang = request_data.get("lang")
+    with_translations = request_data.get("wtrs", False) == True
+
+    if not validate_lang(lang):
+        logging.error("Invalid language")
+        return jsonify({"message": "Invalid language"}), 400
+    words = read_batch_words(request_data.get("words"))
+    if words is None:
+        return jsonify({"message": "Invalid words"}), 400
+
+    logging.info("Request /get_words_batch lang %s, with_translations %s: %d words", lang, str(with_translations), len(words))
+
+    words_by_input = gc_instance.get_words_batch(words, lang, with_translations)
+    return jsonify({"words": words_by_input}), 200
+
+
 @app.route("/gcapi/v1/add_word", methods=["POST"])
 def post_add_word():
     global gc_instance
@@ -2139,6 +2977,16 @@ def get_reviews():
         logging.error("Invalid count: %s", str(count_raw))
         return jsonify({"message": "Invalid request"}), 400
 
+    # Keyset pagination: an empty cursor requests the first page, `o` is ignored
+    cursor_raw = request.args.get("cursor")
+    after = None
+    if cursor_raw:
+        after = decode_cursor(cursor_raw, 2)
+        if after is None:
+            return jsonify({"message": "Invalid cursor"}), 400
+    if cursor_raw is not None:
+        offset = 0
+
     if not (src_lang is None and dst_lang is None):
         if not valid_lang(src_lang):
             logging.error("Invalid src lang")
@@ -2152,7 +3000,7 @@ def get_reviews():
         if src_lang == dst_lang:
             logging.error("Invalid combination of src and dst lang")
             return jsonify({"message": "Invalid request"}), 400
-        reviews = gc_instance.get_reviews_by_dir(user_id, src_lang, dst_lang, offset, count)
+        reviews = gc_instance.get_reviews_by_dir(user_id, src_lang, dst_lang, offset, count, after)
     else:
         if approves_min is None:
             approves_min_arg = 0
@@ -2162,12 +3010,18 @@ def get_reviews():
             logging.error("Invalid value for am: %s", str(approves_min))
             return jsonify({"message": "Invalid request"}), 400
         assert isinstance(approves_min_arg, int), f"bad type: {type(approves_min_arg)}"
-        reviews = gc_instance.get_reviews(user_id, approves_min_arg, offset, count)
+        reviews = gc_instance.get_reviews(user_id, approves_min_arg, offset, count, after)
 
     if reviews is None:
         logging.error("null reviews")
         return jsonify({"message": "Internal error"}), 500
-    return jsonify({"message": "ok", "reviews": reviews}), 200
+    if cursor_raw is None:
+        return json_response({"message": "ok", "reviews": reviews}, 200)
+    next_cursor = None
+    if len(reviews) == count:
+        last = reviews[-1]
+        next_cursor = encode_cursor(last["created_at"], last["review_id"])
+    return json_response({"message": "ok", "reviews": reviews, "next_cursor": next_cursor}, 200)
 
 
 @app.route("/gcapi/v1/add_review_vote", methods=["POST"])
@@ -2266,8 +3120,15 @@ def collect_contribs():
     if not gc_instance.verify_cron_token(request.json):
         return jsonify({"message": "Unauthorized"}), 401
 
-    collected = gc_instance.collect_contribs()
-    return jsonify({"message": "ok", "collected": collected})
+    stats = gc_instance.collect_contribs()
+    return jsonify({
+        "message": "ok",
+        "collected": stats["collected"],
+        "chunks": stats["chunks"],
+        "last_id": stats["last_id"],
+        "secs": stats["secs"],
+        "per_sec": stats["per_sec"],
+    })
 
 
 @app.route("/gcapi/v1/collect_disapprove_contribs", methods=["POST"])
@@ -2277,8 +3138,15 @@ def collect_disapprove_contribs():
     if not gc_instance.verify_cron_token(request.json):
         return jsonify({"message": "Unauthorized"}), 401
 
-    collected = gc_instance.collect_disapprove_contribs()
-    return jsonify({"message": "ok", "collected": collected})
+    stats = gc_instance.collect_disapprove_contribs()
+    return jsonify({
+        "message": "ok",
+        "collected": stats["collected"],
+        "chunks": stats["chunks"],
+        "last_id": stats["last_id"],
+        "secs": stats["secs"],
+        "per_sec": stats["per_sec"],
+    })
 
 
 @app.route("/gcapi/v1/calculate_rankings", methods=["POST"])
@@ -2296,38 +3164,51 @@ def calculate_rankings():
 def get_rankings():
     global gc_instance
 
+    data_version = gc_instance.get_data_version(RANKING_TABLES)
+    response = not_modified(data_version)
+    if response is not None:
+        return response
     alltime, week = gc_instance.get_rankings()
-    return jsonify({"message": "ok", "alltime": alltime, "week": week})
+    return with_data_version(jsonify({"message": "ok", "alltime": alltime, "week": week}), data_version)
 
 
 @app.route("/gcapi/v1/get_feed", methods=["GET"])
 def get_feed():
     global gc_instance
 
-    feed = gc_instance.get_feed()
-    if feed is None:
-        logging.error("null feed")
-        return jsonify({"message": "Internal error"}), 500
-    return jsonify({"message": "ok", "feed": feed}), 200
+    feed, etag = gc_instance.get_feed()
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+    else:
+        response = json_response({"message": "ok", "feed": feed}, 200)
+    response.set_etag(etag)
+    return response
 
 
 @app.route("/gcapi/v1/get_stats", methods=["GET"])
 def get_stats():
     global gc_instance
 
-    stats = gc_instance.get_stats()
+    response = not_modified(gc_instance.get_stats_version())
+    if response is not None:
+        return response
+    stats, data_version = gc_instance.get_stats()
     if stats is None:
         logging.error("null stats")
         return jsonify({"message": "Internal error"}), 500
-    return jsonify({"message": "ok", "stats": stats}), 200
+    return with_data_version(jsonify({"message": "ok", "stats": stats}), data_version)
 
 
 @app.route("/gcapi/v1/get_downloads", methods=["GET"])
 def get_downloads():
     global gc_instance
 
+    data_version = gc_instance.get_data_version(("downloads",))
+    response = not_modified(data_version)
+    if response is not None:
+        return response
     downloads = gc_instance.get_downloads()
-    return jsonify({"message": "ok", "downloads": downloads}), 200
+    return with_data_version(jsonify({"message": "ok", "downloads": downloads}), data_version)
 
 
 @app.route("/gcapi/v1/get_untranslated", methods=["GET"])
@@ -2380,8 +3261,12 @@ def get_verb_form_examples():
         logging.error("Invalid verb argument: %s", str(verb))
         return jsonify({"message": "Invalid request"}), 400
 
+    data_version = gc_instance.get_data_version(("verb_form_examples",))
+    response = not_modified(data_version)
+    if response is not None:
+        return response
     verb_form_examples = gc_instance.get_verb_form_examples(verb, fe, neg)
-    return jsonify({"message": "ok", "verb_form_examples": verb_form_examples}), 200
+    return with_data_version(jsonify({"message": "ok", "verb_form_examples": verb_form_examples}), data_version)
 
 
 @app.route("/gcapi/v1/get_book_chunks", methods=["GET"])
@@ -2409,6 +3294,31 @@ def get_book_chunks():
     return jsonify({"message": "ok", "chunks": chunks}), 200
 
 
+@app.route("/gcapi/v2/get_book_chunks", methods=["GET"])
+def get_book_page():
+    global gc_instance
+
+    book_id = request.args.get("book_id")
+    offset = request.args.get("offset", "0")
+    count = request.args.get("count", "100")
+
+    if not (book_id and book_id.isdigit()):
+        logging.error("invalid book_id: %s", book_id)
+        return jsonify({"message": "Invalid book_id"}), 400
+    if not offset.isdigit():
+        logging.error("invalid offset: %s", offset)
+        return jsonify({"message": "Invalid offset"}), 400
+    if not count.isdigit():
+        logging.error("invalid count: %s", count)
+        return jsonify({"message": "Invalid count"}), 400
+
+    page = gc_instance.get_book_page(int(book_id), int(offset), int(count))
+    if page is None:
+        return jsonify({"message": "Invalid request"}), 400
+    chunks, next_offset = page
+    return compressed_json_response({"message": "ok", "chunks": chunks, "next_offset": next_offset}, 200)
+
+
 @app.route("/gcapi/v1/get_video_subtitles", methods=["GET"])
 def get_video_subtitles():
     global gc_instance
@@ -2433,7 +3343,7 @@ def get_video_subtitles():
     if subtitles is None:
         logging.error("null subtitles: %s, [%d, %d]", video_id, start_ms, end_ms)
         return jsonify({"message": "Internal error"}), 500
-    return jsonify({"message": "ok", "subtitles": subtitles}), 200
+    return json_response({"message": "ok", "subtitles": subtitles}, 200)
 
 
 @app.route("/gcapi/v1/get_clips", methods=["GET"])
@@ -2449,8 +3359,44 @@ def get_clips():
         logging.error("Invalid count: %s", str(count_raw))
         return jsonify({"message": "Invalid request"}), 400
 
-    clips = gc_instance.get_clips(offset, count)
+    # Keyset pagination: an empty cursor requests the first page, `o` is ignored
+    cursor_raw = request.args.get("cursor")
+    after = None
+    if cursor_raw:
+        decoded = decode_cursor(cursor_raw, 1)
+        if decoded is None:
+            return jsonify({"message": "Invalid cursor"}), 400
+        after = decoded[0]
+    if cursor_raw is not None:
+        offset = 0
+
+    data_version = gc_instance.get_data_version(("clips",))
+    response = not_modified(data_version)
+    if response is not None:
+        return response
+    clips = gc_instance.get_clips(offset, count, after)
     if clips is None:
         logging.error("null clips: %s, %s", str(offset_raw), str(count_raw))
         return jsonify({"message": "Internal error"}), 500
-    return jsonify({"message": "ok", "clips": clips}), 200
\ No newline at end of file
+    if cursor_raw is None:
+        return with_data_version(jsonify({"message": "ok", "clips": clips}), data_version)
+    next_cursor = None
+    if len(clips) == count:
+        next_cursor = encode_cursor(clips[-1]["clip_id"])
+    return with_data_version(jsonify({"message": "ok", "clips": clips, "next_cursor": next_cursor}), data_version)
+
+
+# Routes under /gcinternal are reachable only inside the cluster, the ingress forwards /gcapi alone
+@app.route("/gcinternal/v1/get_cache_stats", methods=["GET"])
+def get_cache_stats():
+    global gc_instance
+
+    stats = gc_instance.get_cache_stats()
+    return jsonify({"message": "ok", "stats": stats}), 200
+
+
+@app.route("/gcinternal/v1/metrics", methods=["GET"])
+def get_metrics():
+    response = make_response(METRICS.render(), 200)
+    response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    return response
\ No newline at end of file
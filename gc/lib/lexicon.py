@@ -0,0 +1,142 @@
+from array import array
+import logging
+import threading
+import time
+
+
+# Positions in word tuples
+WORD = 0
+POS = 1
+EXC_VERB = 2
+COMMENT = 3
+LANG = 4
+
+
+class LexiconIndex(object):
+    """
+    In-process copy of the `translations` table joined with `words`.
+
+    Every translation occupies a slot in a set of parallel arrays, word details are stored once per word.
+    Lookups go through a map from (lang, word) to the slots where the word appears on either side,
+    so they don't touch SQLite. Updates are appended by a single writer (under `db_lock`),
+    readers only need a consistent snapshot of a slot list and don't lock at all.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # word_id -> (word, pos, exc_verb, comment, lang)
+        self.words = dict()
+        # one entry per translation
+        self.translation_ids = array("q")
+        self.src_word_ids = array("q")
+        self.dst_word_ids = array("q")
+        # (lang, word) -> list of slots
+        self.slots_by_word = dict()
+
+    def size(self):
+        return len(self.translation_ids)
+
+    def load(self, db_conn):
+        started = time.time()
+        cursor = db_conn.cursor()
+        cursor.execute("""
+            SELECT
+                t.translation_id AS translation_id,
+                w1.word_id AS src_word_id,
+                w1.word AS src_word,
+                w1.pos AS src_pos,
+                w1.exc_verb AS src_exc_verb,
+                w1.comment AS src_comment,
+                w1.lang AS src_lang,
+                w2.word_id AS dst_word_id,
+                w2.word AS dst_word,
+                w2.pos AS dst_pos,
+                w2.exc_verb AS dst_exc_verb,
+                w2.comment AS dst_comment,
+                w2.lang AS dst_lang
+            FROM
+                translations t
+            JOIN
+                words w1 ON t.word_id = w1.word_id
+            JOIN
+                words w2 ON t.translated_word_id = w2.word_id
+            ORDER BY t.translation_id;
+        """)
+        with self.lock:
+            for row in cursor:
+                self.do_add(
+                    row["translation_id"],
+                    row["src_word_id"],
+                    (row["src_word"], row["src_pos"], row["src_exc_verb"], row["src_comment"], row["src_lang"]),
+                    row["dst_word_id"],
+                    (row["dst_word"], row["dst_pos"], row["dst_exc_verb"], row["dst_comment"], row["dst_lang"]),
+                )
+        cursor.close()
+        logging.info("LexiconIndex: loaded %d translations of %d words in %.3f secs",
+            self.size(), len(self.words), time.time() - started)
+
+    def add_word_slot(self, lang, word, slot):
+        key = (lang, word)
+        slots = self.slots_by_word.get(key)
+        if slots is None:
+            self.slots_by_word[key] = [slot]
+        elif slots[-1] != slot:
+            slots.append(slot)
+
+    def do_add(self, translation_id, src_word_id, src_word, dst_word_id, dst_word):
+        self.words[src_word_id] = src_word
+        self.words[dst_word_id] = dst_word
+        slot = len(self.translation_ids)
+        self.translation_ids.append(translation_id)
+        self.src_word_ids.append(src_word_id)
+        self.dst_word_ids.append(dst_word_id)
+        # Slot lists are published last, so a reader never sees a slot with incomplete arrays
+        self.add_word_slot(src_word[LANG], src_word[WORD], slot)
+        self.add_word_slot(dst_word[LANG], dst_word[WORD], slot)
+
+    # Both words are WordInfo. Translations are loaded in order of ID, so one with an ID
+    # up to the last loaded is already in the index.
+    def add_translation(self, translation_id, src_word, dst_word):
+        with self.lock:
+            if self.translation_ids and translation_id <= self.translation_ids[-1]:
+                return
+            self.do_add(
+                translation_id,
+                src_word.word_id,
+                (src_word.word, src_word.pos, int(src_word.exc_verb), src_word.comment, src_word.lang),
+                dst_word.word_id,
+                (dst_word.word, dst_word.pos, int(dst_word.exc_verb), dst_word.comment, dst_word.lang),
+            )
+
+    # Same semantics and output as Gc.do_get_translations/do_get_inversed_translations
+    def lookup(self, src_lang, dst_lang, both_dirs, word, limit):
+        inversed = src_lang != "kk"
+        slots = self.slots_by_word.get((src_lang, word), [])
+        if both_dirs:
+            slots = sorted(set(slots).union(self.slots_by_word.get((dst_lang, word), [])))
+        else:
+            slots = list(slots)
+
+        result = []
+        for slot in slots:
+            w1 = self.words[self.src_word_ids[slot]]
+            w2 = self.words[self.dst_word_ids[slot]]
+            if inversed:
+                w1, w2 = w2, w1
+            if w1[LANG] != src_lang or w2[LANG] != dst_lang:
+                continue
+            if w1[WORD] != word and not (both_dirs and w2[WORD] == word):
+                continue
+            result.append({
+                "translation_id": self.translation_ids[slot],
+                "word": w1[WORD],
+                "pos": w1[POS],
+                "exc_verb": w1[EXC_VERB],
+                "comment": w1[COMMENT],
+                "translation_word": w2[WORD],
+                "translation_pos": w2[POS],
+                "translation_comment": w2[COMMENT],
+            })
+            if len(result) >= limit:
+                break
+        return result
@@ -0,0 +1,210 @@
+from bisect import bisect_left
+from functools import wraps
+import threading
+import time
+
+
+# Upper bounds in seconds, roughly exponential from 100us to 10s
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0,
+)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram(object):
+    """
+    Fixed buckets, quantiles are estimated by linear interpolation inside a bucket.
+    Not thread-safe on its own, guarded by the lock of `Metrics`.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # the last counter is for values above the largest bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count == 0:
+                continue
+            if seen + bucket_count >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for name, value in labels:
+        escaped = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        parts.append(f"{name}=\"{escaped}\"")
+    return "{" + ",".join(parts) + "}"
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class Metrics(object):
+    """
+    Process-wide registry of counters and latency histograms.
+
+    Series are addressed by a metric name and a tuple of (label, value) pairs.
+    Histograms are exposed as Prometheus summaries with p50/p95/p99 estimated from the buckets.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        # name -> help text
+        self.help = dict()
+        # name -> {labels -> value}
+        self.counters = dict()
+        # name -> {labels -> Histogram}
+        self.histograms = dict()
+
+    def describe(self, name, help_text):
+        self.help[name] = help_text
+
+    def inc(self, name, labels=(), amount=1):
+        with self.lock:
+            series = self.counters.get(name)
+            if series is None:
+                series = dict()
+                self.counters[name] = series
+            series[labels] = series.get(labels, 0) + amount
+
+    def observe(self, name, labels, value):
+        with self.lock:
+            series = self.histograms.get(name)
+            if series is None:
+                series = dict()
+                self.histograms[name] = series
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = Histogram(self.buckets)
+                series[labels] = histogram
+            histogram.observe(value)
+
+    # Decorator timing a function into histogram `name`
+    def timed(self, name, labels):
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(name, labels, time.perf_counter() - started)
+            return wrapper
+        return decorator
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name in sorted(self.counters):
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(self.counters[name].items()):
+                    lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+            for name in sorted(self.histograms):
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} summary")
+                for labels, histogram in sorted(self.histograms[name].items()):
+                    for q in QUANTILES:
+                        quantile_labels = labels + (("quantile", q),)
+                        lines.append(f"{name}{format_labels(quantile_labels)} {format_value(histogram.quantile(q))}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {format_value(histogram.sum)}")
+                    lines.append(f"{name}_count{format_labels(labels)} {format_value(histogram.count)}")
+        lines.append("")
+        return "\n".join(lines)
+
+
+class TimedLock(object):
+    """
+    Wraps a lock and records how long callers wait to acquire it and how long they hold it.
+    Supports the `with` statement only, same as the plain lock it replaces.
+    """
+
+    def __init__(self, lock, metrics, name):
+        self.lock = lock
+        self.metrics = metrics
+        self.wait_name = f"{name}_wait_seconds"
+        self.hold_name = f"{name}_hold_seconds"
+        self.local = threading.local()
+
+    def __enter__(self):
+        started = time.perf_counter()
+        self.lock.acquire()
+        acquired = time.perf_counter()
+        self.local.acquired = acquired
+        self.metrics.observe(self.wait_name, (), acquired - started)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        held = time.perf_counter() - self.local.acquired
+        self.lock.release()
+        self.metrics.observe(self.hold_name, (), held)
+        return False
+
+
+def count_rows(result):
+    if isinstance(result, (list, dict)):
+        return len(result)
+    if isinstance(result, tuple) and len(result) > 0 and isinstance(result[0], (list, dict)):
+        return len(result[0])
+    return None
+
+
+# Replaces every `do_*` method of the object with a wrapper recording its latency and returned rows
+def instrument_methods(obj, metrics, prefix="do_"):
+    for name in dir(type(obj)):
+        if not name.startswith(prefix):
+            continue
+        method = getattr(obj, name)
+        if not callable(method):
+            continue
+        setattr(obj, name, instrument_method(method, metrics, name))
+
+
+def instrument_method(method, metrics, name):
+    labels = (("method", name),)
+
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        result = None
+        try:
+            result = method(*args, **kwargs)
+            return result
+        finally:
+            metrics.observe("gc_db_method_seconds", labels, time.perf_counter() - started)
+            metrics.inc("gc_db_method_calls_total", labels)
+            rows = count_rows(result)
+            if rows is not None:
+                metrics.inc("gc_db_method_rows_total", labels, rows)
+    return wrapper
@@ -0,0 +1,264 @@
+import logging
+import time
+
+from lib.ranking import ALLTIME_START, SECONDS_PER_DAY, contrib_day
+
+# Daily contrib buckets are created for this many days back, older ones are rolled off anyway
+CONTRIB_DAYS_BACKFILL = 8
+
+
+def rebuild_translation_groups(conn):
+    conn.execute("DELETE FROM translation_groups;")
+    conn.execute("""
+INSERT INTO translation_groups (word_id, lang, word, tr_words, tr_pos, tr_comment)
+SELECT
+    w3.word_id,
+    w4.lang,
+    w3.word,
+    GROUP_CONCAT(w4.word, "|"),
+    GROUP_CONCAT(w4.pos, "|"),
+    GROUP_CONCAT(w4.comment, "|")
+FROM
+    words w3
+JOIN
+    translations t ON w3.word_id = t.word_id
+JOIN
+    words w4 ON t.translated_word_id = w4.word_id
+GROUP BY w3.word_id, w4.lang
+    """.strip())
+
+
+def rebuild_review_vote_counts(conn):
+    conn.execute("DELETE FROM review_vote_counts;")
+    conn.execute("""
+INSERT INTO review_vote_counts (review_id, approves, disapproves)
+SELECT
+    review_id,
+    COUNT(CASE WHEN vote = "APPROVE" THEN 1 END),
+    COUNT(CASE WHEN vote = "DISAPPROVE" THEN 1 END)
+FROM review_votes
+GROUP BY review_id
+    """.strip())
+
+
+def rebuild_contrib_counts(conn):
+    conn.execute("DELETE FROM contrib_counts_alltime;")
+    conn.execute("""
+INSERT INTO contrib_counts_alltime (user_id, contribs, translations, approves, disapproves)
+SELECT
+    user_id,
+    COUNT(*),
+    COUNT(CASE WHEN action = "ADD_TRANSLATION" THEN 1 END),
+    COUNT(CASE WHEN action = "APPROVE_CONFIRMED" THEN 1 END),
+    COUNT(CASE WHEN action = "DISAPPROVE_CONFIRMED" THEN 1 END)
+FROM contribs
+WHERE created_at > DATETIME(?, 'unixepoch')
+GROUP BY user_id
+    """.strip(), (ALLTIME_START,))
+    conn.execute("DELETE FROM contrib_counts_daily;")
+    first_day = contrib_day(int(time.time())) - CONTRIB_DAYS_BACKFILL
+    conn.execute("""
+INSERT INTO contrib_counts_daily (day, user_id, contribs, translations, approves, disapproves)
+SELECT
+    CAST(strftime('%s', created_at) AS INTEGER) / ? AS day,
+    user_id,
+    COUNT(*),
+    COUNT(CASE WHEN action = "ADD_TRANSLATION" THEN 1 END),
+    COUNT(CASE WHEN action = "APPROVE_CONFIRMED" THEN 1 END),
+    COUNT(CASE WHEN action = "DISAPPROVE_CONFIRMED" THEN 1 END)
+FROM contribs
+WHERE created_at >= DATETIME(?, 'unixepoch')
+GROUP BY day, user_id
+    """.strip(), (SECONDS_PER_DAY, first_day * SECONDS_PER_DAY))
+
+
+# Recomputes tables that are maintained incrementally from the source tables,
+# e.g. after rows were inserted in bulk bypassing Gc
+def rebuild_derived_tables(conn):
+    rebuild_translation_groups(conn)
+    rebuild_review_vote_counts(conn)
+    rebuild_contrib_counts(conn)
+    conn.commit()
+
+
+def create_translation_groups(conn):
+    # Existing translations grouped per word and language, maintained by do_add_translation
+    conn.execute("DROP TABLE IF EXISTS translation_groups;")
+    conn.execute("""
+CREATE TABLE translation_groups (
+    word_id INTEGER NOT NULL,
+    lang TEXT NOT NULL,
+    word TEXT NOT NULL,
+    tr_words TEXT NOT NULL,
+    tr_pos TEXT NOT NULL,
+    tr_comment TEXT NOT NULL,
+    PRIMARY KEY (word_id, lang)
+)
+    """.strip())
+    conn.execute("CREATE INDEX idx_translation_groups_word ON translation_groups(word, lang);")
+    rebuild_translation_groups(conn)
+
+
+def create_review_vote_counts(conn):
+    # Maintained by do_add_review_vote/do_retract_review_vote, so listings don't aggregate review_votes
+    conn.execute("DROP TABLE IF EXISTS review_vote_counts;")
+    conn.execute("""
+CREATE TABLE review_vote_counts (
+    review_id INTEGER PRIMARY KEY,
+    approves INTEGER NOT NULL DEFAULT 0,
+    disapproves INTEGER NOT NULL DEFAULT 0
+)
+    """.strip())
+    rebuild_review_vote_counts(conn)
+
+
+def create_lookup_indexes(conn):
+    # Lookups always filter on both columns, the single column index is a prefix of the new one
+    conn.execute("DROP INDEX IF EXISTS idx_word;")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_word_lang ON words(word, lang);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reviews_status_created ON reviews(status, created_at, review_id);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reviews_word ON reviews(word_id);")
+
+
+def create_contrib_indexes(conn):
+    # Rowid is the implicit last column, so these are also ordered by contrib_id
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_contribs_translation ON contribs(translation_id);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_contribs_review ON contribs(review_id);")
+    # Covers rebuild_contrib_counts, which reads ranges of created_at when the running counters are rebuilt
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_contribs_created ON contribs(created_at, user_id, action);")
+
+
+def create_contrib_counts(conn):
+    # Running per-user counters for the rankings, maintained by insert_contrib_entries/insert_disapprove_contrib_entries
+    conn.execute("DROP TABLE IF EXISTS contrib_counts_alltime;")
+    conn.execute("""
+CREATE TABLE contrib_counts_alltime (
+    user_id INTEGER PRIMARY KEY,
+    contribs INTEGER NOT NULL DEFAULT 0,
+    translations INTEGER NOT NULL DEFAULT 0,
+    approves INTEGER NOT NULL DEFAULT 0,
+    disapproves INTEGER NOT NULL DEFAULT 0
+)
+    """.strip())
+    # Same counters per day, the days before the weekly window are rolled off by do_calculate_rankings
+    conn.execute("DROP TABLE IF EXISTS contrib_counts_daily;")
+    conn.execute("""
+CREATE TABLE contrib_counts_daily (
+    day INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    contribs INTEGER NOT NULL DEFAULT 0,
+    translations INTEGER NOT NULL DEFAULT 0,
+    approves INTEGER NOT NULL DEFAULT 0,
+    disapproves INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, user_id)
+)
+    """.strip())
+    rebuild_contrib_counts(conn)
+
+
+def create_contrib_collector_state(conn):
+    # Last translation/review processed by Gc.collect_range, starts where the previous collector stopped
+    conn.execute("""
+CREATE TABLE IF NOT EXISTS contrib_collector_state (
+    name TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL
+)
+    """.strip())
+    conn.execute("""
+INSERT OR REPLACE INTO contrib_collector_state (name, last_id)
+SELECT "translations", IFNULL(MAX(translation_id), 0) FROM contribs
+    """.strip())
+    conn.execute("""
+INSERT OR REPLACE INTO contrib_collector_state (name, last_id)
+SELECT "review_disapproves", IFNULL(MAX(review_id), 0) FROM contribs
+    """.strip())
+
+
+# Tables that conditional GET responses are built from, changes by any writer bump their row in data_versions
+VERSIONED_TABLES = (
+    "translations",
+    "ranking_alltime",
+    "ranking_week",
+    "downloads",
+    "verb_form_examples",
+    "clips",
+)
+
+
+def create_data_versions(conn):
+    conn.execute("""
+CREATE TABLE IF NOT EXISTS data_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL
+)
+    """.strip())
+    add_data_versions(conn, VERSIONED_TABLES)
+
+
+def add_data_versions(conn, tables):
+    for table in tables:
+        conn.execute("""
+INSERT OR IGNORE INTO data_versions (name, version, updated_at)
+VALUES (?, 1, CAST(strftime('%s', 'now') AS INTEGER))
+        """.strip(), (table,))
+        # Triggers rather than calls in Gc, downloads/clips/verb forms are loaded by scripts
+        for operation in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(f"""
+CREATE TRIGGER IF NOT EXISTS data_version_{table}_{operation.lower()} AFTER {operation} ON {table}
+BEGIN
+    UPDATE data_versions
+    SET version = version + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER)
+    WHERE name = '{table}';
+END
+            """.strip())
+
+
+# Subtitles are loaded by scripts, cached indexes of a video are dropped when the table changes
+def create_subtitles_data_version(conn):
+    add_data_versions(conn, ("subtitles",))
+
+
+# Books are loaded by scripts, cached books are dropped when the table changes
+def create_book_chunks_data_version(conn):
+    add_data_versions(conn, ("book_chunks",))
+
+
+# Schema version N is reached by applying MIGRATIONS[N - 1], the version is kept in PRAGMA user_version.
+# Append only, never edit a migration that may have been applied somewhere.
+MIGRATIONS = [
+    create_translation_groups,
+    create_review_vote_counts,
+    create_lookup_indexes,
+    create_contrib_indexes,
+    create_contrib_counts,
+    create_contrib_collector_state,
+    create_data_versions,
+    create_subtitles_data_version,
+    create_book_chunks_data_version,
+]
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version;").fetchone()[0]
+
+
+# Applies pending migrations, each in its own transaction. Returns the resulting version.
+def migrate(conn):
+    version = get_schema_version(conn)
+    if version > len(MIGRATIONS):
+        raise RuntimeError(f"Database schema version {version} is newer than the code knows ({len(MIGRATIONS)})")
+    for index in range(version, len(MIGRATIONS)):
+        migration = MIGRATIONS[index]
+        conn.commit()
+        try:
+            conn.execute("BEGIN;")
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {index + 1};")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logging.exception("Migration %d (%s) failed", index + 1, migration.__name__)
+            raise
+        logging.info("Applied migration %d: %s", index + 1, migration.__name__)
+    return len(MIGRATIONS)
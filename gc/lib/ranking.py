@@ -0,0 +1,30 @@
+from lib.contrib import ContribAction
+
+
+SECONDS_PER_DAY = 24 * 60 * 60
+# Contribs before this moment don't count towards the all-time ranking
+ALLTIME_START = 1701613211
+
+
+# Daily buckets are numbered by days since unix epoch in UTC
+def contrib_day(timestamp):
+    return timestamp // SECONDS_PER_DAY
+
+
+# Returns dict: (day, user_id) -> [contribs, translations, approves, disapproves]
+def count_contribs(entries):
+    counts = dict()
+    for e in entries:
+        key = (contrib_day(e.created_at), e.user_id)
+        row = counts.get(key)
+        if row is None:
+            row = [0, 0, 0, 0]
+            counts[key] = row
+        row[0] += 1
+        if e.action == ContribAction.ADD_TRANSLATION:
+            row[1] += 1
+        elif e.action == ContribAction.APPROVE_CONFIRMED:
+            row[2] += 1
+        elif e.action == ContribAction.DISAPPROVE_CONFIRMED:
+            row[3] += 1
+    return counts
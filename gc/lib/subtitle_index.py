@@ -0,0 +1,51 @@
+from bisect import bisect_right
+import sys
+
+from lib.cache import estimate_size
+
+
+class SubtitleIndex(object):
+    """
+    Cues of one video sorted by start, with a segment tree of maximum end times over them.
+
+    Cues overlapping [start_ms, end_ms] start at or before `end_ms`, which is a prefix of the sorted
+    cues found by bisection, and end at or after `start_ms`, which the tree finds without visiting
+    subtrees ending earlier. A query costs O(log n) per returned cue, however long the cues are.
+    """
+
+    def __init__(self, cues):
+        # dicts with at least start_ms and end_ms, sorted by start_ms
+        self.cues = cues
+        self.starts = [cue["start_ms"] for cue in cues]
+        self.leaves = 1
+        while self.leaves < len(cues):
+            self.leaves *= 2
+        # Node i covers children 2i and 2i + 1, leaves start at `leaves`, -1 marks an empty leaf
+        self.max_ends = [-1] * (2 * self.leaves)
+        for i, cue in enumerate(cues):
+            self.max_ends[self.leaves + i] = cue["end_ms"]
+        for node in range(self.leaves - 1, 0, -1):
+            self.max_ends[node] = max(self.max_ends[2 * node], self.max_ends[2 * node + 1])
+        self.size = estimate_size(self.cues) + estimate_size(self.starts) + sys.getsizeof(self.max_ends)
+
+    # Lets the response cache account for the whole index
+    def __sizeof__(self):
+        return self.size
+
+    # Returns up to `limit` cues overlapping [start_ms, end_ms] in order of start
+    def overlapping(self, start_ms, end_ms, limit):
+        end = bisect_right(self.starts, end_ms)
+        result = []
+        if end > 0:
+            self.collect(1, 0, self.leaves, end, start_ms, limit, result)
+        return result
+
+    def collect(self, node, lo, hi, end, start_ms, limit, result):
+        if lo >= end or len(result) >= limit or self.max_ends[node] < start_ms:
+            return
+        if node >= self.leaves:
+            result.append(self.cues[lo])
+            return
+        mid = (lo + hi) // 2
+        self.collect(2 * node, lo, mid, end, start_ms, limit, result)
+        self.collect(2 * node + 1, mid, hi, end, start_ms, limit, result)
@@ -0,0 +1,141 @@
+from contextlib import contextmanager
+import logging
+import threading
+import time
+
+
+# Granularity of waiting for writers to join a group
+WAIT_STEP_SECS = 0.0002
+
+
+class WriteGroup(object):
+    def __init__(self):
+        self.size = 0
+        self.callbacks = []
+        self.error = None
+        self.done = threading.Event()
+
+
+class WriteCoordinator(object):
+    """
+    Runs logical write operations on the writer connection and commits them in groups.
+
+    Each operation runs in its own savepoint, so a failing one is rolled back alone. The first operation
+    of a group waits up to `window_secs` without holding the lock while other writers are in flight,
+    letting them join, then commits once for all of them. A lone writer commits right away.
+
+    A full group stops taking operations, but the next group starts in the same transaction, so a commit
+    covers every group in it and a failed commit fails all of them. Every operation returns only after
+    its group is committed. Work that must not be visible before the commit, like cache invalidation,
+    is registered with `after_commit`.
+    """
+
+    def __init__(self, conn, lock, metrics, window_secs, max_group_size):
+        self.conn = conn
+        self.lock = lock
+        self.metrics = metrics
+        self.window_secs = window_secs
+        self.max_group_size = max_group_size
+        # Group open for new operations, guarded by `lock`
+        self.group = None
+        # Groups with operations in the open transaction, in order, guarded by `lock`
+        self.pending_groups = []
+        # Operations started but not finished yet, including ones waiting for the lock
+        self.in_flight = 0
+        self.in_flight_lock = threading.Lock()
+        # after-commit callbacks of the operation running in this thread, None outside operations
+        self.local = threading.local()
+
+    @contextmanager
+    def operation(self):
+        if getattr(self.local, "callbacks", None) is not None:
+            # Nested operations are part of the enclosing one
+            yield
+            return
+
+        leader = False
+        self.add_in_flight(1)
+        try:
+            with self.lock:
+                group = self.group
+                leader = group is None
+                if leader:
+                    group = WriteGroup()
+                    self.group = group
+                    self.pending_groups.append(group)
+                group.size += 1
+                if group.size >= self.max_group_size:
+                    self.group = None
+                if not self.conn.in_transaction:
+                    self.conn.execute("BEGIN;")
+                self.conn.execute("SAVEPOINT operation;")
+                self.local.callbacks = []
+                try:
+                    yield
+                except BaseException:
+                    self.conn.execute("ROLLBACK TO operation;")
+                    self.conn.execute("RELEASE operation;")
+                    raise
+                else:
+                    self.conn.execute("RELEASE operation;")
+                    group.callbacks.extend(self.local.callbacks)
+                finally:
+                    self.local.callbacks = None
+        except BaseException:
+            self.add_in_flight(-1)
+            # Operations of others may have joined the group meanwhile
+            if leader:
+                self.commit_group(group)
+            raise
+        self.add_in_flight(-1)
+
+        if leader:
+            self.commit_group(group)
+        else:
+            group.done.wait()
+        if group.error is not None:
+            raise group.error
+
+    def add_in_flight(self, delta):
+        with self.in_flight_lock:
+            self.in_flight += delta
+
+    def commit_group(self, group):
+        deadline = time.perf_counter() + self.window_secs
+        while self.in_flight > 0 and group.size < self.max_group_size and time.perf_counter() < deadline:
+            time.sleep(WAIT_STEP_SECS)
+        with self.lock:
+            if group.done.is_set():
+                # Committed together with an earlier group of the same transaction
+                return
+            groups = self.pending_groups
+            self.pending_groups = []
+            self.group = None
+            size = sum(pending.size for pending in groups)
+            try:
+                self.conn.commit()
+            except Exception as e:
+                logging.exception("WriteCoordinator: failed to commit %d operations of %d groups", size, len(groups))
+                self.conn.rollback()
+                for pending in groups:
+                    pending.error = e
+            else:
+                for pending in groups:
+                    for callback in pending.callbacks:
+                        try:
+                            callback()
+                        except Exception:
+                            logging.exception("WriteCoordinator: after-commit callback failed")
+            finally:
+                for pending in groups:
+                    pending.done.set()
+        self.metrics.inc("gc_write_commits_total")
+        self.metrics.inc("gc_write_operations_total", (), size)
+
+    # Runs `callback` once the current operation is committed, right away outside operations
+    def after_commit(self, callback):
+        callbacks = getattr(self.local, "callbacks", None)
+        if callbacks is None:
+            callback()
+        else:
+            callbacks.append(callback)
@@ -0,0 +1,518 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+
+# The benchmark drives the app in-process, so it needs `lib` from the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib import gcapp
+from lib.migrations import rebuild_derived_tables
+
+
+SYLLABLES = [
+    "ба", "бе", "да", "де", "жа", "же", "қа", "ке", "ла", "ле",
+    "ма", "ме", "на", "не", "са", "се", "та", "те", "ша", "ше",
+    "ар", "ер", "ал", "ел", "ан", "ен", "ық", "ік", "ым", "ім",
+    "ра", "ре", "ғы", "гі", "ты", "ті", "ұл", "үл", "от", "өт",
+]
+POS_TAGS = ["NOUN", "VERB", "ADJ", "ADV", "PRON", "NUM"]
+INSERT_CHUNK_SIZE = 50000
+# Languages are assigned by word_id modulo 20: 10 kk, 7 ru, 3 en
+KK_SLOTS = 10
+RU_SLOTS = 7
+MODULO = 20
+USERS = 1000
+BOOK_ID = 1001
+BOOK_CHUNKS = 2000
+VIDEOS = 50
+SUBTITLES_PER_VIDEO = 600
+CLIPS = 500
+VERBS = 200
+BENCH_TOKEN = "Bearer bench"
+
+
+def word_lang(word_id):
+    slot = word_id % MODULO
+    if slot < KK_SLOTS:
+        return "kk"
+    if slot < KK_SLOTS + RU_SLOTS:
+        return "ru"
+    return "en"
+
+
+def random_word_id(rng, words, lang):
+    if lang == "kk":
+        first, size = 0, KK_SLOTS
+    elif lang == "ru":
+        first, size = KK_SLOTS, RU_SLOTS
+    else:
+        first, size = KK_SLOTS + RU_SLOTS, MODULO - KK_SLOTS - RU_SLOTS
+    while True:
+        word_id = rng.randrange(words // MODULO) * MODULO + first + rng.randrange(size)
+        if 0 < word_id <= words:
+            return word_id
+
+
+def make_word(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 5)))
+
+
+def make_timestamp(rng, now, max_age_secs):
+    return now - rng.randrange(max_age_secs)
+
+
+def insert_chunked(db_conn, query, rows):
+    cursor = db_conn.cursor()
+    chunk = []
+    total = 0
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= INSERT_CHUNK_SIZE:
+            cursor.executemany(query, chunk)
+            total += len(chunk)
+            chunk = []
+    if chunk:
+        cursor.executemany(query, chunk)
+        total += len(chunk)
+    db_conn.commit()
+    cursor.close()
+    return total
+
+
+def generate(args):
+    assert not os.path.exists(args.db_path), f"path {args.db_path} already exists"
+    rng = random.Random(args.seed)
+    now = int(time.time())
+    year = 365 * 24 * 60 * 60
+    words = args.words
+    translations = args.translations or words
+    reviews = args.reviews or max(words // 50, 10)
+    started = time.time()
+
+    db_conn = gcapp.init_db_conn(args.db_path)
+    db_conn.execute("PRAGMA journal_mode=OFF;")
+    db_conn.execute("PRAGMA synchronous=OFF;")
+
+    def generate_users():
+        for user_id in range(1, USERS + 1):
+            yield (user_id, f"user{user_id}@example.com", 1, f"sub{user_id}", f"user{user_id}", "kk")
+
+    def generate_words():
+        for word_id in range(1, words + 1):
+            comment = "" if rng.random() < 0.9 else make_word(rng)
+            yield (word_id, make_word(rng), rng.choice(POS_TAGS), int(rng.random() < 0.05), comment,
+                rng.randint(1, USERS), word_lang(word_id), make_timestamp(rng, now, year))
+
+    def generate_translations():
+        for translation_id in range(1, translations + 1):
+            dst_lang = "ru" if rng.random() < 0.7 else "en"
+            yield (translation_id, random_word_id(rng, words, "kk"), random_word_id(rng, words, dst_lang), "",
+                rng.randint(1, USERS), make_timestamp(rng, now, year))
+
+    def generate_translation_votes():
+        for translation_id in range(1, translations + 1, 4):
+            for user_id in rng.sample(range(1, USERS + 1), rng.randint(1, 3)):
+                yield (translation_id, user_id, "APPROVE" if rng.random() < 0.8 else "DISAPPROVE")
+
+    def generate_reviews():
+        for review_id in range(1, reviews + 1):
+            status = "NEW" if rng.random() < 0.6 else rng.choice(["APPROVED", "DISAPPROVED", "DISCARDED"])
+            dst_lang = "ru" if rng.random() < 0.7 else "en"
+            yield (review_id, random_word_id(rng, words, "kk"), random_word_id(rng, words, dst_lang), "",
+                rng.randint(1, USERS), status, make_timestamp(rng, now, year))
+
+    def generate_review_votes():
+        for review_id in range(1, reviews + 1):
+            for user_id in rng.sample(range(1, USERS + 1), rng.randint(0, 3)):
+                yield (review_id, user_id, "APPROVE" if rng.random() < 0.7 else "DISAPPROVE")
+
+    def generate_contribs():
+        for translation_id in range(1, translations + 1):
+            yield (translation_id, 0, rng.randint(1, USERS), "ADD_TRANSLATION", make_timestamp(rng, now, year))
+            if rng.random() < 0.3:
+                yield (translation_id, 0, rng.randint(1, USERS), "APPROVE_CONFIRMED", make_timestamp(rng, now, year))
+        for review_id in range(1, reviews + 1, 5):
+            yield (0, review_id, rng.randint(1, USERS), "DISAPPROVE_CONFIRMED", make_timestamp(rng, now, year))
+
+    def generate_book_chunks():
+        for chunk_id in range(BOOK_CHUNKS):
+            yield (BOOK_ID, chunk_id, " ".join(make_word(rng) for _ in range(rng.randint(5, 40))))
+
+    def generate_subtitles():
+        for video in range(VIDEOS):
+            start_ms = 0
+            for _ in range(SUBTITLES_PER_VIDEO):
+                duration_ms = rng.randint(500, 6000)
+                content = " ".join(make_word(rng) for _ in range(rng.randint(2, 10)))
+                yield (f"video{video}", start_ms, start_ms + duration_ms, content, content)
+                start_ms += rng.randint(300, 6000)
+
+    def generate_clips():
+        for clip_id in range(1, CLIPS + 1):
+            yield (clip_id, f"video{clip_id % VIDEOS}", make_word(rng), make_word(rng), rng.randint(10, 600), "2024-01-01")
+
+    def generate_verb_form_examples():
+        for verb in range(VERBS):
+            for fe in (0, 1):
+                for neg in (0, 1):
+                    for form in range(20):
+                        yield (f"verb{verb}", fe, neg, f"form{form}", make_word(rng))
+
+    def generate_gpt4omini():
+        for word_id in range(1, words + 1, 10):
+            if word_lang(word_id) == "kk":
+                yield (word_id, "\n".join(make_word(rng) for _ in range(rng.randint(1, 4))))
+
+    steps = [
+        ("users", "INSERT INTO users (user_id, email, email_verified, sub, name, locale) VALUES (?, ?, ?, ?, ?, ?)",
+            generate_users()),
+        ("words", "INSERT INTO words (word_id, word, pos, exc_verb, comment, user_id, lang, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, DATETIME(?, 'unixepoch'))",
+            generate_words()),
+        ("translations", "INSERT INTO translations (translation_id, word_id, translated_word_id, reference, user_id, created_at) VALUES (?, ?, ?, ?, ?, DATETIME(?, 'unixepoch'))",
+            generate_translations()),
+        ("translation_votes", "INSERT OR IGNORE INTO translation_votes (translation_id, user_id, vote) VALUES (?, ?, ?)",
+            generate_translation_votes()),
+        ("reviews", "INSERT INTO reviews (review_id, word_id, translated_word_id, reference, user_id, status, created_at) VALUES (?, ?, ?, ?, ?, ?, DATETIME(?, 'unixepoch'))",
+            generate_reviews()),
+        ("review_votes", "INSERT OR IGNORE INTO review_votes (review_id, user_id, vote) VALUES (?, ?, ?)",
+            generate_review_votes()),
+        ("contribs", "INSERT INTO contribs (translation_id, review_id, user_id, action, created_at) VALUES (?, ?, ?, ?, DATETIME(?, 'unixepoch'))",
+            generate_contribs()),
+        ("book_chunks", "INSERT INTO book_chunks (book_id, chunk_id, content) VALUES (?, ?, ?)",
+            generate_book_chunks()),
+        ("subtitles", "INSERT OR IGNORE INTO subtitles (video_id, start_ms, end_ms, content, words) VALUES (?, ?, ?, ?, ?)",
+            generate_subtitles()),
+        ("clips", "INSERT INTO clips (clip_id, video_id, author, title, duration_secs, published_on) VALUES (?, ?, ?, ?, ?, ?)",
+            generate_clips()),
+        ("verb_form_examples", "INSERT INTO verb_form_examples (verb, fe, neg, form, example) VALUES (?, ?, ?, ?, ?)",
+            generate_verb_form_examples()),
+        ("gpt4omini", "INSERT INTO gpt4omini (word_id, translations) VALUES (?, ?)",
+            generate_gpt4omini()),
+        ("downloads", "INSERT INTO downloads (id, url, kkru, kken) VALUES (?, ?, ?, ?)",
+            iter([(1, "https://example.com/export.jsonl", translations // 2, translations // 4)])),
+    ]
+    for table, query, rows in steps:
+        step_started = time.time()
+        total = insert_chunked(db_conn, query, rows)
+        logging.info("Inserted %d rows into %s in %.1f secs", total, table, time.time() - step_started)
+
+    # Derived tables were created empty before the data
+    rebuild_derived_tables(db_conn)
+    db_conn.close()
+    logging.info("Generated %s in %.1f secs", args.db_path, time.time() - started)
+
+
+class Workload(object):
+    """
+    Request factories for every route, parameterized by a sample of existing rows.
+    Each factory takes a Random and returns (method, url, json body or None).
+    """
+
+    def __init__(self, db_path, sample_size, seed):
+        db_conn = sqlite3.connect(db_path)
+        db_conn.row_factory = sqlite3.Row
+        rng = random.Random(seed)
+        max_word_id = db_conn.execute("SELECT MAX(word_id) FROM words").fetchone()[0] or 0
+        max_review_id = db_conn.execute("SELECT MAX(review_id) FROM reviews").fetchone()[0] or 0
+        max_translation_id = db_conn.execute("SELECT MAX(translation_id) FROM translations").fetchone()[0] or 0
+        word_ids = [rng.randint(1, max_word_id) for _ in range(sample_size)] if max_word_id else []
+        self.words = dict()
+        self.word_ids = dict()
+        for row in self.fetch_in(db_conn, "SELECT word_id, word, lang FROM words WHERE word_id IN ({})", word_ids):
+            self.words.setdefault(row["lang"], []).append(row["word"])
+            self.word_ids.setdefault(row["lang"], []).append(row["word_id"])
+        self.review_ids = [rng.randint(1, max_review_id) for _ in range(sample_size)] if max_review_id else [1]
+        self.translation_ids = [rng.randint(1, max_translation_id) for _ in range(sample_size)] if max_translation_id else [1]
+        self.books = [row[0] for row in db_conn.execute("SELECT DISTINCT book_id FROM book_chunks LIMIT 10")] or [BOOK_ID]
+        self.videos = [row[0] for row in db_conn.execute("SELECT DISTINCT video_id FROM subtitles LIMIT 100")] or ["video0"]
+        self.verbs = [row[0] for row in db_conn.execute("SELECT DISTINCT verb FROM verb_form_examples LIMIT 100")] or ["verb0"]
+        self.gpt_word_ids = [row[0] for row in db_conn.execute("SELECT word_id FROM gpt4omini LIMIT 1000")] or [1]
+        db_conn.close()
+        for lang in ["kk", "ru", "en"]:
+            if not self.words.get(lang):
+                self.words[lang] = ["сөз"]
+                self.word_ids[lang] = [1]
+
+    @staticmethod
+    def fetch_in(db_conn, query, ids):
+        rows = []
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            rows.extend(db_conn.execute(query.format(", ".join(["?"] * len(chunk))), chunk).fetchall())
+        return rows
+
+    # Returns list of (route name, is write, factory)
+    def routes(self):
+        def get_translation(rng):
+            src, dst = rng.choice([("kk", "ru"), ("kk", "en"), ("ru", "kk"), ("en", "kk")])
+            word = rng.choice(self.words[src])
+            return "GET", f"/gcapi/v1/get_translation?src={src}&dst={dst}&both={rng.randint(0, 1)}&w={word}", None
+
+        def get_translations_batch(rng):
+            words = rng.sample(self.words["kk"], min(50, len(self.words["kk"])))
+            return "POST", "/gcapi/v1/get_translations_batch", {"src": "kk", "dst": "ru", "both": False, "words": words}
+
+        def get_translation_info(rng):
+            return "GET", f"/gcapi/v1/get_translation_info?tid={rng.choice(self.translation_ids)}", None
+
+        def get_words(rng):
+            lang = rng.choice(["kk", "ru", "en"])
+            return "GET", f"/gcapi/v1/get_words?w={rng.choice(self.words[lang])}&lang={lang}&wtrs={rng.randint(0, 1)}", None
+
+        def get_words_batch(rng):
+            words = rng.sample(self.words["kk"], min(50, len(self.words["kk"])))
+            return "POST", "/gcapi/v1/get_words_batch", {"lang": "kk", "wtrs": True, "words": words}
+
+        def get_reviews(rng):
+            src, dst = rng.choice([("kk", "ru"), ("kk", "en")])
+            return "GET", f"/gcapi/v2/get_reviews?src={src}&dst={dst}&o={rng.randint(0, 5) * 20}&c=20", None
+
+        def get_rankings(rng):
+            return "GET", "/gcapi/v1/get_rankings", None
+
+        def get_feed(rng):
+            return "GET", "/gcapi/v1/get_feed", None
+
+        def get_stats(rng):
+            return "GET", "/gcapi/v1/get_stats", None
+
+        def get_downloads(rng):
+            return "GET", "/gcapi/v1/get_downloads", None
+
+        def get_untranslated(rng):
+            return "GET", f"/gcapi/v1/get_untranslated?dst={rng.choice(['ru', 'en'])}", None
+
+        def get_llm_translations(rng):
+            return "GET", f"/gcapi/v1/get_llm_translations?wid={rng.choice(self.gpt_word_ids)}&model=gpt-4o-mini", None
+
+        def get_verb_form_examples(rng):
+            return "GET", f"/gcapi/v1/get_verb_form_examples?v={rng.choice(self.verbs)}&fe={rng.randint(0, 1)}&neg={rng.randint(0, 1)}", None
+
+        def get_book_chunks(rng):
+            return "GET", f"/gcapi/v1/get_book_chunks?book_id={rng.choice(self.books)}&offset={rng.randint(0, 1000)}&count=10", None
+
+        def get_book_page(rng):
+            offset = rng.randint(0, 900)
+            return "GET", f"/gcapi/v2/get_book_chunks?book_id={rng.choice(self.books)}&offset={offset}&count=100", None
+
+        def get_video_subtitles(rng):
+            start_ms = rng.randint(0, 600000)
+            return "GET", f"/gcapi/v1/get_video_subtitles?video_id={rng.choice(self.videos)}&start_ms={start_ms}&end_ms={start_ms + 30000}", None
+
+        def get_clips(rng):
+            return "GET", f"/gcapi/v1/get_clips?o={rng.randint(0, 10) * 20}&c=20", None
+
+        def add_word(rng):
+            return "POST", "/gcapi/v1/add_word", {"w": make_word(rng), "pos": "NOUN", "lang": "kk", "com": ""}
+
+        def add_translation(rng):
+            return "POST", "/gcapi/v1/add_translation", {
+                "src": rng.choice(self.word_ids["kk"]), "dst": rng.choice(self.word_ids["ru"]), "ref": ""}
+
+        def add_review(rng):
+            return "POST", "/gcapi/v1/add_review", {
+                "src": rng.choice(self.word_ids["kk"]), "dst": rng.choice(self.word_ids["ru"]), "ref": ""}
+
+        def add_review_vote(rng):
+            return "POST", "/gcapi/v1/add_review_vote", {"rid": rng.choice(self.review_ids), "v": "APPROVE"}
+
+        def retract_review_vote(rng):
+            return "POST", "/gcapi/v1/retract_review_vote", {"rid": rng.choice(self.review_ids), "v": "APPROVE"}
+
+        return [
+            ("get_translation", False, get_translation),
+            ("get_translations_batch", False, get_translations_batch),
+            ("get_translation_info", False, get_translation_info),
+            ("get_words", False, get_words),
+            ("get_words_batch", False, get_words_batch),
+            ("get_reviews", False, get_reviews),
+            ("get_rankings", False, get_rankings),
+            ("get_feed", False, get_feed),
+            ("get_stats", False, get_stats),
+            ("get_downloads", False, get_downloads),
+            ("get_untranslated", False, get_untranslated),
+            ("get_llm_translations", False, get_llm_translations),
+            ("get_verb_form_examples", False, get_verb_form_examples),
+            ("get_book_chunks", False, get_book_chunks),
+            ("get_video_subtitles", False, get_video_subtitles),
+            ("get_clips", False, get_clips),
+            ("add_word", True, add_word),
+            ("add_translation", True, add_translation),
+            ("add_review", True, add_review),
+            ("add_review_vote", True, add_review_vote),
+            ("retract_review_vote", True, retract_review_vote),
+            # Appended, so seeds of the routes above stay the same
+            ("get_book_page", False, get_book_page),
+        ]
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[index]
+
+
+def send(client, method, url, body):
+    if method == "GET":
+        return client.get(url, headers={"Authorization": BENCH_TOKEN})
+    return client.post(url, json=body, headers={"Authorization": BENCH_TOKEN})
+
+
+def bench_route(factory, requests_count, threads, seed):
+    local = threading.local()
+    latencies = [0.0] * requests_count
+    statuses = dict()
+    statuses_lock = threading.Lock()
+
+    def run_one(i):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = gcapp.app.test_client()
+            local.client = client
+        method, url, body = factory(random.Random(seed * 1000003 + i))
+        started = time.perf_counter()
+        response = send(client, method, url, body)
+        latencies[i] = time.perf_counter() - started
+        with statuses_lock:
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    if threads > 1:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(run_one, range(requests_count)))
+    else:
+        for i in range(requests_count):
+            run_one(i)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": requests_count,
+        "elapsed_secs": elapsed,
+        "rps": requests_count / elapsed if elapsed > 0 else 0.0,
+        "mean_ms": 1000.0 * sum(latencies) / len(latencies),
+        "p50_ms": 1000.0 * percentile(latencies, 0.5),
+        "p95_ms": 1000.0 * percentile(latencies, 0.95),
+        "p99_ms": 1000.0 * percentile(latencies, 0.99),
+        "max_ms": 1000.0 * latencies[-1],
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+def run(args):
+    assert os.path.exists(args.db_path), f"path {args.db_path} doesn't exist"
+    # Silence per-request logging of the app, it would dominate the measurements, also expected 4xx errors
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    gcapp.DATABASE_PATH = args.db_path
+    os.environ[gcapp.LEXICON_INDEX_ENV] = "0" if args.no_lexicon else "1"
+    if args.no_response_cache:
+        gcapp.RESPONSE_CACHE_MAX_ENTRIES = 0
+    init_started = time.perf_counter()
+    gcapp.init_gc_app()
+    init_secs = time.perf_counter() - init_started
+
+    workload = Workload(args.db_path, args.sample_size, args.seed)
+    results = dict()
+    for index, (name, is_write, factory) in enumerate(workload.routes()):
+        # Routes get distinct seeds, otherwise e.g. add_review would repeat pairs just added by add_translation
+        route_seed = args.seed * 1000 + index
+        if args.routes and name not in args.routes:
+            continue
+        if is_write and not args.writes:
+            continue
+        if args.warmup > 0:
+            bench_route(factory, args.warmup, 1, route_seed + 500)
+        results[name] = bench_route(factory, args.requests, args.threads, route_seed)
+        print(f"{name:<24} {results[name]['rps']:>9.1f} rps  p50 {results[name]['p50_ms']:8.3f} ms  "
+            f"p99 {results[name]['p99_ms']:8.3f} ms  {results[name]['statuses']}")
+
+    report = {
+        "label": args.label,
+        "created_at": int(time.time()),
+        "db_path": args.db_path,
+        "db_bytes": os.path.getsize(args.db_path),
+        "init_secs": init_secs,
+        "settings": {
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "threads": args.threads,
+            "seed": args.seed,
+            "writes": args.writes,
+            "lexicon": not args.no_lexicon,
+            "response_cache": not args.no_response_cache,
+        },
+        "cache_stats": gcapp.gc_instance.get_cache_stats(),
+        "routes": results,
+    }
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2, ensure_ascii=False)
+    print(f"Results saved to {args.output}")
+
+
+def compare(args):
+    with open(args.base) as base_file:
+        base = json.load(base_file)
+    with open(args.new) as new_file:
+        new = json.load(new_file)
+    print(f"{'route':<24} {'base rps':>10} {'new rps':>10} {'change':>8} {'base p99':>10} {'new p99':>10}")
+    for name, new_route in new["routes"].items():
+        base_route = base["routes"].get(name)
+        if base_route is None:
+            print(f"{name:<24} {'-':>10} {new_route['rps']:>10.1f}")
+            continue
+        change = 100.0 * (new_route["rps"] / base_route["rps"] - 1.0) if base_route["rps"] > 0 else 0.0
+        print(f"{name:<24} {base_route['rps']:>10.1f} {new_route['rps']:>10.1f} {change:>+7.1f}% "
+            f"{base_route['p99_ms']:>10.3f} {new_route['p99_ms']:>10.3f}")
+
+
+def main():
+    LOG_FORMAT = "%(asctime)s %(threadName)s %(message)s"
+    logging.basicConfig(format=LOG_FORMAT, level=logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers()
+
+    generate_parser = subparsers.add_parser("generate")
+    generate_parser.add_argument("--db-path", required=True)
+    generate_parser.add_argument("--words", type=int, default=100000)
+    generate_parser.add_argument("--translations", type=int, default=0, help="defaults to --words")
+    generate_parser.add_argument("--reviews", type=int, default=0, help="defaults to 2%% of --words")
+    generate_parser.add_argument("--seed", type=int, default=1)
+    generate_parser.set_defaults(func=generate)
+
+    run_parser = subparsers.add_parser("run")
+    run_parser.add_argument("--db-path", required=True)
+    run_parser.add_argument("--output", required=True)
+    run_parser.add_argument("--label", default="")
+    run_parser.add_argument("--requests", type=int, default=1000, help="requests per route")
+    run_parser.add_argument("--warmup", type=int, default=100, help="requests per route before measuring")
+    run_parser.add_argument("--threads", type=int, default=1)
+    run_parser.add_argument("--sample-size", type=int, default=5000, help="number of words to draw requests from")
+    run_parser.add_argument("--seed", type=int, default=1)
+    run_parser.add_argument("--routes", nargs="*", help="route names to run, all by default")
+    run_parser.add_argument("--writes", action="store_true", help="include routes modifying the database")
+    run_parser.add_argument("--no-lexicon", action="store_true")
+    run_parser.add_argument("--no-response-cache", action="store_true")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = subparsers.add_parser("compare")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,30 @@
 from lib import app, init_gc_app
+from lib.asgi import WsgiToAsgi
+from lib.auth import Auth
+from lib.cache import ResponseCache
+from lib.contrib import ContribAction, ContribEntry
+from lib.db_pool import DbPool
+from lib.feed import FeedItem, FeedRing
+from lib.metrics import Metrics
+from lib.migrations import rebuild_derived_tables
+from lib.gcapp import MAX_BATCH_WORDS, TRANSLATIONS_LIMIT, WEEK_SECONDS, Gc, init_db_conn
+import lib.gcapp as gcapp
+from lib.lexicon import LexiconIndex
+from lib.ranking import ALLTIME_START, SECONDS_PER_DAY, contrib_day
+from lib.review import ReviewVote
+from lib.subtitle_index import SubtitleIndex
+from lib.write_coordinator import WriteCoordinator
 
 from flask_testing import TestCase
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
 import unittest
+import unittest.mock
 
 
 class GcAppTestCase(TestCase):
@@ -27,6 +50,864 @@ class GcAppTestCase(TestCase):
         self.assert200(response)
         self.assertEqual(len(response.json["chunks"]), 10)
 
+    def test_get_book_chunks_v2_pages(self):
+        response = self.client.get("/gcapi/v2/get_book_chunks?book_id=1001&count=10")
+        self.assert200(response)
+        self.assertEqual(len(response.json["chunks"]), 10)
+        next_offset = response.json["next_offset"]
+        self.assertEqual(next_offset, response.json["chunks"][-1]["chunk_id"] + 1)
+        response = self.client.get(f"/gcapi/v2/get_book_chunks?book_id=1001&offset={next_offset}&count=10")
+        self.assert200(response)
+        self.assertEqual(response.json["chunks"][0]["chunk_id"], next_offset)
+
+    def test_get_downloads_not_modified(self):
+        response = self.client.get("/gcapi/v1/get_downloads")
+        self.assert200(response)
+        etag = response.headers["ETag"]
+        response = self.client.get("/gcapi/v1/get_downloads", headers={"If-None-Match": etag})
+        self.assertStatus(response, 304)
+        self.assertEqual(response.headers["ETag"], etag)
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = ResponseCache(2, 1 << 20)
+        cache.put("a", [1], 60, [], cache.begin())
+        cache.put("b", [2], 60, [], cache.begin())
+        self.assertEqual(cache.get("a"), [1])
+        cache.put("c", [3], 60, [], cache.begin())
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), [1])
+        self.assertEqual(cache.get("c"), [3])
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_invalidate_by_tag(self):
+        cache = ResponseCache(10, 1 << 20)
+        generation = cache.begin()
+        cache.put("a", [1], 60, ["word:kk:a"], generation)
+        cache.put("b", [2], 60, ["word:kk:b"], generation)
+        cache.invalidate("word:kk:a")
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), [2])
+        # Values loaded before an invalidation are not cached
+        cache.put("a", [1], 60, ["word:kk:a"], generation)
+        self.assertIsNone(cache.get("a"))
+
+
+class SubtitleIndexTestCase(unittest.TestCase):
+    def brute_force(self, cues, start_ms, end_ms, limit):
+        return [cue for cue in cues if cue["start_ms"] <= end_ms and cue["end_ms"] >= start_ms][:limit]
+
+    def test_equals_brute_force(self):
+        rng = random.Random(7)
+        for size in [0, 1, 2, 3, 5, 8, 13, 50]:
+            starts = sorted(rng.sample(range(1000), size))
+            cues = [{"start_ms": start, "end_ms": start + rng.choice([0, 1, 10, 300])} for start in starts]
+            index = SubtitleIndex(cues)
+            # Bounds of the cues make queries touching an interval at its edge
+            points = [-1, 0, 1001] + starts + [cue["end_ms"] for cue in cues]
+            for _ in range(200):
+                start_ms, end_ms = sorted([rng.choice(points), rng.choice(points)])
+                for limit in [1, 3, 100]:
+                    self.assertEqual(
+                        index.overlapping(start_ms, end_ms, limit),
+                        self.brute_force(cues, start_ms, end_ms, limit),
+                        f"{cues} [{start_ms}, {end_ms}] limit {limit}",
+                    )
+
+    def test_touching_edges(self):
+        cues = [{"start_ms": 0, "end_ms": 100}, {"start_ms": 100, "end_ms": 200}, {"start_ms": 300, "end_ms": 400}]
+        index = SubtitleIndex(cues)
+        self.assertEqual(index.overlapping(100, 100, 10), cues[:2])
+        self.assertEqual(index.overlapping(200, 300, 10), cues[1:])
+        self.assertEqual(index.overlapping(201, 299, 10), [])
+        self.assertEqual(index.overlapping(0, 400, 2), cues[:2])
+
+
+class AsgiTestCase(unittest.TestCase):
+    def request(self, method, path, body=b"", messages=None):
+        adapter = WsgiToAsgi(app, 2, 16)
+        scope = {"type": "http", "method": method, "path": path, "query_string": b"", "headers": []}
+        if messages is None:
+            messages = [{"type": "http.request", "body": body, "more_body": False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(adapter(scope, receive, send))
+        adapter.executor.shutdown()
+        if not sent:
+            return None, None
+        return sent[0]["status"], b"".join(message.get("body", b"") for message in sent[1:])
+
+    def test_get_test_path(self):
+        status, body = self.request("GET", "/gcapi/v1/test")
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), {"message": "You've reached GC!"})
+
+    def test_body_too_large(self):
+        status, _ = self.request("POST", "/gcapi/v1/check_user", b"x" * 17)
+        self.assertEqual(status, 413)
+
+    def test_disconnect_before_body_end(self):
+        messages = [
+            {"type": "http.request", "body": b"{", "more_body": True},
+            {"type": "http.disconnect"},
+        ]
+        # The app is not called with the truncated body, so nothing is sent
+        status, _ = self.request("POST", "/gcapi/v1/check_user", messages=messages)
+        self.assertIsNone(status)
+
+
+class FailingCommitConnection(sqlite3.Connection):
+    fail_commits = 0
+
+    def commit(self):
+        if self.fail_commits > 0:
+            self.fail_commits -= 1
+            raise sqlite3.OperationalError("disk I/O error")
+        super().commit()
+
+
+class WriteCoordinatorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:", check_same_thread=False, factory=FailingCommitConnection)
+        self.conn.execute("CREATE TABLE items (name TEXT NOT NULL)")
+        self.writes = WriteCoordinator(self.conn, threading.Lock(), Metrics(), 0.0, 64)
+
+    def names(self):
+        return [row[0] for row in self.conn.execute("SELECT name FROM items ORDER BY name")]
+
+    def test_failed_operation_is_rolled_back_alone(self):
+        committed = []
+        with self.writes.operation():
+            self.conn.execute("INSERT INTO items VALUES ('a')")
+            self.writes.after_commit(lambda: committed.append(self.conn.in_transaction))
+        with self.assertRaises(ValueError):
+            with self.writes.operation():
+                self.conn.execute("INSERT INTO items VALUES ('b')")
+                self.writes.after_commit(lambda: committed.append("b"))
+                raise ValueError("b")
+        self.assertEqual(self.names(), ["a"])
+        self.assertEqual(committed, [False])
+        self.assertFalse(self.conn.in_transaction)
+
+    def test_failed_commit_fails_every_group_of_the_transaction(self):
+        writes = WriteCoordinator(self.conn, threading.Lock(), Metrics(), 0.0, 1)
+        committed = []
+        errors = []
+
+        def insert(name):
+            try:
+                with writes.operation():
+                    self.conn.execute("INSERT INTO items VALUES (?)", (name,))
+                    writes.after_commit(lambda: committed.append(name))
+            except sqlite3.OperationalError:
+                errors.append(name)
+
+        commit_group = writes.commit_group
+        delayed = []
+
+        # The first group is full, so "b" starts the next group in the same transaction before it commits
+        def delayed_commit_group(group):
+            if not delayed:
+                delayed.append(group)
+                thread = threading.Thread(target=insert, args=("b",))
+                thread.start()
+                thread.join(5)
+            commit_group(group)
+
+        writes.commit_group = delayed_commit_group
+        self.conn.fail_commits = 1
+        insert("a")
+        self.assertEqual(sorted(errors), ["a", "b"])
+        self.assertEqual(committed, [])
+        self.assertEqual(self.names(), [])
+        self.assertFalse(self.conn.in_transaction)
+
+        insert("c")
+        self.assertEqual(committed, ["c"])
+        self.assertEqual(self.names(), ["c"])
+
+
+class FeedRingTestCase(unittest.TestCase):
+    def feed_item(self, translation_id, created_at):
+        return FeedItem("a", "сөз", "kk", "слово", "ru", translation_id, [], created_at)
+
+    def test_order_limit_and_expiry(self):
+        ring = FeedRing(100, 2)
+        ring.reset([self.feed_item(1, 1000), self.feed_item(2, 1050)])
+        items, version = ring.snapshot(1060)
+        self.assertEqual([item.translation_id for item in items], [2, 1])
+
+        ring.upsert(self.feed_item(3, 1070))
+        items, new_version = ring.snapshot(1070)
+        self.assertEqual([item.translation_id for item in items], [3, 2])
+        self.assertNotEqual(version, new_version)
+
+        items, version = ring.snapshot(1070)
+        self.assertEqual(version, new_version)
+
+        items, version = ring.snapshot(1160)
+        self.assertEqual([item.translation_id for item in items], [3])
+        self.assertNotEqual(version, new_version)
+
+
+# Statement fragment -> why scanning the whole table is fine there
+ALLOWED_SCANS = {
+    "FROM ranking_": "ranking tables hold at most 20 rows",
+    "FROM contrib_counts_alltime c": "one row per user, sorted to pick the top 20",
+    "FROM downloads ORDER BY id DESC": "reads the last rows by rowid",
+    "FROM clips ORDER BY clip_id LIMIT": "offset pages read rows by rowid, cursors don't scan",
+    "COUNT(CASE WHEN en_count > 0": "stats aggregate all translations, the result is cached",
+    "NOT EXISTS": "untranslated pools are built once per language",
+}
+
+
+class GcTestCase(unittest.TestCase):
+    """
+    Gc over a fresh database in a temporary directory, with users 1 and 2.
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(self.temp_dir.name, "gc.db")
+        self.db_conn = init_db_conn(db_path)
+        self.db_conn.execute("""
+            INSERT INTO users (user_id, email, email_verified, sub, name, locale) VALUES (1, "a@b.kz", 1, "sub", "a", "kk");
+        """)
+        self.db_conn.execute("""
+            INSERT INTO users (user_id, email, email_verified, sub, name, locale) VALUES (2, "b@b.kz", 1, "sub2", "b", "kk");
+        """)
+        self.db_conn.commit()
+        self.db_pool = DbPool(db_path, self.db_conn)
+        self.gc = Gc(self.db_pool, Auth(), self.make_lexicon())
+
+    def make_lexicon(self):
+        return None
+
+    # Writes like a script would, through its own connection
+    def script_execute(self, statement, params):
+        conn = sqlite3.connect(os.path.join(self.temp_dir.name, "gc.db"))
+        conn.execute(statement, params)
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        self.db_pool.close()
+        self.temp_dir.cleanup()
+
+
+class QueryPlanTestCase(GcTestCase):
+    """
+    Records every statement the Gc methods issue and checks that none of them scans a whole table.
+    """
+
+    def exercise(self):
+        gc = self.gc
+        gc.load_feed()
+        kk = gc.add_word("сөз", "NOUN", False, "kk", "", 1)
+        ru = gc.add_word("слово", "NOUN", False, "ru", "", 1)
+        ru2 = gc.add_word("речь", "NOUN", False, "ru", "", 1)
+        gc.add_translation(kk, ru, "", 1)
+        review_id = gc.add_review(kk, ru2, "", 1).inserted_id
+        for both_dirs in [False, True]:
+            gc.get_translations("kk", "ru", both_dirs, "сөз")
+            gc.get_translations("ru", "kk", both_dirs, "слово")
+            gc.get_translations_batch("kk", "ru", both_dirs, ["сөз", "сөздер"])
+            gc.get_translations_batch("ru", "kk", both_dirs, ["слово", "слова"])
+        gc.get_translation_info(1)
+        for with_translations in [False, True]:
+            gc.get_words("сөз", "kk", with_translations)
+            gc.get_words_batch(["сөз", "сөздер"], "kk", with_translations)
+        for after in [None, (1, 1)]:
+            gc.get_reviews(1, 0, 0, 20, after)
+            gc.get_reviews_by_dir(1, "kk", "ru", 0, 20, after)
+        gc.add_review_vote(review_id, 1, ReviewVote.APPROVE)
+        gc.retract_review_vote(review_id, 1, ReviewVote.APPROVE)
+        gc.add_review_vote(review_id, 1, ReviewVote.DISAPPROVE)
+        gc.discard_review(review_id, 1)
+        gc.collect_contribs()
+        gc.collect_disapprove_contribs()
+        gc.calculate_rankings()
+        gc.get_rankings()
+        gc.get_feed()
+        gc.get_stats()
+        gc.get_data_version(("downloads", "clips"))
+        gc.get_downloads()
+        gc.get_untranslated("ru")
+        gc.get_llm_translations(kk, "gpt-4o-mini")
+        gc.get_verb_form_examples("бару", False, False)
+        gc.get_book_chunks(1, 0, 10)
+        gc.get_video_subtitles("video", 0, 1000)
+        gc.get_clips(0, 20)
+        gc.get_clips(0, 20, 1)
+
+    def test_no_full_scans(self):
+        statements = []
+        self.db_conn.set_trace_callback(statements.append)
+        # Reads happen in this thread, so this is the only reader
+        self.db_pool.reader().set_trace_callback(statements.append)
+        self.exercise()
+        self.db_conn.set_trace_callback(None)
+        self.db_pool.reader().set_trace_callback(None)
+
+        checked = 0
+        violations = []
+        for statement in dict.fromkeys(" ".join(s.split()) for s in statements):
+            if statement.split(" ", 1)[0].upper() not in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH"):
+                continue
+            checked += 1
+            plan = [row[3] for row in self.db_conn.execute(f"EXPLAIN QUERY PLAN {statement}")]
+            # Subqueries in FROM show up as scans under their alias
+            subqueries = {
+                detail.split(" ")[1]
+                for detail in plan
+                if detail.startswith("CO-ROUTINE ") or detail.startswith("MATERIALIZE ")
+            }
+            scans = [
+                detail
+                for detail in plan
+                if detail.startswith("SCAN ") and detail.split(" ")[1] not in subqueries
+                and not detail.startswith("SCAN (subquery")
+            ]
+            if scans and not any(fragment in statement for fragment in ALLOWED_SCANS):
+                violations.append(f"{scans}: {statement}")
+        self.assertGreater(checked, 30)
+        self.assertEqual(violations, [])
+
+
+
+class LexiconTestCase(GcTestCase):
+    def make_lexicon(self):
+        lexicon = LexiconIndex()
+        lexicon.load(self.db_conn)
+        return lexicon
+
+    # Lookups the SQL path would answer for the word
+    def sql_lookup(self, src_lang, dst_lang, both_dirs, word):
+        if src_lang == "kk":
+            result = self.gc.do_get_translations(self.db_conn, src_lang, dst_lang, both_dirs, word)
+        else:
+            result = self.gc.do_get_inversed_translations(self.db_conn, src_lang, dst_lang, both_dirs, word)
+        return sorted(result, key=lambda translation: translation["translation_id"])
+
+    def assert_matches_sql(self, lexicon, words):
+        for src_lang, dst_lang, word in words:
+            for both_dirs in [False, True]:
+                self.assertEqual(
+                    lexicon.lookup(src_lang, dst_lang, both_dirs, word, TRANSLATIONS_LIMIT),
+                    self.sql_lookup(src_lang, dst_lang, both_dirs, word),
+                    (src_lang, dst_lang, both_dirs, word),
+                )
+
+    def test_incremental_add_matches_sql(self):
+        gc = self.gc
+        soz = gc.add_word("сөз", "NOUN", False, "kk", "", 1)
+        til = gc.add_word("тіл", "NOUN", False, "kk", "", 1)
+        slovo = gc.add_word("слово", "NOUN", False, "ru", "", 1)
+        yazyk = gc.add_word("язык", "NOUN", False, "ru", "", 1)
+        rech = gc.add_word("речь", "NOUN", False, "ru", "", 1)
+        word = gc.add_word("word", "NOUN", False, "en", "", 1)
+        gc.add_translation(soz, slovo, "", 1)
+        gc.add_translation(soz, word, "", 1)
+        gc.add_translation(til, yazyk, "", 1)
+        # Approval goes through the same path as add_translation
+        review_id = gc.add_review(til, rech, "", 1).inserted_id
+        gc.add_review_vote(review_id, 1, ReviewVote.APPROVE)
+        gc.add_review_vote(review_id, 2, ReviewVote.APPROVE)
+
+        words = [
+            ("kk", "ru", "сөз"),
+            ("kk", "ru", "тіл"),
+            ("kk", "en", "сөз"),
+            ("ru", "kk", "слово"),
+            ("ru", "kk", "речь"),
+            ("en", "kk", "word"),
+            ("kk", "ru", "жоқ"),
+            ("ru", "kk", "сөз"),
+        ]
+        self.assertEqual(len(gc.lexicon.lookup("kk", "ru", False, "тіл", TRANSLATIONS_LIMIT)), 2)
+        self.assert_matches_sql(gc.lexicon, words)
+        # A freshly loaded index is the same as the one updated incrementally
+        self.assert_matches_sql(self.make_lexicon(), words)
+        self.assertEqual(gc.get_translations("ru", "kk", False, "речь"), self.sql_lookup("ru", "kk", False, "речь"))
+
+    def test_reload_after_script_insert(self):
+        gc = self.gc
+        soz = gc.add_word("сөз", "NOUN", False, "kk", "", 1)
+        til = gc.add_word("тіл", "NOUN", False, "kk", "", 1)
+        slovo = gc.add_word("слово", "NOUN", False, "ru", "", 1)
+        yazyk = gc.add_word("язык", "NOUN", False, "ru", "", 1)
+        self.assertEqual(gc.get_translations("kk", "ru", False, "сөз"), [])
+        self.script_execute(
+            "INSERT INTO translations (word_id, translated_word_id, reference, user_id) VALUES (?, ?, ?, ?)",
+            (soz, slovo, "", 1),
+        )
+        # Until the next check the cached answer stays
+        self.assertEqual(gc.get_translations("kk", "ru", False, "сөз"), [])
+        gc.next_version_check = 0.0
+        self.assertEqual(gc.get_translations("kk", "ru", False, "сөз"), self.sql_lookup("kk", "ru", False, "сөз"))
+        self.assertEqual(len(gc.get_translations("kk", "ru", False, "сөз")), 1)
+
+        # Additions of the process itself are applied in place
+        lexicon = gc.lexicon
+        gc.add_translation(til, yazyk, "", 1)
+        gc.next_version_check = 0.0
+        self.assertEqual(len(gc.get_translations("kk", "ru", False, "тіл")), 1)
+        self.assertIs(gc.lexicon, lexicon)
+        self.assert_matches_sql(gc.lexicon, [("kk", "ru", "сөз"), ("kk", "ru", "тіл"), ("ru", "kk", "язык")])
+
+
+class ReviewVoteCountsTestCase(GcTestCase):
+    def counts(self, review_id):
+        row = self.db_conn.execute(
+            "SELECT approves, disapproves FROM review_vote_counts WHERE review_id = ?", (review_id,)).fetchone()
+        return tuple(row) if row else (0, 0)
+
+    def aggregated(self, review_id):
+        return tuple(self.db_conn.execute("""
+            SELECT COUNT(CASE WHEN vote = "APPROVE" THEN 1 END), COUNT(CASE WHEN vote = "DISAPPROVE" THEN 1 END)
+            FROM review_votes WHERE review_id = ?
+        """, (review_id,)).fetchone())
+
+    def test_vote_retract_revote(self):
+        gc = self.gc
+        kk = gc.add_word("сөз", "NOUN", False, "kk", "", 1)
+        ru = gc.add_word("слово", "NOUN", False, "ru", "", 1)
+        review_id = gc.add_review(kk, ru, "", 1).inserted_id
+
+        result = gc.add_review_vote(review_id, 1, ReviewVote.APPROVE)
+        self.assertEqual((result.approves, result.disapproves, result.own_approves), (1, 0, 1))
+        self.assertEqual(self.counts(review_id), (1, 0))
+
+        self.assertFalse(gc.add_review_vote(review_id, 1, ReviewVote.DISAPPROVE).inserted)
+        self.assertEqual(self.counts(review_id), (1, 0))
+
+        result = gc.retract_review_vote(review_id, 1, ReviewVote.APPROVE)
+        self.assertEqual((result.approves, result.disapproves, result.own_approves), (0, 0, 0))
+        self.assertEqual(self.counts(review_id), (0, 0))
+
+        result = gc.add_review_vote(review_id, 1, ReviewVote.DISAPPROVE)
+        self.assertEqual((result.approves, result.disapproves, result.own_disapproves), (0, 1, 1))
+        gc.add_review_vote(review_id, 2, ReviewVote.APPROVE)
+        self.assertEqual(self.counts(review_id), (1, 1))
+        self.assertEqual(self.counts(review_id), self.aggregated(review_id))
+
+        reviews = gc.get_reviews(2, 0, 0, 20)
+        self.assertEqual(len(reviews), 1)
+        self.assertEqual(
+            (reviews[0]["approves"], reviews[0]["disapproves"], reviews[0]["own_approves"], reviews[0]["own_disapproves"]),
+            (1, 1, 1, 0),
+        )
+
+
+class RoutesTestCase(GcTestCase):
+    """
+    Requests routes of the app served by the Gc of the test.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.saved_instance = gcapp.gc_instance
+        gcapp.gc_instance = self.gc
+        self.client = app.test_client()
+
+    def tearDown(self):
+        gcapp.gc_instance = self.saved_instance
+        super().tearDown()
+
+
+class CursorPaginationTestCase(RoutesTestCase):
+    # Returns ids of all items walking pages with cursors, and sizes of the pages
+    def walk(self, path, key, id_name):
+        ids = []
+        sizes = []
+        cursor = ""
+        while True:
+            response = self.client.get(f"{path}&cursor={cursor}")
+            self.assertEqual(response.status_code, 200)
+            items = response.json[key]
+            sizes.append(len(items))
+            ids.extend(item[id_name] for item in items)
+            cursor = response.json["next_cursor"]
+            if cursor is None:
+                return ids, sizes
+
+    def test_reviews(self):
+        gc = self.gc
+        kk = gc.add_word("сөз", "NOUN", False, "kk", "", 1)
+        review_ids = []
+        for i in range(5):
+            ru = gc.add_word(f"слово{i}", "NOUN", False, "ru", "", 1)
+            review_ids.append(gc.add_review(kk, ru, "", 1).inserted_id)
+        # Reviews created within one second are ordered by review_id
+        expected = sorted(review_ids, reverse=True)
+        self.assertEqual(self.walk("/gcapi/v2/get_reviews?c=2", "reviews", "review_id"), (expected, [2, 2, 1]))
+        self.assertEqual(self.walk("/gcapi/v2/get_reviews?src=kk&dst=ru&c=5", "reviews", "review_id"), (expected, [5, 0]))
+        offset_page = self.client.get("/gcapi/v2/get_reviews?o=2&c=2").json
+        self.assertEqual([review["review_id"] for review in offset_page["reviews"]], expected[2:4])
+        self.assertNotIn("next_cursor", offset_page)
+        self.assertEqual(self.client.get("/gcapi/v2/get_reviews?cursor=bad").status_code, 400)
+
+    def test_clips(self):
+        for i in range(4):
+            self.db_conn.execute("""
+                INSERT INTO clips (video_id, author, title, duration_secs, published_on) VALUES (?, "a", "t", 60, "2024-01-01")
+            """, (f"video{i}",))
+        self.db_conn.commit()
+        self.assertEqual(self.walk("/gcapi/v1/get_clips?c=2", "clips", "clip_id"), ([1, 2, 3, 4], [2, 2, 0]))
+        self.assertEqual(self.walk("/gcapi/v1/get_clips?c=3", "clips", "clip_id"), ([1, 2, 3, 4], [3, 1]))
+
+
+class UntranslatedPoolTestCase(GcTestCase):
+    def assert_pool(self, dst_lang, expected_word_ids):
+        pool = self.gc.get_untranslated_pool(dst_lang)
+        self.assertEqual(set(pool.positions), set(expected_word_ids))
+        from_db = {word_id for word_id, _ in self.gc.do_get_untranslated(self.db_conn, dst_lang)}
+        self.assertEqual(set(pool.positions), from_db)
+
+    def test_pool_follows_writes(self):
+        gc = self.gc
+        a = gc.add_word("а", "NOUN", False, "kk", "", 1)
+        b = gc.add_word("б", "NOUN", False, "kk", "", 1)
+        c = gc.add_word("в", "NOUN", False, "kk", "", 1)
+        x = gc.add_word("x", "NOUN", False, "ru", "", 1)
+        y = gc.add_word("y", "NOUN", False, "ru", "", 1)
+        z = gc.add_word("z", "NOUN", False, "ru", "", 1)
+        self.assert_pool("ru", [a, b, c])
+
+        d = gc.add_word("г", "NOUN", False, "kk", "", 1)
+        gc.add_word("w", "NOUN", False, "ru", "", 1)
+        self.assert_pool("ru", [a, b, c, d])
+
+        gc.add_translation(a, x, "", 1)
+        self.assert_pool("ru", [b, c, d])
+
+        review_b = gc.add_review(b, y, "", 1).inserted_id
+        self.assert_pool("ru", [c, d])
+        self.assert_pool("en", [a, b, c, d])
+
+        gc.discard_review(review_b, 1)
+        self.assert_pool("ru", [b, c, d])
+
+        review_cy = gc.add_review(c, y, "", 1).inserted_id
+        review_cz = gc.add_review(c, z, "", 1).inserted_id
+        gc.add_review_vote(review_cy, 1, ReviewVote.DISAPPROVE)
+        gc.add_review_vote(review_cy, 2, ReviewVote.DISAPPROVE)
+        # Another review of the word is still pending
+        self.assert_pool("ru", [b, d])
+        gc.add_review_vote(review_cz, 1, ReviewVote.DISAPPROVE)
+        gc.add_review_vote(review_cz, 2, ReviewVote.DISAPPROVE)
+        self.assert_pool("ru", [b, c, d])
+
+        # An approved review becomes a translation, the word doesn't come back
+        review_d = gc.add_review(d, x, "", 1).inserted_id
+        gc.add_review_vote(review_d, 1, ReviewVote.APPROVE)
+        gc.add_review_vote(review_d, 2, ReviewVote.APPROVE)
+        self.assert_pool("ru", [b, c])
+
+
+class BatchLookupTestCase(RoutesTestCase):
+    def setUp(self):
+        super().setUp()
+        gc = self.gc
+        soz = gc.add_word("сөз", "NOUN", False, "kk", "", 1)
+        til = gc.add_word("тіл", "NOUN", False, "kk", "", 1)
+        gc.add_word("тіл", "VERB", False, "kk", "", 1)
+        for ru_word in ["слово", "речь"]:
+            gc.add_translation(soz, gc.add_word(ru_word, "NOUN", False, "ru", "", 1), "", 1)
+        gc.add_translation(til, gc.add_word("язык", "NOUN", False, "ru", "", 1), "", 1)
+        gc.add_review(til, gc.add_word("речь", "NOUN", False, "ru", "", 1), "", 1)
+
+    # Batch results are cached under the keys of single lookups, so these must not come from the cache
+    def reset_cache(self):
+        self.gc.response_cache = ResponseCache(100, 1 << 20)
+
+    def test_translations_batch_equals_single(self):
+        words = ["сөз", "тіл", "жоқ", "слово", "сөз"]
+        for src_lang, dst_lang in [("kk", "ru"), ("ru", "kk")]:
+            for both_dirs in [False, True]:
+                self.reset_cache()
+                response = self.client.post("/gcapi/v1/get_translations_batch", json={
+                    "src": src_lang, "dst": dst_lang, "both": both_dirs, "words": words,
+                })
+                self.assertEqual(response.status_code, 200)
+                batch = response.json["translations"]
+                self.assertEqual(sorted(batch), sorted(set(words)))
+                self.reset_cache()
+                for word in words:
+                    single = self.client.get(
+                        f"/gcapi/v1/get_translation?src={src_lang}&dst={dst_lang}&both={int(both_dirs)}&w={word}")
+                    self.assertEqual(batch[word], single.json["translations"], (src_lang, both_dirs, word))
+        self.assertEqual(len(batch["слово"]), 1)
+
+    def test_words_batch_equals_single(self):
+        words = ["сөз", "тіл", "жоқ"]
+        for with_translations in [False, True]:
+            self.reset_cache()
+            response = self.client.post("/gcapi/v1/get_words_batch", json={
+                "lang": "kk", "wtrs": with_translations, "words": words,
+            })
+            self.assertEqual(response.status_code, 200)
+            batch = response.json["words"]
+            self.reset_cache()
+            for word in words:
+                single = self.client.get(f"/gcapi/v1/get_words?w={word}&lang=kk&wtrs={int(with_translations)}")
+                self.assertEqual(batch[word], single.json["words"], (with_translations, word))
+        self.assertEqual(len(batch["тіл"]), 2)
+
+    def test_batch_size_limit(self):
+        words = [f"сөз{i}" for i in range(MAX_BATCH_WORDS + 1)]
+        response = self.client.post("/gcapi/v1/get_translations_batch", json={"src": "kk", "dst": "ru", "words": words})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post("/gcapi/v1/get_words_batch", json={"lang": "kk", "words": words})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post("/gcapi/v1/get_words_batch", json={"lang": "kk", "words": words[:MAX_BATCH_WORDS]})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post("/gcapi/v1/get_words_batch", json={"lang": "kk", "words": []})
+        self.assertEqual(response.status_code, 400)
+
+
+class MetricsTestCase(RoutesTestCase):
+    def test_render_format(self):
+        metrics = Metrics(buckets=(0.1, 1.0))
+        metrics.describe("requests_total", "Handled requests")
+        metrics.inc("requests_total", (("route", "/a"), ("status", 200)))
+        metrics.inc("requests_total", (("route", "/a"), ("status", 200)), 2)
+        metrics.inc("requests_total", (("route", 'say "hi"\n'),))
+        for value in [0.05, 0.05, 0.5, 5.0]:
+            metrics.observe("request_seconds", (("route", "/a"),), value)
+        self.assertEqual(metrics.render().split("\n"), [
+            "# HELP requests_total Handled requests",
+            "# TYPE requests_total counter",
+            'requests_total{route="/a",status="200"} 3',
+            'requests_total{route="say \\"hi\\"\\n"} 1',
+            "# TYPE request_seconds summary",
+            'request_seconds{route="/a",quantile="0.5"} 0.1',
+            'request_seconds{route="/a",quantile="0.95"} 1.0',
+            'request_seconds{route="/a",quantile="0.99"} 1.0',
+            'request_seconds_sum{route="/a"} 5.6',
+            'request_seconds_count{route="/a"} 4',
+            "",
+        ])
+
+    def test_internal_routes(self):
+        self.client.get("/gcapi/v1/test")
+        response = self.client.get("/gcinternal/v1/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith("text/plain; version=0.0.4"))
+        self.assertIn('gc_requests_total{route="/gcapi/v1/test",status="200"}', response.get_data(as_text=True))
+        self.assertEqual(self.client.get("/gcinternal/v1/get_cache_stats").status_code, 200)
+        # Not under the public prefix
+        self.assertEqual(self.client.get("/gcapi/v1/metrics").status_code, 404)
+        self.assertEqual(self.client.get("/gcapi/v1/get_cache_stats").status_code, 404)
+
+
+class RankingTestCase(GcTestCase):
+    NOW = 1735000000
+
+    def insert_contribs(self, entries):
+        with self.gc.writes.operation():
+            self.gc.insert_contrib_entries(entries)
+
+    def calculate_rankings(self, now):
+        with self.gc.writes.operation():
+            self.gc.do_calculate_rankings(now)
+
+    def ranking(self, table):
+        return sorted(tuple(row) for row in self.db_conn.execute(
+            f"SELECT user_id, name, contribs, translations, approves, disapproves FROM {table}"))
+
+    # What the rankings were before the running counters: an aggregate over all contribs since `since`
+    def recompute(self, since):
+        return sorted(tuple(row) for row in self.db_conn.execute("""
+            SELECT
+                c.user_id,
+                u.name,
+                COUNT(*),
+                COUNT(CASE WHEN c.action = "ADD_TRANSLATION" THEN 1 END),
+                COUNT(CASE WHEN c.action = "APPROVE_CONFIRMED" THEN 1 END),
+                COUNT(CASE WHEN c.action = "DISAPPROVE_CONFIRMED" THEN 1 END)
+            FROM contribs c JOIN users u ON c.user_id = u.user_id
+            WHERE CAST(strftime('%s', c.created_at) AS INTEGER) > ?
+            GROUP BY c.user_id
+        """, (since,)))
+
+    def test_rankings_equal_full_recompute(self):
+        day = SECONDS_PER_DAY
+        entries = []
+        for i, age_days in enumerate([0, 1, 2, 6, 7, 8, 10, 30]):
+            for user_id in [1, 2]:
+                if (i + user_id) % 3 == 0:
+                    continue
+                action = [ContribAction.ADD_TRANSLATION, ContribAction.APPROVE_CONFIRMED][(i + user_id) % 2]
+                entries.append(ContribEntry(i + 1, 0, user_id, action, self.NOW - age_days * day))
+        entries.append(ContribEntry(100, 0, 2, ContribAction.ADD_TRANSLATION, ALLTIME_START - day))
+        self.insert_contribs(entries[:7])
+        self.insert_contribs(entries[7:])
+
+        week_start = contrib_day(self.NOW - WEEK_SECONDS) * day - 1
+        self.calculate_rankings(self.NOW)
+        self.assertEqual(self.ranking("ranking_alltime"), self.recompute(ALLTIME_START))
+        self.assertEqual(self.ranking("ranking_week"), self.recompute(week_start))
+        self.assertNotEqual(self.ranking("ranking_week"), self.ranking("ranking_alltime"))
+
+        # Buckets before the window are rolled off, the rest of the week moves on
+        later = self.NOW + 3 * day
+        self.calculate_rankings(later)
+        start_day = contrib_day(later - WEEK_SECONDS)
+        days = [row[0] for row in self.db_conn.execute("SELECT DISTINCT day FROM contrib_counts_daily")]
+        self.assertTrue(days)
+        self.assertGreaterEqual(min(days), start_day)
+        self.assertEqual(self.ranking("ranking_week"), self.recompute(start_day * day - 1))
+        self.assertEqual(self.ranking("ranking_alltime"), self.recompute(ALLTIME_START))
+
+        # Counters rebuilt from contribs, as after a bulk load, give the same rankings
+        self.insert_contribs([ContribEntry(200, 0, 1, ContribAction.DISAPPROVE_CONFIRMED, later)])
+        self.calculate_rankings(later)
+        incremental = self.ranking("ranking_alltime")
+        rebuild_derived_tables(self.db_conn)
+        self.calculate_rankings(later)
+        self.assertEqual(self.ranking("ranking_alltime"), incremental)
+        self.assertEqual(incremental, self.recompute(ALLTIME_START))
+
+
+class ContribCollectorTestCase(GcTestCase):
+    def setUp(self):
+        super().setUp()
+        self.kk = self.gc.add_word("сөз", "NOUN", False, "kk", "", 1)
+        self.translation_ids = [self.add_translation(i) for i in range(5)]
+
+    def add_translation(self, i):
+        ru = self.gc.add_word(f"слово{i}", "NOUN", False, "ru", "", 1)
+        return self.gc.add_translation(self.kk, ru, "", 1 + i % 2).inserted_id
+
+    def collected_translation_ids(self):
+        return [row[0] for row in self.db_conn.execute(
+            "SELECT translation_id FROM contribs WHERE action = 'ADD_TRANSLATION' ORDER BY contrib_id")]
+
+    def test_resume_after_failed_chunk(self):
+        gc = self.gc
+        inserted_chunks = []
+
+        def fail_on_second_chunk(entries):
+            gc.insert_contrib_entries(entries)
+            if inserted_chunks:
+                raise RuntimeError("insert failed")
+            inserted_chunks.append(entries)
+
+        with unittest.mock.patch.object(gcapp, "CONTRIB_CHUNK_SIZE", 2):
+            with self.assertRaises(RuntimeError):
+                gc.collect_range("translations", gc.load_translation_vote_range, fail_on_second_chunk)
+            # Another write commits, the failed chunk must not be committed with it
+            gc.add_word("сөздер", "NOUN", False, "kk", "", 1)
+            self.assertEqual(self.collected_translation_ids(), self.translation_ids[:2])
+            self.assertEqual(gc.get_collector_position("translations"), self.translation_ids[1])
+            self.assertGreater(gc.get_table_size("contrib_counts_daily"), 0)
+
+            stats = gc.collect_contribs()
+            self.assertEqual((stats["collected"], stats["chunks"], stats["last_id"]), (3, 2, self.translation_ids[-1]))
+            self.assertEqual(self.collected_translation_ids(), self.translation_ids)
+
+            new_ids = [self.add_translation(i) for i in range(5, 8)]
+            stats = gc.collect_contribs()
+            self.assertEqual((stats["collected"], stats["chunks"]), (3, 2))
+            self.assertEqual(self.collected_translation_ids(), self.translation_ids + new_ids)
+            self.assertEqual(gc.collect_contribs()["collected"], 0)
+
+        counted = self.db_conn.execute("SELECT SUM(translations) FROM contrib_counts_alltime").fetchone()[0]
+        self.assertEqual(counted, 8)
+        self.assertFalse(self.db_conn.in_transaction)
+
+
+class ContentReloadTestCase(GcTestCase):
+    """
+    Content tables are loaded by scripts, cached copies must not outlive a reload.
+    """
+
+    # Returns statements that `func` runs on the reader connection of this thread
+    def statements(self, func):
+        statements = []
+        self.db_pool.reader().set_trace_callback(statements.append)
+        try:
+            func()
+        finally:
+            self.db_pool.reader().set_trace_callback(None)
+        return statements
+
+    def test_subtitles_reloaded(self):
+        self.assertEqual(self.gc.get_video_subtitles("v", 0, 1000), [])
+        self.script_execute(
+            "INSERT INTO subtitles (video_id, start_ms, end_ms, content, words) VALUES (?, ?, ?, ?, ?)",
+            ("v", 100, 200, "сәлем", "[]"),
+        )
+        # Answered from memory until the next check
+        self.assertEqual(self.gc.get_video_subtitles("v", 0, 1000), [])
+        self.gc.next_version_check = 0.0
+        subtitles = self.gc.get_video_subtitles("v", 0, 1000)
+        self.assertEqual([cue["content"] for cue in subtitles], ["сәлем"])
+        self.assertEqual(self.statements(lambda: self.gc.get_video_subtitles("v", 0, 1000)), [])
+
+    def insert_chunks(self, book_id, chunk_ids):
+        for chunk_id in chunk_ids:
+            self.script_execute(
+                "INSERT INTO book_chunks (book_id, chunk_id, content) VALUES (?, ?, ?)",
+                (book_id, chunk_id, f"chunk {chunk_id}"),
+            )
+
+    def reset_cache(self):
+        self.gc.response_cache = ResponseCache(gcapp.RESPONSE_CACHE_MAX_ENTRIES, gcapp.RESPONSE_CACHE_MAX_BYTES)
+
+    def test_book_reloaded(self):
+        self.assertEqual(self.gc.get_book_page(1, 0, 10), ([], None))
+        self.assertIsNone(self.gc.response_cache.get(("book", 1)))
+        self.insert_chunks(1, [1, 2])
+        self.gc.next_version_check = 0.0
+        chunks, _ = self.gc.get_book_page(1, 0, 10)
+        self.assertEqual([chunk["chunk_id"] for chunk in chunks], [1, 2])
+        self.insert_chunks(1, [3])
+        # The next page comes from memory until the next check
+        self.assertEqual(self.statements(lambda: self.gc.get_book_page(1, 0, 10)), [])
+        self.gc.next_version_check = 0.0
+        chunks, _ = self.gc.get_book_page(1, 0, 10)
+        self.assertEqual([chunk["chunk_id"] for chunk in chunks], [1, 2, 3])
+
+    def test_large_book_ranges(self):
+        self.insert_chunks(1, [1, 2, 3, 5, 8, 13])
+        cached = [self.gc.get_book_page(1, offset, count) for offset in range(15) for count in [1, 2, 10]]
+        self.assertIsNotNone(self.gc.response_cache.get(("book", 1)))
+        self.reset_cache()
+        with unittest.mock.patch.object(gcapp, "BOOK_CACHE_MAX_CHARS", 10):
+            ranged = [self.gc.get_book_page(1, offset, count) for offset in range(15) for count in [1, 2, 10]]
+        self.assertIsNone(self.gc.response_cache.get(("book", 1)))
+        self.assertEqual(ranged, cached)
+
+
+class ConditionalGetTestCase(RoutesTestCase):
+    def add_download(self):
+        self.db_conn.execute("INSERT INTO downloads (url, kkru, kken) VALUES ('https://a/b.zip', 1, 2)")
+        self.db_conn.commit()
+
+    def test_write_in_the_same_second(self):
+        self.add_download()
+        response = self.client.get("/gcapi/v1/get_downloads")
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["ETag"]
+        last_modified = response.headers["Last-Modified"]
+        self.assertEqual(self.client.get("/gcapi/v1/get_downloads", headers={"If-None-Match": etag}).status_code, 304)
+
+        self.add_download()
+        headers = {"If-None-Match": etag, "If-Modified-Since": last_modified}
+        response = self.client.get("/gcapi/v1/get_downloads", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json["downloads"]), 2)
+        response = self.client.get("/gcapi/v1/get_downloads", headers={"If-Modified-Since": last_modified})
+        self.assertEqual(response.status_code, 200)
 
 if __name__ == '__main__':
     unittest.main()
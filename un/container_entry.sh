@@ -18,6 +18,7 @@ uwsgi \
     --socket "${APP_WORKDIR}/sockets/un.socket" \
     --chmod-socket=666 \
     --buffer-size=32768 \
+    --enable-threads \
     --wsgi-file "${APP_WORKDIR}/app.py" \
     --pyargv "" \
     --callable app \
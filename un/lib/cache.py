@@ -0,0 +1,71 @@
+from collections import OrderedDict
+import logging
+import threading
+
+
+class VerbCache(object):
+    """
+    All rows of Verbs, (verb, fe) -> (id, soft). Loaded once, verbs are added rarely and never change,
+    so lookups don't lock: the dict is only ever extended.
+    """
+
+    def __init__(self):
+        self.verbs = dict()
+
+    def load(self, db_conn):
+        cursor = db_conn.cursor()
+        cursor.execute("SELECT id, verb, fe, soft FROM Verbs")
+        verbs = {(row[1], bool(row[2])): (row[0], row[3]) for row in cursor.fetchall()}
+        cursor.close()
+        self.verbs = verbs
+        logging.info("VerbCache: loaded %d verbs", len(verbs))
+
+    # returns `(id: int, soft: boolean)` or `None`
+    def get(self, verb, fe):
+        return self.verbs.get((verb, bool(fe)))
+
+    def put(self, verb, fe, verb_id, soft):
+        self.verbs[(verb, bool(fe))] = (verb_id, soft)
+
+
+class AudioNameCache(object):
+    """
+    Bounded LRU of audio names found in Audio and SentenceAudio. Rows are never updated or deleted,
+    so entries stay valid until evicted.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # returns `audio_name: string` or `None`
+    def get(self, key):
+        with self.lock:
+            audio_name = self.entries.get(key)
+            if audio_name is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return audio_name
+
+    def put(self, key, audio_name):
+        with self.lock:
+            self.entries[key] = audio_name
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,34 @@
+import io
+
+
+class ChunkReader(io.RawIOBase):
+    """
+    Read-only file object over an iterator of bytes, e.g. a streamed HTTP response,
+    so it can be passed to APIs expecting a file without writing it to disk.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.pending = b""
+        self.total = 0
+
+    def readable(self):
+        return True
+
+    # Fills the buffer from as many chunks as needed, so readers asking for large parts,
+    # like the multipart upload of s3transfer, get full parts rather than single chunks
+    def readinto(self, buffer):
+        size = 0
+        while size < len(buffer):
+            if not self.pending:
+                chunk = next(self.chunks, None)
+                if chunk is None:
+                    break
+                self.pending = chunk
+                continue
+            part = min(len(buffer) - size, len(self.pending))
+            buffer[size:size + part] = self.pending[:part]
+            self.pending = self.pending[part:]
+            size += part
+        self.total += size
+        return size
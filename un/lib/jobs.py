@@ -0,0 +1,89 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+import time
+import uuid
+
+
+class JobStatus(object):
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class Job(object):
+
+    def __init__(self, key):
+        self.job_id = uuid.uuid4().hex
+        self.key = key
+        self.status = JobStatus.PENDING
+        self.result = None
+        self.finished_at = None
+
+
+class JobQueue(object):
+    """
+    Runs functions in a bounded pool of worker threads and keeps their results for polling.
+
+    At most `max_pending` jobs wait or run at a time, `submit` returns None beyond that.
+    Submitting a key that already has an unfinished job returns that job.
+    Finished jobs are forgotten `ttl_secs` after they finish.
+    """
+
+    def __init__(self, max_workers, max_pending, ttl_secs):
+        self.max_pending = max_pending
+        self.ttl_secs = ttl_secs
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.lock = threading.Lock()
+        # job_id -> Job
+        self.jobs = dict()
+        # key -> unfinished Job
+        self.pending = dict()
+        # finished Jobs in order of finished_at
+        self.finished = deque()
+
+    # returns `Job` or `None` if the queue is full
+    def submit(self, key, func):
+        with self.lock:
+            self.expire()
+            job = self.pending.get(key)
+            if job is not None:
+                return job
+            if len(self.pending) >= self.max_pending:
+                logging.warning("JobQueue: %d jobs pending, rejecting %s", len(self.pending), str(key))
+                return None
+            job = Job(key)
+            self.jobs[job.job_id] = job
+            self.pending[key] = job
+        self.executor.submit(self.run, job, func)
+        return job
+
+    def run(self, job, func):
+        try:
+            result = func()
+            status = JobStatus.DONE
+        except Exception:
+            logging.exception("JobQueue: job %s for %s failed", job.job_id, str(job.key))
+            result = None
+            status = JobStatus.FAILED
+        with self.lock:
+            job.result = result
+            job.status = status
+            job.finished_at = time.time()
+            del self.pending[job.key]
+            self.finished.append(job)
+
+    # returns `Job` or `None`
+    def get(self, job_id):
+        with self.lock:
+            self.expire()
+            return self.jobs.get(job_id)
+
+    # Must be called with the lock held. Follows the order of finishing,
+    # so a job that is still running does not hold back jobs submitted after it.
+    def expire(self):
+        deadline = time.time() - self.ttl_secs
+        while self.finished and self.finished[0].finished_at < deadline:
+            job = self.finished.popleft()
+            del self.jobs[job.job_id]
@@ -0,0 +1,199 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import logging
+import sqlite3
+import threading
+import time
+
+from lib.cache import VerbCache
+
+
+class RateBudget(object):
+    """
+    Spaces calls out to at most `per_minute`, shared by all worker threads.
+    """
+
+    def __init__(self, per_minute):
+        assert per_minute > 0
+        self.interval = 60.0 / per_minute
+        self.lock = threading.Lock()
+        self.next_at = 0.0
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            at = max(now, self.next_at)
+            self.next_at = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+# bulk_generate.js prints forceExceptional as a JS boolean
+FE_VALUES = {
+    "true": True,
+    "1": True,
+    "false": False,
+    "0": False,
+}
+# The server writes to the same database, its transactions are waited for rather than failing the run
+BUSY_TIMEOUT_MS = 30000
+FLUSH_ATTEMPTS = 5
+FLUSH_RETRY_SECS = 5.0
+
+
+# Parses a line of `bulk_generate.js detector_forms` output: `verb:fe<TAB>form:...<TAB>form:...`.
+# Returns a list of `(verb, fe: boolean, form)`, empty for malformed lines.
+def parse_forms_line(line):
+    parts = line.rstrip("\n").split("\t")
+    if len(parts) < 2:
+        return []
+    verb, _, fe = parts[0].rpartition(":")
+    fe = FE_VALUES.get(fe.strip().lower())
+    if not verb or fe is None:
+        logging.warning("Skipping malformed forms line: %s", parts[0])
+        return []
+    result = []
+    for part in parts[1:]:
+        form = part.split(":", 1)[0].strip()
+        if form:
+            result.append((verb, fe, form))
+    return result
+
+
+class Pregenerator(object):
+    """
+    Generates audio for verb forms ahead of user requests.
+
+    Forms already in Audio are skipped, so a run that was stopped can simply be started again.
+    Up to `workers` forms are synthesized and uploaded at a time, synthesis requests are paced by `budget`.
+    Uploaded forms are inserted in batches of `batch_size`; a crash loses at most one batch
+    of inserts, leaving orphan objects in S3 that the next run generates again under new names.
+    """
+
+    def __init__(self, un, db_conn, workers, budget, batch_size):
+        self.un = un
+        self.db_conn = db_conn
+        self.workers = workers
+        self.budget = budget
+        self.batch_size = batch_size
+        self.batch = []
+        self.db_conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS};")
+
+        self.verbs = VerbCache()
+        self.verbs.load(db_conn)
+        self.existing = self.load_existing()
+
+        self.unknown = 0
+        self.skipped = 0
+        self.submitted = 0
+        self.generated = 0
+        self.failed = 0
+
+    # returns a set of `(verb_id, text)`
+    def load_existing(self):
+        cursor = self.db_conn.cursor()
+        cursor.execute("SELECT verb_id, text FROM Audio")
+        existing = {(row[0], row[1]) for row in cursor.fetchall()}
+        cursor.close()
+        logging.info("Pregenerator: %d forms already have audio", len(existing))
+        return existing
+
+    # Yields `(verb, fe, verb_id, soft, form)` for forms without audio, each once
+    def plan(self, form_rows):
+        for verb, fe, form in form_rows:
+            cached = self.verbs.get(verb, fe)
+            if cached is None:
+                self.unknown += 1
+                continue
+            verb_id, soft = cached
+            key = (verb_id, form)
+            if key in self.existing:
+                self.skipped += 1
+                continue
+            self.existing.add(key)
+            yield verb, fe, verb_id, soft, form
+
+    # returns `(verb_id, text, audio_name)`
+    def generate_one(self, verb, fe, verb_id, soft, text):
+        name = self.un.make_audio_name(verb, fe, text)
+        if not name:
+            raise ValueError(f"Cannot make audio name for {verb}, {text}")
+        self.budget.acquire()
+        self.un.upload_audio_stream_to_s3(self.un.synth.stream_audio(soft, text), name)
+        return verb_id, text, name
+
+    def collect(self, futures):
+        for future in futures:
+            try:
+                record = future.result()
+            except Exception:
+                logging.exception("Pregenerator: failed to generate audio")
+                self.failed += 1
+                continue
+            self.generated += 1
+            self.batch.append(record)
+            if len(self.batch) >= self.batch_size:
+                self.flush()
+
+    # Retries when the database stays locked beyond the busy timeout, the batch is already uploaded
+    def flush(self):
+        if not self.batch:
+            return
+        for attempt in range(1, FLUSH_ATTEMPTS + 1):
+            try:
+                self.insert_batch()
+                break
+            except sqlite3.OperationalError:
+                self.db_conn.rollback()
+                if attempt == FLUSH_ATTEMPTS:
+                    logging.error("Pregenerator: failed to store uploaded forms: %s", str(self.batch))
+                    raise
+                logging.exception("Pregenerator: failed to store %d forms, attempt %d", len(self.batch), attempt)
+                time.sleep(FLUSH_RETRY_SECS)
+        logging.info("Pregenerator: stored %d forms, %d generated, %d failed so far",
+            len(self.batch), self.generated, self.failed)
+        self.batch = []
+
+    def insert_batch(self):
+        cursor = self.db_conn.cursor()
+        # The server might have generated the same form meanwhile, its row wins
+        cursor.executemany("INSERT OR IGNORE INTO Audio (verb_id, text, audio) VALUES (?, ?, ?)", self.batch)
+        self.db_conn.commit()
+        cursor.close()
+
+    # Generates up to `limit` forms, all when `limit` is None
+    def run(self, form_rows, limit=None):
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pregen")
+        pending = set()
+        try:
+            for item in self.plan(form_rows):
+                if limit is not None and self.submitted >= limit:
+                    break
+                # Keeps memory bounded for inputs with millions of forms
+                while len(pending) >= 2 * self.workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self.collect(done)
+                pending.add(executor.submit(self.generate_one, *item))
+                self.submitted += 1
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                self.collect(done)
+        finally:
+            # Stores whatever was uploaded when interrupted
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+            self.collect([future for future in pending if not future.cancelled()])
+            self.flush()
+        logging.info("Pregenerator: generated %d, failed %d, already existing %d, unknown verbs %d",
+            self.generated, self.failed, self.skipped, self.unknown)
+
+    # Only counts forms that would be generated
+    def dry_run(self, form_rows, limit=None):
+        count = 0
+        for _ in self.plan(form_rows):
+            if limit is not None and count >= limit:
+                break
+            count += 1
+        logging.info("Pregenerator: would generate %d, already existing %d, unknown verbs %d",
+            count, self.skipped, self.unknown)
+        return count
@@ -0,0 +1,54 @@
+import logging
+import threading
+
+
+class Flight(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """
+    Deduplicates concurrent calls by key.
+
+    The first caller of a key runs the function, callers arriving while it runs wait
+    and get the same result, or the same exception. Nothing is remembered once the call returns.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key -> Flight
+        self.flights = dict()
+
+    def do(self, key, func):
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = Flight()
+                self.flights[key] = flight
+            else:
+                flight.waiters += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            if flight.waiters > 0:
+                logging.info("SingleFlight: %d callers shared the result for %s", flight.waiters, str(key))
+            flight.done.set()
+        return flight.result
@@ -1,4 +1,5 @@
 import argparse
+import io
 import json
 import logging
 from logging.config import dictConfig
@@ -16,7 +17,11 @@ from botocore.config import Config
 from flask import Flask, jsonify, redirect, request, make_response, send_file
 from speechkit import model_repository, configure_credentials, creds
 
+from lib.cache import AudioNameCache, VerbCache
+from lib.chunk_reader import ChunkReader
+from lib.jobs import JobQueue, JobStatus
 from lib.limiter import Limiter
+from lib.single_flight import SingleFlight
 from lib.translit import transliterate, check_content
 
 dictConfig({
@@ -37,8 +42,19 @@ dictConfig({
     }
 })
 DATABASE_PATH = "/data/un.db"
+# Overridden with UN_S3_ENDPOINT_URL to run against a local S3 stand-in
+S3_ENDPOINT_URL = os.environ.get("UN_S3_ENDPOINT_URL", "https://storage.yandexcloud.net")
 BUCKET_NAME="verbforms"
 BUCKET_URL = f"https://storage.yandexcloud.net/{BUCKET_NAME}/"
+AUDIO_NAME_CACHE_SIZE = 50000
+# Background generation in async mode, synthesis is rate limited anyway.
+# Jobs live in the memory of one process: polls must reach the process that took the job,
+# so async mode needs a single worker process with threads (gunicorn_conf.py, uwsgi --enable-threads).
+JOB_WORKERS = 2
+JOB_MAX_PENDING = 100
+JOB_TTL_SECS = 600
+# Connect and read timeouts, a hung synthesis would otherwise hold a job worker forever
+TTS_TIMEOUT_SECS = (5, 30)
 app = Flask("un_app")
 unInstance = None
 
@@ -79,7 +95,7 @@ class SynthYskV1(Synth):
             "format": "mp3",
             "folderId": self.yc_folder_id,
         }
-        with requests.post(self.url, headers=self.headers, data=data, stream=True) as resp:
+        with requests.post(self.url, headers=self.headers, data=data, stream=True, timeout=TTS_TIMEOUT_SECS) as resp:
             if resp.status_code != 200:
                 raise RuntimeError("Invalid response received: code: %d, message: %s" % (resp.status_code, resp.text))
 
@@ -103,6 +119,14 @@ class SynthYskV1(Synth):
                 total += len(audio_content)
         logging.info("Generated sentence audio of %d for %s: %s", total, sentence, name)
 
+    # Returns an iterator over chunks of mp3 as they arrive
+    def stream_audio(self, soft, text):
+        return self.request(soft, text)
+
+    def stream_sentence_audio(self, voice_id, sentence):
+        soft = voice_id > 0
+        return self.request(soft, sentence)
+
 
 class SynthYskV3(Synth):
 
@@ -140,28 +164,41 @@ class SynthYskV3(Synth):
         result.export(path, format="mp3")
         logging.info("Generated audio for %s: %s", sentence, name)
 
+    def export_mp3(self, soft, text):
+        result = self.get_model(soft).synthesize(text, raw_format=False)
+        output = io.BytesIO()
+        result.export(output, format="mp3")
+        return [output.getvalue()]
+
+    def stream_audio(self, soft, text):
+        return self.export_mp3(soft, text)
+
+    def stream_sentence_audio(self, voice_id, sentence):
+        soft = voice_id > 0
+        return self.export_mp3(soft, sentence)
+
 
 class Un(object):
 
-    def __init__(self, audio_workdir, synth, db_conn):
+    def __init__(self, audio_workdir, synth, db_conn, s3):
         self.audio_workdir = audio_workdir
         assert isinstance(synth, Synth)
         self.synth = synth
         self.limiter = Limiter(60)
+        # Concurrent requests for the same audio wait for one generation
+        self.flights = SingleFlight()
+        self.jobs = JobQueue(JOB_WORKERS, JOB_MAX_PENDING, JOB_TTL_SECS)
 
-        self.boto_session = boto3.session.Session()
-        boto_config = Config(
-            region_name="ru-central1",
-        )
-        self.s3 = self.boto_session.client(
-            service_name="s3",
-            endpoint_url="https://storage.yandexcloud.net",
-            config=boto_config,
-        )
+        self.s3 = s3
 
         self.db_lock = threading.Lock()
         self.db_conn = db_conn
 
+        # Cache hits are served without touching the DB or taking db_lock
+        self.verbs = VerbCache()
+        self.verbs.load(db_conn)
+        self.audio_names = AudioNameCache(AUDIO_NAME_CACHE_SIZE)
+
     def make_audio_name(self, verb, fe, text):
         verbT = transliterate(verb)
         if not verbT:
@@ -181,36 +218,51 @@ class Un(object):
 
     # returns `(id: int, soft: boolean)` or `None, None`
     def check_verb_and_get_soft(self, verb, fe):
+        cached = self.verbs.get(verb, fe)
+        if cached is not None:
+            return cached
+        # Verbs added after the cache was loaded
         with self.db_lock:
             cursor = self.db_conn.cursor()
             query = "SELECT id, soft FROM Verbs WHERE verb = ? AND fe = ?"
             cursor.execute(query, (verb, fe))
             result = cursor.fetchone()
             if result is not None:
+                self.verbs.put(verb, fe, result[0], result[1])
                 return result[0], result[1]
             else:
                 return None, None
 
     # returns `audio_name: string` or `None`
     def check_text_audio(self, verb_id, text):
+        key = ("text", verb_id, text)
+        cached = self.audio_names.get(key)
+        if cached is not None:
+            return cached
         with self.db_lock:
             cursor = self.db_conn.cursor()
             query = "SELECT audio FROM Audio WHERE verb_id = ? AND text = ?"
             cursor.execute(query, (verb_id, text))
             result = cursor.fetchone()
             if result is not None:
+                self.audio_names.put(key, result[0])
                 return result[0]
             else:
                 return None
 
     # returns `audio_name: string` or `None`
     def check_sentence_audio(self, sentence):
+        key = ("sentence", sentence)
+        cached = self.audio_names.get(key)
+        if cached is not None:
+            return cached
         with self.db_lock:
             cursor = self.db_conn.cursor()
             query = "SELECT audio FROM SentenceAudio WHERE sentence = ?"
             cursor.execute(query, (sentence,))
             result = cursor.fetchone()
             if result is not None:
+                self.audio_names.put(key, result[0])
                 return result[0]
             else:
                 return None
@@ -219,12 +271,19 @@ class Un(object):
         self.s3.upload_file(audio_path, BUCKET_NAME, f"{audio_name}.mp3")
         logging.info("Uploaded audio %s to S3", audio_name)
 
+    # Uploads chunks as they are synthesized, without a local file
+    def upload_audio_stream_to_s3(self, chunks, audio_name):
+        reader = ChunkReader(chunks)
+        self.s3.upload_fileobj(reader, BUCKET_NAME, f"{audio_name}.mp3")
+        logging.info("Uploaded audio %s of %d bytes to S3", audio_name, reader.total)
+
     def store_text_audio_to_db(self, verb_id, text, audio_name):
         with self.db_lock:
             cursor = self.db_conn.cursor()
             insert_query = "INSERT INTO Audio (verb_id, text, audio) VALUES (?, ?, ?)"""
             cursor.execute(insert_query, (verb_id, text, audio_name))
             self.db_conn.commit()
+            self.audio_names.put(("text", verb_id, text), audio_name)
             logging.info("Stored to db: %d, %s, %s", verb_id, text, audio_name)
 
     def store_sentence_audio_to_db(self, sentence, audio_name):
@@ -233,6 +292,7 @@ class Un(object):
             insert_query = "INSERT INTO SentenceAudio (sentence, audio) VALUES (?, ?)"""
             cursor.execute(insert_query, (sentence, audio_name))
             self.db_conn.commit()
+            self.audio_names.put(("sentence", sentence), audio_name)
             logging.info("Stored to db: %s, %s", sentence, audio_name)
 
     def make_audio_path(self, name):
@@ -274,10 +334,39 @@ class Un(object):
 
     # returns an URL to a remote file or `None`, and a status code
     def generate_audio_url(self, verb, fe, text):
+        url, status_code, key, generate = self.prepare_audio_url(verb, fe, text)
+        if generate is None:
+            return url, status_code
+        return generate()
+
+    # Async mode: returns an URL to a remote file or `None`, a `Job` generating it or `None`, and a status code
+    def submit_audio_url(self, verb, fe, text):
+        url, status_code, key, generate = self.prepare_audio_url(verb, fe, text)
+        if generate is None:
+            return url, None, status_code
+        return self.submit_job(key, generate)
+
+    # returns `(url, status_code, None, None)` if there is nothing to generate,
+    # otherwise `(None, None, key, generate)`, where `generate()` returns an URL or `None`, and a status code
+    def prepare_audio_url(self, verb, fe, text):
         verb_id, soft = self.check_verb_and_get_soft(verb, fe)
         if not verb_id:
             logging.error("Unknown verb: %s, %s", verb, str(fe))
-            return None, 400
+            return None, 400, None, None
+        existing_audio_name = self.check_text_audio(verb_id, text)
+        if existing_audio_name:
+            logging.info("Audio is found in DB: %s", existing_audio_name)
+            return self.make_audio_url(existing_audio_name), 200, None, None
+        key = ("text", verb_id, text)
+        generate = lambda: self.flights.do(
+            key,
+            lambda: self.generate_text_audio_url(verb, fe, verb_id, text, soft),
+        )
+        return None, None, key, generate
+
+    # Runs once at a time per (verb_id, text), returns an URL to a remote file or `None`, and a status code
+    def generate_text_audio_url(self, verb, fe, verb_id, text, soft):
+        # Might have been stored by a generation that finished after our check
         existing_audio_name = self.check_text_audio(verb_id, text)
         if existing_audio_name:
             logging.info("Audio is found in DB: %s", existing_audio_name)
@@ -285,17 +374,49 @@ class Un(object):
         name = self.make_audio_name(verb, fe, text)
         if not name:
             return None, 400
-        path = self.make_audio_path(name)
         if not self.acquire():
             return None, 429
-        self.synth.generate_audio(soft, text, path, name)
-        self.upload_audio_to_s3(path, name)
+        self.upload_audio_stream_to_s3(self.synth.stream_audio(soft, text), name)
         self.store_text_audio_to_db(verb_id, text, name)
-        os.unlink(path)
         return self.make_audio_url(name), 201
 
     # returns an URL to a remote file or `None`, and a status code
     def generate_sentence_audio_url(self, sentence, voice_id):
+        url, key, generate = self.prepare_sentence_audio_url(sentence, voice_id)
+        if generate is None:
+            return url, 200
+        return generate()
+
+    # Async mode: returns an URL to a remote file or `None`, a `Job` generating it or `None`, and a status code
+    def submit_sentence_audio_url(self, sentence, voice_id):
+        url, key, generate = self.prepare_sentence_audio_url(sentence, voice_id)
+        if generate is None:
+            return url, None, 200
+        return self.submit_job(key, generate)
+
+    # returns `(url, None, None)` for existing audio, otherwise `(None, key, generate)`
+    def prepare_sentence_audio_url(self, sentence, voice_id):
+        existing_audio_name = self.check_sentence_audio(sentence)
+        if existing_audio_name:
+            logging.info("Sentence audio is found in DB: %s", existing_audio_name)
+            return self.make_audio_url(existing_audio_name), None, None
+        key = ("sentence", sentence)
+        generate = lambda: self.flights.do(
+            key,
+            lambda: self.generate_new_sentence_audio_url(sentence, voice_id),
+        )
+        return None, key, generate
+
+    # Generation is shared with synchronous requests through `flights`, the job only moves it off the request thread
+    def submit_job(self, key, generate):
+        job = self.jobs.submit(key, generate)
+        if job is None:
+            return None, None, 503
+        return None, job, 202
+
+    # Runs once at a time per sentence, returns an URL to a remote file or `None`, and a status code
+    def generate_new_sentence_audio_url(self, sentence, voice_id):
+        # Might have been stored by a generation that finished after our check
         existing_audio_name = self.check_sentence_audio(sentence)
         if existing_audio_name:
             logging.info("Sentence audio is found in DB: %s", existing_audio_name)
@@ -303,13 +424,10 @@ class Un(object):
         name = self.make_sentence_audio_name(sentence)
         if not name:
             return None, 400
-        path = self.make_audio_path(name)
         if not self.acquire():
             return None, 429
-        self.synth.generate_sentence_audio(voice_id, sentence, path, name)
-        self.upload_audio_to_s3(path, name)
+        self.upload_audio_stream_to_s3(self.synth.stream_sentence_audio(voice_id, sentence), name)
         self.store_sentence_audio_to_db(sentence, name)
-        os.unlink(path)
         return self.make_audio_url(name), 201
 
 
@@ -354,6 +472,18 @@ CREATE INDEX IF NOT EXISTS idx_sentence_audio ON SentenceAudio (sentence);
     return conn
 
 
+def make_s3_client(endpoint_url):
+    boto_session = boto3.session.Session()
+    boto_config = Config(
+        region_name="ru-central1",
+    )
+    return boto_session.client(
+        service_name="s3",
+        endpoint_url=endpoint_url,
+        config=boto_config,
+    )
+
+
 def init_un_app():
     global unInstance
     db_conn = init_db_conn(DATABASE_PATH)
@@ -362,7 +492,7 @@ def init_un_app():
     yc_folder_id = read_token("/etc/secret-volume/.yc.folderid")
     # synth = SynthYskV3(yc_api_key_path)
     synth = SynthYskV1(yc_api_key, yc_folder_id)
-    unInstance = Un("/data/audio_workdir", synth, db_conn)
+    unInstance = Un("/data/audio_workdir", synth, db_conn, make_s3_client(S3_ENDPOINT_URL))
     logging.info("Un app initialized")
 
 
@@ -459,6 +589,10 @@ def get_sound():
         logging.error("Invalid request: form length %d", len(form))
         return jsonify({"message": "Invalid request"}), 400
 
+    if request.args.get("async") == "1":
+        url, job, status_code = unInstance.submit_audio_url(verb, fe, form)
+        return audio_job_response(url, job, status_code)
+
     url, status_code = unInstance.generate_audio_url(verb, fe, form)
     if not url:
         logging.error("Failed to generate audio")
@@ -493,8 +627,64 @@ def sentence_tts():
         return jsonify({"message": error_message}), 422
 
     lowered = s.strip().lower()
+    if request.args.get("async") == "1":
+        url, job, status_code = unInstance.submit_sentence_audio_url(lowered, voice_id)
+        return audio_job_response(url, job, status_code)
+
     url, status_code = unInstance.generate_sentence_audio_url(lowered, voice_id)
     if not url:
         logging.error("Failed to generate audio")
         return jsonify({"message": "Invalid request"}), status_code
     return redirect(url, code=302)
+
+
+def pending_job_response(job):
+    status_url = f"/unapi/v1/tts_job?id={job.job_id}"
+    response = jsonify({"message": "pending", "job_id": job.job_id, "status_url": status_url})
+    response.status_code = 202
+    response.headers["Location"] = status_url
+    response.headers["Retry-After"] = "1"
+    return response
+
+
+# Async mode: redirects to existing audio, or answers 202 with a job to poll
+def audio_job_response(url, job, status_code):
+    if url:
+        return redirect(url, code=302)
+    if job:
+        return pending_job_response(job)
+    logging.error("Failed to submit audio generation: %d", status_code)
+    return jsonify({"message": "Invalid request"}), status_code
+
+
+@app.route("/unapi/v1/tts_job", methods=["GET"])
+def get_tts_job():
+    global unInstance
+
+    job_id = request.args.get("id")
+    if not job_id:
+        return jsonify({"message": "Invalid request"}), 400
+    job = unInstance.jobs.get(job_id)
+    if job is None:
+        return jsonify({"message": "Unknown job"}), 404
+    if job.status == JobStatus.PENDING:
+        return pending_job_response(job)
+    if job.status == JobStatus.FAILED:
+        return jsonify({"message": "Internal error"}), 500
+    url, status_code = job.result
+    if not url:
+        logging.error("Job %s failed to generate audio", job_id)
+        return jsonify({"message": "Invalid request"}), status_code
+    return redirect(url, code=302)
+
+
+# Routes under /uninternal are reachable only inside the cluster, the ingress forwards /unapi alone
+@app.route("/uninternal/v1/get_cache_stats", methods=["GET"])
+def get_cache_stats():
+    global unInstance
+
+    stats = {
+        "verbs": len(unInstance.verbs.verbs),
+        "audio_names": unInstance.audio_names.stats(),
+    }
+    return jsonify({"message": "ok", "stats": stats}), 200
@@ -0,0 +1,74 @@
+"""
+Generates audio for verb forms before users ask for them.
+
+Usage, from the un directory:
+
+python3 -m scripts.pregenerate_audio \
+  --db /data/un.db \
+  --forms ../data/detector_forms.csv \
+  --workers 4 \
+  --per-minute 60
+
+In the cluster the image carries the script, pass the forms on stdin since the file is not in the pod:
+
+kubectl exec -i deploy/kazakhverb-un -- python3 -m scripts.pregenerate_audio \
+  --db /data/un.db \
+  --forms - \
+  --workers 4 \
+  --per-minute 60 < ../data/detector_forms.csv
+
+Forms are taken from `bulk_generate.js detector_forms` output. Forms that already have audio are skipped,
+so an interrupted run continues where it stopped when started again with the same arguments.
+"""
+
+import argparse
+import contextlib
+import logging
+import sys
+
+from lib.pregenerate import Pregenerator, RateBudget, parse_forms_line
+from lib.unapp import DATABASE_PATH, S3_ENDPOINT_URL, SynthYskV1, Un, init_db_conn, make_s3_client, read_token
+
+
+def open_forms(forms_path):
+    if forms_path == "-":
+        return contextlib.nullcontext(sys.stdin)
+    return open(forms_path)
+
+
+def read_form_rows(input_file):
+    for line in input_file:
+        for row in parse_forms_line(line):
+            yield row
+
+
+def main():
+    LOG_FORMAT = "%(asctime)s %(threadName)s %(message)s"
+    logging.basicConfig(format=LOG_FORMAT, level=logging.INFO, force=True)
+    parser = argparse.ArgumentParser(description="Pre-generate audio for verb forms")
+    parser.add_argument("--db", default=DATABASE_PATH, help="Path to un database")
+    parser.add_argument("--forms", required=True, help="Path to forms from bulk_generate.js detector_forms, - for stdin")
+    parser.add_argument("--workers", type=int, default=4, help="Forms synthesized and uploaded at a time")
+    parser.add_argument("--per-minute", type=float, default=60.0, help="Synthesis requests per minute")
+    parser.add_argument("--batch-size", type=int, default=100, help="Rows per insert into Audio")
+    parser.add_argument("--limit", type=int, default=None, help="Generate at most this many forms")
+    parser.add_argument("--api-key", default="/etc/secret-volume/.yc.apikey", help="Path to Yandex Cloud API key")
+    parser.add_argument("--folder-id", default="/etc/secret-volume/.yc.folderid", help="Path to Yandex Cloud folder ID")
+    parser.add_argument("--dry-run", action="store_true", help="Only count forms that would be generated")
+    args = parser.parse_args()
+
+    db_conn = init_db_conn(args.db)
+    budget = RateBudget(args.per_minute)
+    with open_forms(args.forms) as input_file:
+        form_rows = read_form_rows(input_file)
+        if args.dry_run:
+            Pregenerator(None, db_conn, args.workers, budget, args.batch_size).dry_run(form_rows, args.limit)
+            return
+
+        synth = SynthYskV1(read_token(args.api_key), read_token(args.folder_id))
+        un = Un(None, synth, db_conn, make_s3_client(S3_ENDPOINT_URL))
+        Pregenerator(un, db_conn, args.workers, budget, args.batch_size).run(form_rows, args.limit)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+from lib.cache import AudioNameCache
+from lib.chunk_reader import ChunkReader
+from lib.jobs import JobQueue, JobStatus
+import lib.jobs as jobs
+from lib.pregenerate import Pregenerator, RateBudget, parse_forms_line
+import lib.pregenerate as pregenerate
+from lib.single_flight import SingleFlight
+from lib.unapp import SynthYskV1, Un, init_db_conn
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
+
+
+class FakeS3(object):
+    """
+    Reads file objects like s3transfer does for streams: one part of `part_size` bytes at a time,
+    a full first part means a multipart upload.
+    """
+
+    def __init__(self, part_size):
+        self.part_size = part_size
+        # (bucket, key) -> list of parts
+        self.objects = dict()
+
+    def upload_fileobj(self, fileobj, bucket, key):
+        parts = []
+        while True:
+            part = fileobj.read(self.part_size)
+            if not part:
+                break
+            parts.append(part)
+        self.objects[(bucket, key)] = parts
+
+
+class ChunkReaderTestCase(unittest.TestCase):
+    def test_parts_span_chunks(self):
+        chunks = [bytes([i]) * 1000 for i in range(10)]
+        reader = ChunkReader(chunks)
+        s3 = FakeS3(4096)
+        s3.upload_fileobj(reader, "bucket", "a.mp3")
+        parts = s3.objects[("bucket", "a.mp3")]
+        self.assertEqual([len(part) for part in parts], [4096, 4096, 1808])
+        self.assertEqual(b"".join(parts), b"".join(chunks))
+        self.assertEqual(reader.total, 10000)
+
+    def test_empty_chunks_and_readall(self):
+        chunks = [b"", b"ab", b"", b"", b"cde", b""]
+        self.assertEqual(ChunkReader(chunks).read(), b"abcde")
+        self.assertEqual(ChunkReader([]).read(4), b"")
+
+
+class FakeSynth(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.texts = []
+
+    def stream_audio(self, soft, text):
+        with self.lock:
+            self.texts.append(text)
+        return [f"{int(soft)}:".encode(), text.encode()]
+
+
+class FakeUn(object):
+    """
+    The parts of Un used by Pregenerator, over a fake synth and a fake S3 client.
+    """
+
+    def __init__(self):
+        self.synth = FakeSynth()
+        self.s3 = FakeS3(4096)
+        self.lock = threading.Lock()
+        self.names = 0
+
+    def make_audio_name(self, verb, fe, text):
+        with self.lock:
+            self.names += 1
+            return f"{verb}{int(fe)}{text}_{self.names}"
+
+    def upload_audio_stream_to_s3(self, chunks, audio_name):
+        self.s3.upload_fileobj(ChunkReader(chunks), "verbforms", f"{audio_name}.mp3")
+
+
+# Lines as printed by `bulk_generate.js detector_forms`
+FORMS_LINES = [
+    "бару:false\tбарамын:0:presentTransitive:First:Singular\tбарасың:0:presentTransitive:Second:Singular\n",
+    "келу:false\tкеламін:0:presentTransitive:First:Singular\tкеласің:0:presentTransitive:Second:Singular\n",
+    "бару:true\tбарамын:0:presentTransitive:First:Singular\n",
+    "білу:false\tбіламін:0:presentTransitive:First:Singular\n",
+    "келу:false\tкеламін:1:presentTransitive:First:Singular\tкелдім:0:past:First:Singular\n",
+]
+
+
+class PregeneratorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, "un.db")
+        self.db_conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.db_conn.execute("""
+CREATE TABLE Verbs (
+    id INTEGER PRIMARY KEY,
+    verb TEXT NOT NULL,
+    fe BOOLEAN NOT NULL,
+    soft BOOLEAN NOT NULL
+);
+        """.strip())
+        self.db_conn.execute("""
+CREATE TABLE Audio (
+    verb_id INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    audio TEXT NOT NULL,
+    created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (verb_id, text)
+);
+        """.strip())
+        self.db_conn.executemany("INSERT INTO Verbs (id, verb, fe, soft) VALUES (?, ?, ?, ?)", [
+            (1, "бару", 0, 0),
+            (2, "бару", 1, 0),
+            (3, "келу", 0, 1),
+        ])
+        self.db_conn.execute("INSERT INTO Audio (verb_id, text, audio) VALUES (1, 'барамын', 'existing')")
+        self.db_conn.commit()
+        self.un = FakeUn()
+
+    def tearDown(self):
+        self.db_conn.close()
+        self.temp_dir.cleanup()
+
+    def make_pregenerator(self, batch_size=2):
+        return Pregenerator(self.un, self.db_conn, 2, RateBudget(600000), batch_size)
+
+    def form_rows(self):
+        for line in FORMS_LINES:
+            for row in parse_forms_line(line):
+                yield row
+
+    def audio_rows(self):
+        return {
+            (row[0], row[1]): row[2]
+            for row in self.db_conn.execute("SELECT verb_id, text, audio FROM Audio")
+        }
+
+    def uploaded_names(self):
+        return sorted(key[:-len(".mp3")] for _, key in self.un.s3.objects)
+
+    def test_parse_forms_line(self):
+        self.assertEqual(parse_forms_line(FORMS_LINES[0]), [
+            ("бару", False, "барамын"),
+            ("бару", False, "барасың"),
+        ])
+        self.assertEqual(parse_forms_line(FORMS_LINES[2]), [("бару", True, "барамын")])
+        self.assertEqual(parse_forms_line("бару:1\tбарамын:0:presentTransitive:First:Singular"), [("бару", True, "барамын")])
+        self.assertEqual(parse_forms_line("бару:yes\tбарамын:0:presentTransitive:First:Singular"), [])
+        self.assertEqual(parse_forms_line("бару\tбарамын:0:presentTransitive:First:Singular"), [])
+        self.assertEqual(parse_forms_line("бару:false\n"), [])
+
+    def test_skips_existing_and_unknown(self):
+        pregenerator = self.make_pregenerator()
+        pregenerator.run(self.form_rows())
+        self.assertEqual(sorted(self.un.synth.texts), sorted(["барасың", "барамын", "келамін", "келасің", "келдім"]))
+        self.assertEqual((pregenerator.generated, pregenerator.failed), (5, 0))
+        # барамын of verb 1 and the repeated келамін
+        self.assertEqual(pregenerator.skipped, 2)
+        # білу
+        self.assertEqual(pregenerator.unknown, 1)
+        rows = self.audio_rows()
+        self.assertEqual(sorted(rows), [
+            (1, "барамын"), (1, "барасың"), (2, "барамын"), (3, "келамін"), (3, "келасің"), (3, "келдім"),
+        ])
+        self.assertEqual(rows[(1, "барамын")], "existing")
+        self.assertEqual(sorted(audio for audio in rows.values() if audio != "existing"), self.uploaded_names())
+        self.assertEqual(self.un.s3.objects[("verbforms", f"{rows[(3, 'келдім')]}.mp3")], ["1:келдім".encode()])
+
+    def test_resume_after_partial_run(self):
+        first = self.make_pregenerator()
+        first.run(self.form_rows(), limit=2)
+        self.assertEqual(first.generated, 2)
+        self.assertEqual(len(self.audio_rows()), 3)
+        second = self.make_pregenerator()
+        second.run(self.form_rows())
+        self.assertEqual(second.generated, 3)
+        # Nothing is synthesized twice
+        self.assertEqual(sorted(self.un.synth.texts), sorted(["барасың", "барамын", "келамін", "келасің", "келдім"]))
+        self.assertEqual(len(self.audio_rows()), 6)
+        self.assertEqual(self.make_pregenerator().dry_run(self.form_rows()), 0)
+
+    def test_row_of_server_wins(self):
+        pregenerator = self.make_pregenerator()
+        # The server generates a form after the run has loaded the existing ones
+        server_conn = sqlite3.connect(self.db_path)
+        server_conn.execute("INSERT INTO Audio (verb_id, text, audio) VALUES (3, 'келдім', 'server')")
+        server_conn.commit()
+        server_conn.close()
+        pregenerator.run(self.form_rows())
+        rows = self.audio_rows()
+        self.assertEqual(rows[(3, "келдім")], "server")
+        self.assertEqual(len(rows), 6)
+
+    def test_flush_retries_locked_database(self):
+        pregenerator = self.make_pregenerator()
+        pregenerator.batch = [(3, "келдім", "uploaded")]
+        locker = sqlite3.connect(self.db_path)
+        locker.execute("BEGIN IMMEDIATE;")
+        sleeps = []
+
+        # The server finishes its transaction while the run waits to retry
+        def sleep(secs):
+            sleeps.append(secs)
+            locker.commit()
+
+        self.db_conn.execute("PRAGMA busy_timeout = 10;")
+        with unittest.mock.patch.object(pregenerate.time, "sleep", sleep):
+            pregenerator.flush()
+        locker.close()
+        self.assertEqual(sleeps, [pregenerate.FLUSH_RETRY_SECS])
+        self.assertEqual(pregenerator.batch, [])
+        self.assertEqual(self.audio_rows()[(3, "келдім")], "uploaded")
+
+
+class JobQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.queue = JobQueue(2, 2, 60)
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.queue.executor.shutdown(wait=True)
+
+    def blocked(self):
+        self.release.wait(5)
+        return "blocked"
+
+    def wait_finished(self, job):
+        deadline = time.monotonic() + 5
+        while job.status == JobStatus.PENDING and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.assertNotEqual(job.status, JobStatus.PENDING)
+
+    def test_dedup_and_full_queue(self):
+        job = self.queue.submit("a", self.blocked)
+        self.assertIs(self.queue.submit("a", self.blocked), job)
+        self.assertIsNotNone(self.queue.submit("b", self.blocked))
+        # The route answers 503 for None
+        self.assertIsNone(self.queue.submit("c", self.blocked))
+        self.release.set()
+        self.wait_finished(job)
+        self.assertEqual(job.result, "blocked")
+        # Finished jobs neither count as pending nor are shared
+        other = self.queue.submit("a", lambda: "again")
+        self.assertIsNot(other, job)
+
+    def test_failed_job(self):
+        def fail():
+            raise ValueError("synthesis failed")
+
+        job = self.queue.submit("a", fail)
+        self.wait_finished(job)
+        self.assertEqual(job.status, JobStatus.FAILED)
+        self.assertIsNone(job.result)
+
+    def test_expiry_behind_stuck_job(self):
+        stuck = self.queue.submit("stuck", self.blocked)
+        done = self.queue.submit("done", lambda: "done")
+        self.wait_finished(done)
+        self.assertIs(self.queue.get(done.job_id), done)
+        with unittest.mock.patch.object(jobs.time, "time", lambda: done.finished_at + 61):
+            self.assertIsNone(self.queue.get(done.job_id))
+            self.assertIs(self.queue.get(stuck.job_id), stuck)
+
+
+class SingleFlightTestCase(unittest.TestCase):
+    CALLERS = 8
+
+    # Calls `sf.do(key, func)` from CALLERS threads, the function runs until all of them wait for it.
+    # Returns (number of calls of func, results and exceptions of the callers).
+    def run_callers(self, func):
+        sf = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def blocking():
+            calls.append(threading.current_thread().name)
+            release.wait(5)
+            return func()
+
+        outcomes = []
+        outcomes_lock = threading.Lock()
+
+        def caller():
+            try:
+                outcome = ("result", sf.do("key", blocking))
+            except Exception as e:
+                outcome = ("error", e)
+            with outcomes_lock:
+                outcomes.append(outcome)
+
+        threads = [threading.Thread(target=caller) for _ in range(self.CALLERS)]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            with sf.lock:
+                flight = sf.flights.get("key")
+                if flight is not None and flight.waiters == self.CALLERS - 1:
+                    break
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(sf.flights, dict())
+        return len(calls), outcomes
+
+    def test_shared_result(self):
+        result = object()
+        calls, outcomes = self.run_callers(lambda: result)
+        self.assertEqual(calls, 1)
+        self.assertEqual(len(outcomes), self.CALLERS)
+        for kind, value in outcomes:
+            self.assertEqual(kind, "result")
+            self.assertIs(value, result)
+
+    def test_shared_exception(self):
+        error = ValueError("synthesis failed")
+
+        def fail():
+            raise error
+
+        calls, outcomes = self.run_callers(fail)
+        self.assertEqual(calls, 1)
+        self.assertEqual(len(outcomes), self.CALLERS)
+        for kind, value in outcomes:
+            self.assertEqual(kind, "error")
+            self.assertIs(value, error)
+
+    def test_nothing_remembered(self):
+        sf = SingleFlight()
+        self.assertEqual(sf.do("key", lambda: 1), 1)
+        self.assertEqual(sf.do("key", lambda: 2), 2)
+
+
+class AudioNameCacheTestCase(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = AudioNameCache(2)
+        cache.put("a", "audio_a")
+        cache.put("b", "audio_b")
+        cache.put("c", "audio_c")
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), "audio_b")
+        self.assertEqual(cache.get("c"), "audio_c")
+
+    def test_get_refreshes_recency(self):
+        cache = AudioNameCache(2)
+        cache.put("a", "audio_a")
+        cache.put("b", "audio_b")
+        self.assertEqual(cache.get("a"), "audio_a")
+        cache.put("c", "audio_c")
+        self.assertEqual(cache.get("a"), "audio_a")
+        self.assertIsNone(cache.get("b"))
+
+    def test_stats(self):
+        cache = AudioNameCache(1)
+        cache.put("a", "audio_a")
+        cache.get("a")
+        cache.get("b")
+        cache.put("b", "audio_b")
+        self.assertEqual(cache.stats(), {"entries": 1, "hits": 1, "misses": 1, "evictions": 1})
+
+
+class UnCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_conn = init_db_conn(os.path.join(self.temp_dir.name, "un.db"))
+        self.db_conn.execute("INSERT INTO Verbs (id, verb, fe, soft) VALUES (1, 'бару', 0, 0)")
+        self.db_conn.commit()
+        self.un = Un(self.temp_dir.name, SynthYskV1("key", "folder"), self.db_conn, None)
+
+    def tearDown(self):
+        self.un.jobs.executor.shutdown(wait=True)
+        self.db_conn.close()
+        self.temp_dir.cleanup()
+
+    def test_verb_loaded_on_start(self):
+        self.assertEqual(tuple(self.un.check_verb_and_get_soft("бару", False)), (1, 0))
+
+    def test_verb_added_later_falls_back_to_db(self):
+        self.db_conn.execute("INSERT INTO Verbs (id, verb, fe, soft) VALUES (2, 'келу', 0, 1)")
+        self.db_conn.commit()
+        self.assertIsNone(self.un.verbs.get("келу", False))
+        self.assertEqual(tuple(self.un.check_verb_and_get_soft("келу", False)), (2, 1))
+        self.assertEqual(self.un.verbs.get("келу", False), (2, 1))
+
+        self.db_conn.execute("DELETE FROM Verbs WHERE id = 2")
+        self.db_conn.commit()
+        self.assertEqual(tuple(self.un.check_verb_and_get_soft("келу", False)), (2, 1))
+
+    def test_unknown_verb(self):
+        self.assertEqual(self.un.check_verb_and_get_soft("жоқ", False), (None, None))
+
+    def test_stored_audio_is_cached(self):
+        self.un.store_text_audio_to_db(1, "барамын", "baru0baramyn_abcdef")
+        self.db_conn.execute("DELETE FROM Audio")
+        self.db_conn.commit()
+        self.assertEqual(self.un.check_text_audio(1, "барамын"), "baru0baramyn_abcdef")
+        stats = self.un.audio_names.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 0))
+
+    def test_audio_found_in_db_is_cached(self):
+        self.db_conn.execute("INSERT INTO Audio (verb_id, text, audio) VALUES (1, 'барамын', 'existing')")
+        self.db_conn.commit()
+        self.assertEqual(self.un.check_text_audio(1, "барамын"), "existing")
+        self.assertEqual(self.un.check_text_audio(1, "барамын"), "existing")
+        self.assertIsNone(self.un.check_text_audio(1, "барасың"))
+        stats = self.un.audio_names.stats()
+        self.assertEqual((stats["entries"], stats["hits"], stats["misses"]), (1, 1, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()